@@ -2,20 +2,30 @@
 """
 Demo script showing how to use the enhanced push_and_deploy.py
 to set up this repository as the main deployment target
+
+The demos call push_and_deploy.run_cli() in this process instead of starting
+`python3 scripts/push_and_deploy.py` for each one, so the interpreter and the
+module are loaded once.
 """
 
-import subprocess
+import shlex
 import sys
 from pathlib import Path
 
+SCRIPTS_DIR = Path(__file__).resolve().parent / "scripts"
+
+
 def run_command(cmd, description):
-    """Run a command and display the result"""
+    """Run a push_and_deploy.py command line in-process and display the result"""
     print(f"\n🔧 {description}")
-    print(f"Command: {' '.join(cmd)}")
+    print(f"Command: {shlex.join(cmd)}")
     print("-" * 50)
-    
+
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, cwd=Path(__file__).parent)
+        from push_and_deploy import run_cli
+
+        # cmd is the equivalent shell command; run_cli only takes the arguments
+        result = run_cli(cmd[2:])
         if result.stdout:
             print("STDOUT:")
             print(result.stdout)
@@ -45,6 +55,7 @@ def main():
         return 1
     
     print("✅ Enhanced deploy script found!")
+    sys.path.insert(0, str(SCRIPTS_DIR))
     
     # Demo 1: List repository information
     print("\n📋 Demo 1: Repository Information")
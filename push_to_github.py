@@ -3,12 +3,43 @@
 """
 Enhanced script to push your project to GitHub
 Target repository: dagz55/zignal-login.git
+
+Staging policy: instead of `git add .`, the changes from one porcelain scan are
+checked before staging. Deny globs (dump.rdb, *.log, uploads/, playwright-report/,
+...) and binary files outside the asset allow-list are held back; files above
+--max-file-mb are refused, skipped or routed to Git LFS (--oversize). Defaults can
+be replaced by a push-policy.json at the repository root, e.g.
+  {"max_file_mb": 25, "deny": ["*.log", "uploads/"], "oversize": "skip"}
+A pack-size estimate is printed before pushing.
+
+Pushing: git's --progress output is streamed while the push runs (objects, bytes,
+transfer rate) and summarized afterwards. When the objects not yet on origin exceed
+--batch-mb, the history is pushed in commit batches so a large first push does not
+run into HTTP body-size limits.
+
+Rejected pushes: with --on-reject integrate (the default when stdin is not a
+terminal) a non-fast-forward is resolved without prompting: fetch, rebase
+(--rebase) or merge onto the remote branch, push again, with jittered backoff,
+at most --max-attempts times within --integrate-timeout seconds. Conflicts abort
+the rebase/merge and fail the run. --force-with-lease pushes with a lease on the
+remote commit that was just fetched, so a concurrent pusher makes the push fail
+and retry instead of being overwritten.
 """
 
+import fnmatch
+import json
+import re
+import shlex
+import shutil
 import subprocess
 import sys
 import os
-from typing import Tuple, Optional
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Tuple, Optional
 
 # --- Configuration ---
 # Allow overriding via environment variables
@@ -16,6 +47,28 @@ REPO_URL = os.environ.get("GIT_REPO_URL", "https://github.com/dagz55/zignal-logi
 DEFAULT_BRANCH = os.environ.get("GIT_DEFAULT_BRANCH", "main")
 DEFAULT_COMMIT_MESSAGE = "Update project files"
 
+# --- Staging Policy Defaults ---
+POLICY_FILE = "push-policy.json"  # optional, at the repository root
+DEFAULT_MAX_FILE_MB = 10.0
+# Runtime dumps, logs and generated artifacts that `git add .` would otherwise sweep in
+DEFAULT_DENY_GLOBS = [
+    "dump.rdb", "*.rdb", "*.log", "*.sqlite3-journal",
+    "uploads/", "playwright-report/", "test-results/", "coverage/",
+    "node_modules/", ".next/", ".vercel/output/",
+]
+# Binary files are only staged when they match one of these (site assets, fonts, docs)
+DEFAULT_BINARY_ALLOW = [
+    "public/", "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.ico", "*.svg",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.pdf",
+]
+OVERSIZE_ACTIONS = ("refuse", "skip", "lfs")
+PACK_WARN_MB = 50.0
+DEFAULT_BATCH_MB = 100.0  # pending history above this is pushed in commit batches
+REJECT_ACTIONS = ("ask", "integrate", "fail")
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_INTEGRATE_SECS = 120.0
+BINARY_SNIFF_BYTES = 8000  # same heuristic as git: a NUL byte in the first 8000 bytes
+
 # --- Color Codes for Output ---
 class Colors:
     """ANSI color codes for terminal output"""
@@ -33,56 +86,363 @@ def c_print(color: str, message: str):
     """Prints a message in a specified color."""
     print(f"{color}{message}{Colors.ENDC}")
 
+# --- Repository State ---
+@dataclass
+class FileChange:
+    """One entry of the porcelain scan."""
+    path: str
+    xy: str  # index/worktree status letters, '.' = unchanged ('??' for untracked)
+    submodule: bool = False
+
+    @property
+    def untracked(self) -> bool:
+        return self.xy == "??"
+
+    @property
+    def staged(self) -> bool:
+        return not self.untracked and self.xy[0] != "."
+
+    @property
+    def deleted(self) -> bool:
+        return "D" in self.xy
+
+
+@dataclass
+class RepoState:
+    """Snapshot of the repository taken by a single `git status --porcelain=v2 --branch` call."""
+    is_repo: bool = False
+    branch: Optional[str] = None  # None when HEAD is detached
+    head: Optional[str] = None  # None before the first commit
+    upstream: Optional[str] = None
+    ahead: int = 0
+    behind: int = 0
+    staged: int = 0
+    unstaged: int = 0
+    untracked: int = 0
+    conflicted: int = 0
+    remote_url: Optional[str] = None
+    changes: List[FileChange] = field(default_factory=list)
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self.staged or self.unstaged or self.untracked or self.conflicted)
+
+    @classmethod
+    def parse(cls, porcelain: str) -> "RepoState":
+        """Parses NUL-separated `git status --porcelain=v2 --branch -z` output."""
+        state = cls(is_repo=True)
+        records = iter(porcelain.split("\0"))
+        for record in records:
+            if record.startswith("# branch.oid "):
+                oid = record[len("# branch.oid "):]
+                state.head = None if oid == "(initial)" else oid
+            elif record.startswith("# branch.head "):
+                head = record[len("# branch.head "):]
+                state.branch = None if head == "(detached)" else head
+            elif record.startswith("# branch.upstream "):
+                state.upstream = record[len("# branch.upstream "):]
+            elif record.startswith("# branch.ab "):
+                ahead, behind = record[len("# branch.ab "):].split()
+                state.ahead, state.behind = int(ahead), -int(behind)
+            elif record.startswith(("1 ", "2 ")):
+                # "1 XY sub mH mI mW hH hI path" / "2 XY sub mH mI mW hH hI Xscore path"
+                fields = record.split(" ", 8 if record[0] == "1" else 9)
+                xy = fields[1]
+                state.staged += xy[0] != "."
+                state.unstaged += xy[1] != "."
+                state.changes.append(FileChange(fields[-1], xy, submodule=fields[2] != "N..."))
+                if record.startswith("2 "):
+                    next(records, None)  # renames/copies carry the original path as an extra record
+            elif record.startswith("u "):
+                state.conflicted += 1
+            elif record.startswith("? "):
+                state.untracked += 1
+                state.changes.append(FileChange(record[2:], "??"))
+        return state
+
+    def summary(self) -> str:
+        if not self.is_repo:
+            return "Not a Git repository yet."
+        branch = self.branch or "(detached HEAD)"
+        lines = [f"On branch {branch}" + ("" if self.head else " (no commits yet)")]
+        if self.upstream:
+            lines.append(f"Tracking {self.upstream}: {self.ahead} ahead, {self.behind} behind")
+        if self.dirty:
+            lines.append(f"Changes: {self.staged} staged, {self.unstaged} unstaged, "
+                         f"{self.untracked} untracked, {self.conflicted} conflicted")
+        else:
+            lines.append("Working tree clean")
+        return "\n".join(lines)
+
+
+# --- Staging Policy ---
+def _fmt_size(num_bytes: float) -> str:
+    for unit in ("B", "KB", "MB"):
+        if num_bytes < 1024:
+            return f"{num_bytes:.1f} {unit}" if unit != "B" else f"{int(num_bytes)} B"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} GB"
+
+
+def glob_match(path: str, pattern: str) -> bool:
+    """gitignore-style match: 'dir/' matches a directory at any depth, a bare
+    pattern matches the file name, a pattern with a slash the whole path."""
+    if pattern.endswith("/"):
+        return path.startswith(pattern) or f"/{pattern}" in f"/{path}"
+    if "/" in pattern:
+        return fnmatch.fnmatch(path, pattern)
+    return fnmatch.fnmatch(path.rsplit("/", 1)[-1], pattern)
+
+
+def is_binary(path: Path) -> bool:
+    try:
+        with open(path, "rb") as f:
+            return b"\0" in f.read(BINARY_SNIFF_BYTES)
+    except OSError:
+        return False
+
+
+@dataclass
+class StagingPlan:
+    """What the policy decided for each candidate change."""
+    stage: List[FileChange] = field(default_factory=list)
+    lfs: List[FileChange] = field(default_factory=list)  # oversized, routed to Git LFS
+    held: List[Tuple[FileChange, str]] = field(default_factory=list)  # not staged, with the reason
+    oversized: List[Tuple[FileChange, int]] = field(default_factory=list)
+    stage_bytes: int = 0
+
+
+@dataclass
+class StagingPolicy:
+    """Decides which changed files `add_files` may stage.
+
+    Files matching a deny glob, and binary files not matching a binary-allow
+    glob, are held back. Files above `max_file_mb` are refused (the run stops
+    before anything is staged), skipped, or routed to Git LFS.
+    """
+    max_file_mb: float = DEFAULT_MAX_FILE_MB
+    deny: List[str] = field(default_factory=lambda: list(DEFAULT_DENY_GLOBS))
+    binary_allow: List[str] = field(default_factory=lambda: list(DEFAULT_BINARY_ALLOW))
+    oversize: str = "refuse"
+
+    @classmethod
+    def load(cls, path: Path) -> "StagingPolicy":
+        """Reads a JSON policy file; its keys replace the defaults."""
+        data = json.loads(path.read_text(encoding="utf-8"))
+        known = {k: v for k, v in data.items() if k in cls.__dataclass_fields__}
+        policy = cls(**known)
+        if policy.oversize not in OVERSIZE_ACTIONS:
+            raise ValueError(f"oversize must be one of {', '.join(OVERSIZE_ACTIONS)}, not {policy.oversize!r}")
+        return policy
+
+    def evaluate(self, changes: List[FileChange], root: Path) -> StagingPlan:
+        plan = StagingPlan()
+        limit = self.max_file_mb * 1024 * 1024
+        for change in changes:
+            if change.deleted or change.submodule:
+                plan.stage.append(change)
+                continue
+            denied = next((p for p in self.deny if glob_match(change.path, p)), None)
+            if denied:
+                plan.held.append((change, f"denied by '{denied}'"))
+                continue
+            path = root / change.path
+            try:
+                size = path.lstat().st_size
+            except OSError:
+                size = 0
+            if size > limit:
+                plan.oversized.append((change, size))
+                if self.oversize == "lfs":
+                    plan.lfs.append(change)
+                else:
+                    plan.held.append((change, f"{_fmt_size(size)} exceeds the {self.max_file_mb:g} MB limit"))
+                continue
+            if not path.is_symlink() and is_binary(path) and not any(glob_match(change.path, p) for p in self.binary_allow):
+                plan.held.append((change, "binary file"))
+                continue
+            plan.stage.append(change)
+            plan.stage_bytes += size
+        return plan
+
+
+# --- Push Progress ---
+# A `git push --progress` meter line: "Writing objects:  45% (450/1000), 12.00 MiB | 3.00 MiB/s"
+PROGRESS_LINE = re.compile(
+    r"^(?P<phase>[A-Z][a-z]+(?: [a-z]+)*):\s+(?P<pct>\d+)% \((?P<done>\d+)/(?P<total>\d+)\)"
+    r"(?:, (?P<size>[\d.]+) (?P<unit>bytes|KiB|MiB|GiB)(?: \| (?P<rate>[\d.]+) (?P<rate_unit>bytes|KiB|MiB|GiB)/s)?)?"
+)
+SIZE_UNITS = {"bytes": 1, "KiB": 1024, "MiB": 1024 ** 2, "GiB": 1024 ** 3}
+
+
+class PushProgress:
+    """Reads git's progress stream as it arrives and shows it live.
+
+    On a terminal the meter is redrawn in place; otherwise (CI logs) a line is
+    printed when a phase completes and every few seconds while writing objects.
+    """
+    PRINT_EVERY_SECS = 2.0
+
+    def __init__(self, label: str):
+        self.label = label
+        self.objects = 0
+        self.bytes = 0
+        self.peak_rate = 0.0
+        self.started = time.monotonic()
+        self.elapsed = 0.0
+        self._tty = sys.stdout.isatty()
+        self._printed_at = 0.0
+        self._finished: set = set()
+
+    def consume(self, stream) -> str:
+        """Reads the binary stream until EOF; returns its lines other than progress meters."""
+        kept: List[str] = []
+        pending = ""
+        while True:
+            data = stream.read1(8192)
+            parts = re.split(r"[\r\n]", pending + data.decode("utf-8", "replace"))
+            pending = parts.pop() if data else ""
+            for line in parts + ([pending] if not data else []):
+                if not self.feed(line) and line.strip():
+                    kept.append(line.rstrip())
+            if not data:
+                break
+        if self._tty and self._printed_at:
+            print()
+        self.elapsed = time.monotonic() - self.started
+        return "\n".join(kept)
+
+    def feed(self, line: str) -> bool:
+        """Handles one line; False when it is not part of git's progress output."""
+        if line.startswith(("Enumerating objects:", "Total ")):
+            return True
+        match = PROGRESS_LINE.match(line.strip())
+        if not match:
+            return False
+        phase, pct = match["phase"], match["pct"]
+        if phase == "Writing objects":
+            self.objects = int(match["done"])
+            if match["size"]:
+                self.bytes = int(float(match["size"]) * SIZE_UNITS[match["unit"]])
+            if match["rate"]:
+                self.peak_rate = max(self.peak_rate, float(match["rate"]) * SIZE_UNITS[match["rate_unit"]])
+        text = f"  {self.label}: {line.strip()}"
+        now = time.monotonic()
+        if self._tty:
+            print(f"\r{text[:120]:<120}", end="", flush=True)
+            self._printed_at = now
+            return True
+        if pct == "100":
+            if phase in self._finished:
+                return True  # git redraws the final meter with ", done."
+            self._finished.add(phase)
+        elif phase != "Writing objects" or now - self._printed_at < self.PRINT_EVERY_SECS:
+            return True
+        print(text, flush=True)
+        self._printed_at = now
+        return True
+
+    def summary(self) -> str:
+        text = f"Sent {self.objects} objects, {_fmt_size(self.bytes)} in {self.elapsed:.1f}s"
+        if self.bytes and self.elapsed:
+            text += f" ({_fmt_size(self.bytes / self.elapsed)}/s"
+            text += f", peak {_fmt_size(self.peak_rate)}/s)" if self.peak_rate else ")"
+        return text
+
+
 # --- Git Operations Class ---
 class GitPusher:
     """Handles all Git-related operations for pushing the project."""
 
-    def __init__(self, repo_url: str, default_branch: str, dry_run: bool = False, use_rebase: bool = False):
+    def __init__(self, repo_url: str, default_branch: str, dry_run: bool = False, use_rebase: bool = False,
+                 policy: Optional[StagingPolicy] = None, batch_mb: float = DEFAULT_BATCH_MB,
+                 on_reject: str = "ask", max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 integrate_secs: float = DEFAULT_INTEGRATE_SECS, force_with_lease: bool = False):
         self.repo_url = repo_url
         self.default_branch = default_branch
-        self.dry_run = dry_run  # Initialize dry_run first
+        self.dry_run = dry_run
         self.use_rebase = use_rebase
-        self.current_branch = self._get_current_branch() or default_branch # Now this call will work
+        self.policy = policy  # None = stage everything (`git add .`)
+        self.batch_mb = batch_mb  # 0 = always push in one go
+        self.on_reject = on_reject  # what a non-fast-forward does: ask, integrate or fail
+        self.max_attempts = max_attempts  # integrate-and-push rounds
+        self.integrate_secs = integrate_secs  # time budget for all rounds
+        self.force_with_lease = force_with_lease
+        self.command_count = 0  # git processes actually spawned
+        self._state: Optional[RepoState] = None
+        self._staging_done = False
+
+    def _run_command(self, args: List[str], capture_output: bool = True, check_error: bool = True,
+                     read_only: bool = False, input: Optional[str] = None, strip: bool = True,
+                     progress: Optional[PushProgress] = None) -> Tuple[int, str, str]:
+        """Runs a command (argv list, no shell) and returns its exit code, stdout, and stderr.
 
-    def _run_command(self, command: str, capture_output: bool = True, check_error: bool = True) -> Tuple[int, str, str]:
-        """Runs a shell command and returns its exit code, stdout, and stderr."""
-        c_print(Colors.OKCYAN, f"Executing: {command}")
-        if self.dry_run and not command.startswith("git status") and not command.startswith("git diff"):
+        In dry-run mode only read-only commands are executed. With `progress`, stderr
+        is streamed through it while the command runs.
+        """
+        c_print(Colors.OKCYAN, f"Executing: {shlex.join(args)}")
+        if self.dry_run and not read_only:
             c_print(Colors.WARNING, "Dry Run: Command not executed.")
             return 0, "Dry run mode", ""
         try:
+            self.command_count += 1
+            if progress is not None:
+                return self._stream_command(args, progress, check_error)
             process = subprocess.run(
-                command,
-                shell=True,
+                args,
                 capture_output=capture_output,
                 text=True,
+                input=input,
                 check=False
             )
-            stdout_output = process.stdout.strip() if capture_output else ""
+            stdout_output = (process.stdout.strip() if strip else process.stdout) if capture_output else ""
             stderr_output = process.stderr.strip() if capture_output else ""
 
             if check_error and process.returncode != 0 and stderr_output:
                 c_print(Colors.FAIL, f"Command failed with error: {stderr_output}")
             return process.returncode, stdout_output, stderr_output
         except FileNotFoundError:
-            c_print(Colors.FAIL, f"Command not found: {command.split()[0]}")
-            return -1, "", f"Command not found: {command.split()[0]}"
+            c_print(Colors.FAIL, f"Command not found: {args[0]}")
+            return -1, "", f"Command not found: {args[0]}"
         except Exception as e:
             c_print(Colors.FAIL, f"An unexpected error occurred: {e}")
             return -1, "", f"An unexpected error occurred: {e}"
 
-    def _get_current_branch(self) -> Optional[str]:
-        """Gets the current Git branch name, or None if not in a Git repo."""
-        code, stdout, _ = self._run_command("git rev-parse --abbrev-ref HEAD", check_error=False)
-        if code == 0:
-            return stdout
-        return None
+    def _stream_command(self, args: List[str], progress: PushProgress, check_error: bool) -> Tuple[int, str, str]:
+        process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout_chunks: List[bytes] = []
+        reader = threading.Thread(target=lambda: stdout_chunks.append(process.stdout.read()), daemon=True)
+        reader.start()
+        stderr_output = progress.consume(process.stderr).strip()
+        reader.join()
+        process.wait()
+        if check_error and process.returncode != 0 and stderr_output:
+            c_print(Colors.FAIL, f"Command failed with error: {stderr_output}")
+        return process.returncode, b"".join(stdout_chunks).decode("utf-8", "replace").strip(), stderr_output
+
+    def repo_state(self, refresh: bool = False) -> RepoState:
+        """Returns the shared repository snapshot, querying git only when it is missing or stale."""
+        if self._state is None or refresh:
+            code, stdout, _ = self._run_command(
+                ["git", "status", "--porcelain=v2", "--branch", "-z", "--untracked-files=all"],
+                check_error=False, read_only=True, strip=False,
+            )
+            if code != 0:
+                self._state = RepoState()
+            else:
+                self._state = RepoState.parse(stdout)
+                code, url, _ = self._run_command(["git", "remote", "get-url", "origin"], check_error=False, read_only=True)
+                self._state.remote_url = url if code == 0 else None
+        return self._state
+
+    @property
+    def current_branch(self) -> str:
+        return self.repo_state().branch or self.default_branch
 
     def check_git_installed(self) -> bool:
         """Checks if Git is installed and available in the system's PATH."""
         c_print(Colors.HEADER, "Checking for Git installation...")
-        exit_code, _, _ = self._run_command("command -v git", check_error=False)
-        if exit_code == 0:
+        if shutil.which("git"):
             c_print(Colors.OKGREEN, "Git is installed.")
             return True
         c_print(Colors.FAIL, "Error: Git is not installed. Please install Git to proceed.")
@@ -90,65 +450,167 @@ class GitPusher:
 
     def initialize_repo(self) -> bool:
         """Initializes a Git repository if one doesn't already exist."""
-        if self._get_current_branch():
+        state = self.repo_state()
+        if state.is_repo:
             c_print(Colors.OKGREEN, "Git repository already exists.")
             return True
         
         c_print(Colors.HEADER, "Initializing new Git repository...")
-        exit_code, _, stderr = self._run_command(f"git init -b {self.current_branch}")
+        exit_code, _, stderr = self._run_command(["git", "init", "-b", self.default_branch])
         if exit_code != 0:
             c_print(Colors.FAIL, f"Failed to initialize Git repository. Error: {stderr}")
             return False
-        c_print(Colors.OKGREEN, f"Git repository initialized on branch '{self.current_branch}'.")
+        self.repo_state(refresh=not self.dry_run)
+        c_print(Colors.OKGREEN, f"Git repository initialized on branch '{self.default_branch}'.")
         return True
 
     def setup_remote(self) -> bool:
         """Sets up or updates the 'origin' remote URL."""
         c_print(Colors.HEADER, "Configuring remote repository...")
-        exit_code, current_url, _ = self._run_command("git remote get-url origin", check_error=False)
+        state = self.repo_state()
         
-        if exit_code != 0: # Remote 'origin' does not exist
+        if state.remote_url is None: # Remote 'origin' does not exist
             c_print(Colors.OKBLUE, f"Adding remote 'origin' with URL: {self.repo_url}")
-            exit_code, _, stderr = self._run_command(f"git remote add origin {self.repo_url}")
+            exit_code, _, stderr = self._run_command(["git", "remote", "add", "origin", self.repo_url])
             if exit_code != 0:
                 c_print(Colors.FAIL, f"Failed to add remote 'origin'. Error: {stderr}")
                 return False
-        elif current_url != self.repo_url:
+        elif state.remote_url != self.repo_url:
             c_print(Colors.OKBLUE, f"Updating remote 'origin' URL to: {self.repo_url}")
-            exit_code, _, stderr = self._run_command(f"git remote set-url origin {self.repo_url}")
+            exit_code, _, stderr = self._run_command(["git", "remote", "set-url", "origin", self.repo_url])
             if exit_code != 0:
                 c_print(Colors.FAIL, f"Failed to update remote 'origin' URL. Error: {stderr}")
                 return False
+            # The old remote-tracking refs say nothing about the new remote
+            state.upstream = None
         else:
             c_print(Colors.OKGREEN, "Remote 'origin' is already configured correctly.")
+        state.remote_url = self.repo_url
         return True
 
+    def _pathspec_command(self, args: List[str], changes: List[FileChange]) -> Tuple[int, str, str]:
+        """Runs a git command over many paths in one process (NUL-separated pathspecs on stdin).
+
+        Porcelain paths are relative to the top of the work tree and taken literally.
+        """
+        return self._run_command(
+            args + ["--pathspec-from-file=-", "--pathspec-file-nul"],
+            input="\0".join(f":(top,literal){c.path}" for c in changes),
+        )
+
+    def _worktree_root(self) -> Path:
+        if Path(".git").exists():
+            return Path.cwd()
+        code, stdout, _ = self._run_command(["git", "rev-parse", "--show-toplevel"], check_error=False, read_only=True)
+        return Path(stdout) if code == 0 and stdout else Path.cwd()
+
     def add_files(self) -> bool:
-        """Adds all files to the staging area."""
+        """Adds the changed files allowed by the staging policy to the staging area."""
         c_print(Colors.HEADER, "Adding files to staging...")
-        exit_code, _, stderr = self._run_command("git add .")
-        if exit_code != 0:
-            c_print(Colors.FAIL, f"Failed to add files. Error: {stderr}")
+        self._staging_done = True
+        state = self.repo_state()
+        if not state.dirty:
+            c_print(Colors.OKGREEN, "Nothing to stage.")
+            return True
+        if self.policy is None:
+            exit_code, _, stderr = self._run_command(["git", "add", "."])
+            if exit_code != 0:
+                c_print(Colors.FAIL, f"Failed to add files. Error: {stderr}")
+                return False
+            state.staged += state.unstaged + state.untracked
+            state.unstaged = state.untracked = 0
+            c_print(Colors.OKGREEN, "All files added to staging.")
+            return True
+
+        plan = self.policy.evaluate(state.changes, self._worktree_root())
+        c_print(Colors.OKBLUE, f"Staging policy: {len(plan.stage)} file(s) to stage ({_fmt_size(plan.stage_bytes)}), "
+                               f"{len(plan.held)} held back, {len(plan.lfs)} routed to Git LFS")
+        for change, reason in plan.held:
+            c_print(Colors.WARNING, f"  held back: {change.path} ({reason})")
+        for change in plan.lfs:
+            c_print(Colors.WARNING, f"  Git LFS: {change.path}")
+
+        if plan.oversized and self.policy.oversize == "refuse":
+            c_print(Colors.FAIL, f"Refusing to stage {len(plan.oversized)} file(s) above {self.policy.max_file_mb:g} MB.")
+            c_print(Colors.WARNING, "Raise --max-file-mb, pass --oversize skip or --oversize lfs, or add them to .gitignore.")
             return False
-        c_print(Colors.OKGREEN, "All files added to staging.")
+        if plan.lfs:
+            if not shutil.which("git-lfs"):
+                c_print(Colors.FAIL, "Git LFS is not installed; cannot route oversized files to it.")
+                return False
+            exit_code, _, stderr = self._run_command(["git", "lfs", "track", "--filename"] + [c.path for c in plan.lfs])
+            if exit_code != 0:
+                c_print(Colors.FAIL, f"Failed to track files with Git LFS. Error: {stderr}")
+                return False
+            plan.stage.extend(plan.lfs + [FileChange(".gitattributes", ".M")])
+
+        # Files staged by hand earlier that the policy holds back are unstaged again
+        unstage = [change for change, _ in plan.held if change.staged]
+        if unstage:
+            command = ["git", "reset", "-q"] if state.head else ["git", "rm", "--cached", "-q"]
+            exit_code, _, stderr = self._pathspec_command(command, unstage)
+            if exit_code != 0:
+                c_print(Colors.FAIL, f"Failed to unstage held-back files. Error: {stderr}")
+                return False
+
+        if plan.stage:
+            exit_code, _, stderr = self._pathspec_command(["git", "add", "-A"], plan.stage)
+            if exit_code != 0:
+                c_print(Colors.FAIL, f"Failed to add files. Error: {stderr}")
+                return False
+        state.staged = len(plan.stage)
+        state.unstaged = sum(1 for change, _ in plan.held if not change.untracked)
+        state.untracked = sum(1 for change, _ in plan.held if change.untracked)
+        state.changes = [change for change, _ in plan.held]
+        c_print(Colors.OKGREEN, f"{len(plan.stage)} file(s) added to staging.")
         return True
 
+    def pack_estimate(self) -> Optional[int]:
+        """On-disk size of the objects the push would send (not yet on origin)."""
+        code, stdout, _ = self._run_command(
+            ["git", "rev-list", "--objects", "--disk-usage", "HEAD", "--not", "--remotes=origin"],
+            check_error=False, read_only=True,
+        )
+        return int(stdout) if code == 0 and stdout.isdigit() else None
+
+    def push_batches(self, pack_bytes: int) -> List[str]:
+        """Intermediate commits to push before the branch tip when the pending history is too large.
+
+        Commits along the first-parent chain are split into equal-count batches, enough
+        of them that an average batch stays under --batch-mb.
+        """
+        limit = int(self.batch_mb * 1024 * 1024)
+        if self.batch_mb <= 0 or pack_bytes <= limit:
+            return []
+        code, stdout, _ = self._run_command(
+            ["git", "rev-list", "--reverse", "--first-parent", "HEAD", "--not", "--remotes=origin"],
+            check_error=False, read_only=True,
+        )
+        commits = stdout.split() if code == 0 else []
+        count = min(-(-pack_bytes // limit), len(commits))
+        if count <= 1:
+            return []
+        step = len(commits) / count
+        return [commits[int(step * i) - 1] for i in range(1, count)]
+
     def commit_changes(self, commit_message: str) -> bool:
         """Commits staged changes."""
         c_print(Colors.HEADER, "Committing changes...")
         
         # Check if there are any changes to commit (staged or unstaged)
-        status_code, status_output, _ = self._run_command("git status --porcelain", check_error=False)
-        if status_code != 0 or not status_output:
+        state = self.repo_state()
+        if not state.dirty:
             c_print(Colors.OKGREEN, "No changes to commit.")
             return True
 
         # Check if there are staged changes
-        diff_staged_code, _, _ = self._run_command("git diff --staged --quiet", check_error=False)
-        if diff_staged_code == 0: # No staged changes
+        if not state.staged and not self._staging_done:
             c_print(Colors.WARNING, "No changes are staged for commit. Staging all changes.")
             if not self.add_files():
                 return False
+        if not state.staged:
+            c_print(Colors.OKGREEN, "No changes to commit.")
+            return True
 
         c_print(Colors.OKBLUE, f"Committing with message: '{commit_message}'")
         
@@ -156,75 +618,167 @@ class GitPusher:
             c_print(Colors.WARNING, "Dry Run: Commit not executed.")
             return True
 
-        # Use subprocess.run directly for commit to better capture output and errors
-        process = subprocess.run(
-            f'git commit -m "{commit_message}"',
-            shell=True,
-            capture_output=True,
-            text=True,
-            check=False
-        )
+        exit_code, stdout, stderr = self._run_command(["git", "commit", "-m", commit_message], check_error=False)
         
-        if process.returncode != 0:
-            if "nothing to commit" in process.stdout or "nothing to commit" in process.stderr:
+        if exit_code != 0:
+            if "nothing to commit" in stdout or "nothing to commit" in stderr:
                 c_print(Colors.OKGREEN, "No changes to commit.")
                 return True
-            c_print(Colors.FAIL, f"Failed to commit files. Error: {process.stderr}")
+            c_print(Colors.FAIL, f"Failed to commit files. Error: {stderr}")
             return False
         
+        # "[main (root-commit) 1a2b3c4] message"
+        match = re.match(r"\[[^\]]* ([0-9a-f]{7,})\]", stdout)
+        state.head = match.group(1) if match else "HEAD"
+        state.staged = 0
+        state.ahead += 1
         c_print(Colors.OKGREEN, "Changes committed successfully.")
         return True
 
     def push_changes(self, force: bool = False) -> bool:
         """Pushes committed changes to the remote repository."""
         c_print(Colors.HEADER, f"Pushing to '{self.current_branch}' branch...")
-        push_command = f"git push -u origin {self.current_branch}"
-        if force:
-            push_command += " --force"
+        state = self.repo_state()
+        if not state.head:
+            c_print(Colors.WARNING, "Nothing to push: the repository has no commits yet.")
+            return True
+        if not force and state.upstream == f"origin/{self.current_branch}" and state.ahead == 0:
+            c_print(Colors.OKGREEN, f"Everything up-to-date: no local commits ahead of {state.upstream}.")
+            return True
 
-        exit_code, stdout, stderr = self._run_command(push_command)
-        
+        pack_bytes = self.pack_estimate()
+        steps: List[str] = []
+        if pack_bytes is not None:
+            c_print(Colors.OKBLUE, f"Pack estimate: {_fmt_size(pack_bytes)} of objects not yet on origin.")
+            if not force:
+                steps = self.push_batches(pack_bytes)
+            if steps:
+                c_print(Colors.WARNING, f"Large push (> {self.batch_mb:g} MB); pushing the history in {len(steps) + 1} batches.")
+            elif pack_bytes > PACK_WARN_MB * 1024 * 1024:
+                c_print(Colors.WARNING, f"Large push (> {PACK_WARN_MB:g} MB); it may take a while or hit HTTP body-size limits.")
+
+        exit_code, stderr = self._push_refs(steps, force=force)
         if exit_code == 0:
-            c_print(Colors.OKGREEN, "Push successful!")
-            return True
+            return self._push_succeeded()
 
         # Handle common push errors
-        if "non-fast-forward" in stderr or "Updates were rejected" in stderr:
+        if self._rejected(stderr):
             c_print(Colors.FAIL, "Push failed: The remote has changes you don't have locally.")
             c_print(Colors.WARNING, "You need to integrate the remote changes before pushing again.")
-            pull_choice = input("Attempt to pull and integrate remote changes? (y/n): ").lower()
-            if pull_choice == 'y':
-                return self._pull_and_retry_push()
-            else:
-                c_print(Colors.FAIL, "Aborting. Please run 'git pull' or 'git pull --rebase' manually, resolve any conflicts, and then push again.")
-                return False
-        elif "Authentication failed" in stderr or "could not read Username" in stderr:
+            action = self.on_reject
+            if action == "ask":
+                choice = input("Attempt to fetch and integrate remote changes? (y/n): ").lower()
+                action = "integrate" if choice == "y" else "fail"
+            if action == "integrate":
+                return self._integrate_and_push()
+            c_print(Colors.FAIL, "Aborting. Please run 'git pull' or 'git pull --rebase' manually, resolve any conflicts, and then push again.")
+            return False
+        return self._report_push_error(stderr)
+
+    def _push_refs(self, steps: List[str], force: bool = False, lease: Optional[str] = None) -> Tuple[int, str]:
+        """Pushes the batch commits, then the branch tip; stops at the first failure."""
+        refspecs = [f"{sha}:refs/heads/{self.current_branch}" for sha in steps] + [self.current_branch]
+        exit_code, stderr = 0, ""
+        for number, refspec in enumerate(refspecs, 1):
+            push_command = ["git", "push", "--progress"]
+            if number == len(refspecs):
+                push_command.append("-u")
+            push_command += ["origin", refspec]
+            if force:
+                push_command.append("--force")
+            elif lease is not None:
+                push_command.append(f"--force-with-lease={self.current_branch}:{lease}")
+            label = "push" if len(refspecs) == 1 else f"batch {number}/{len(refspecs)}"
+            progress = PushProgress(label)
+            exit_code, _, stderr = self._run_command(push_command, progress=progress)
+            if exit_code != 0:
+                break
+            if not self.dry_run:
+                c_print(Colors.OKBLUE, f"{label}: {progress.summary()}")
+        return exit_code, stderr
+
+    def _push_succeeded(self) -> bool:
+        state = self.repo_state()
+        state.upstream = f"origin/{self.current_branch}"
+        state.ahead = state.behind = 0
+        c_print(Colors.OKGREEN, "Push successful!")
+        return True
+
+    @staticmethod
+    def _rejected(stderr: str) -> bool:
+        """Non-fast-forward, fetch-first, a lost lease or a lost ref-update race: the remote moved under us."""
+        return any(marker in stderr for marker in (
+            "[rejected]", "non-fast-forward", "Updates were rejected", "cannot lock ref",
+        ))
+
+    def _report_push_error(self, stderr: str) -> bool:
+        if "Authentication failed" in stderr or "could not read Username" in stderr:
             c_print(Colors.FAIL, "Push failed: Authentication error.")
             c_print(Colors.WARNING, "Please ensure your Git credentials are correct and you have permission to push to the repository.")
-            return False
         elif "repository not found" in stderr:
             c_print(Colors.FAIL, "Push failed: Remote repository not found.")
             c_print(Colors.WARNING, f"Please verify that the repository URL ({self.repo_url}) is correct and you have access.")
-            return False
         else:
             c_print(Colors.FAIL, f"An unexpected error occurred during push: {stderr}")
             c_print(Colors.WARNING, "Please check your network connection and Git configuration.")
-            return False
+        return False
 
-    def _pull_and_retry_push(self) -> bool:
-        """Pulls remote changes and retries the push."""
-        c_print(Colors.HEADER, "Attempting to pull and integrate remote changes...")
-        pull_method = "--rebase" if self.use_rebase else "--no-rebase"
-        pull_command = f"git pull {pull_method} origin {self.current_branch}"
-        exit_code, stdout, stderr = self._run_command(pull_command)
+    def _integrate_remote(self, branch: str) -> bool:
+        """Rebases or merges onto the fetched remote branch; aborts and fails on conflicts."""
+        upstream = f"origin/{branch}"
+        if self.use_rebase:
+            command, abort = ["git", "rebase", upstream], ["git", "rebase", "--abort"]
+        else:
+            command, abort = ["git", "merge", "--no-edit", upstream], ["git", "merge", "--abort"]
+        exit_code, stdout, stderr = self._run_command(command, check_error=False)
+        if exit_code == 0:
+            return True
+        _, conflicted, _ = self._run_command(["git", "diff", "--name-only", "--diff-filter=U"], read_only=True)
+        self._run_command(abort, check_error=False)
+        self.repo_state(refresh=True)
+        c_print(Colors.FAIL, f"Could not {'rebase onto' if self.use_rebase else 'merge'} {upstream} automatically.")
+        if conflicted:
+            c_print(Colors.WARNING, "Conflicting files:\n  " + conflicted.replace("\n", "\n  "))
+        else:
+            c_print(Colors.WARNING, stderr or stdout)
+        c_print(Colors.WARNING, "Resolve the conflicts manually, then commit and push again.")
+        return False
 
-        if exit_code != 0:
-            c_print(Colors.FAIL, f"Failed to pull changes. Error: {stderr}")
-            c_print(Colors.WARNING, "Please resolve any merge/rebase conflicts manually and then commit and push.")
-            return False
-        
-        c_print(Colors.OKGREEN, "Pull successful. Retrying push...")
-        return self.push_changes()
+    def _integrate_and_push(self) -> bool:
+        """Fetch, rebase or merge, push: repeated while the remote keeps moving, within
+        max_attempts rounds and the integrate_secs time budget."""
+        branch = self.current_branch
+        deadline = time.monotonic() + self.integrate_secs
+        for attempt in range(1, self.max_attempts + 1):
+            c_print(Colors.HEADER, f"Integrating remote changes (attempt {attempt}/{self.max_attempts})...")
+            exit_code, _, stderr = self._run_command(["git", "fetch", "--no-tags", "origin", branch])
+            if exit_code != 0:
+                return self._report_push_error(stderr)
+            _, lease, _ = self._run_command(
+                ["git", "rev-parse", "--verify", "-q", f"refs/remotes/origin/{branch}"], check_error=False, read_only=True,
+            )
+            if not self._integrate_remote(branch):
+                return False
+            # The remote branch is now part of HEAD, so there is something to push again
+            state = self.repo_state()
+            state.ahead = max(state.ahead, 1)
+
+            exit_code, stderr = self._push_refs([], lease=lease if self.force_with_lease and lease else None)
+            if exit_code == 0:
+                return self._push_succeeded()
+            if not self._rejected(stderr):
+                return self._report_push_error(stderr)
+
+            remaining = deadline - time.monotonic()
+            if attempt == self.max_attempts or remaining <= 0:
+                break
+            # Jittered backoff, so pushers racing for the same branch stop colliding
+            delay = min(random.uniform(0.5, 1.0) * 2 ** (attempt - 1), remaining)
+            c_print(Colors.WARNING, f"The remote moved again; retrying in {delay:.1f}s...")
+            time.sleep(delay)
+        c_print(Colors.FAIL, f"Push still rejected after {attempt} integration attempt(s) "
+                             f"({self.integrate_secs:g}s budget); giving up.")
+        return False
 
     def run(self, commit_message: str, force_push: bool = False):
         """Executes the full sequence of Git operations."""
@@ -233,31 +787,34 @@ class GitPusher:
         if self.dry_run:
             c_print(Colors.WARNING + Colors.BOLD, "DRY RUN MODE ENABLED: No actual Git commands will modify the repository.")
         
-        if not self.check_git_installed():
-            sys.exit(1)
-        
-        c_print(Colors.HEADER, "\nCurrent Git Status:")
-        self._run_command("git status", capture_output=False, check_error=False)
-        print("-" * 40)
+        try:
+            if not self.check_git_installed():
+                sys.exit(1)
+            
+            c_print(Colors.HEADER, "\nCurrent Git Status:")
+            print(self.repo_state().summary())
+            print("-" * 40)
 
-        if not self.initialize_repo():
-            sys.exit(1)
-        
-        if not self.setup_remote():
-            sys.exit(1)
-        
-        if not self.add_files():
-            sys.exit(1)
-        
-        if not self.commit_changes(commit_message):
-            sys.exit(1)
-        
-        if not self.push_changes(force=force_push):
-            c_print(Colors.FAIL, "Script finished with errors.")
-            sys.exit(1)
-        
-        c_print(Colors.BOLD + Colors.OKGREEN, f"\nSuccessfully pushed project to {self.repo_url}")
-        c_print(Colors.OKBLUE, f"View your repository at: {self.repo_url}")
+            if not self.initialize_repo():
+                sys.exit(1)
+            
+            if not self.setup_remote():
+                sys.exit(1)
+            
+            if not self.add_files():
+                sys.exit(1)
+            
+            if not self.commit_changes(commit_message):
+                sys.exit(1)
+            
+            if not self.push_changes(force=force_push):
+                c_print(Colors.FAIL, "Script finished with errors.")
+                sys.exit(1)
+            
+            c_print(Colors.BOLD + Colors.OKGREEN, f"\nSuccessfully pushed project to {self.repo_url}")
+            c_print(Colors.OKBLUE, f"View your repository at: {self.repo_url}")
+        finally:
+            c_print(Colors.OKBLUE, f"Git invocations: {self.command_count}")
 
 # --- Main Execution ---
 def main():
@@ -266,10 +823,41 @@ def main():
     parser = argparse.ArgumentParser(description="A script to automate pushing a project to a GitHub repository.")
     parser.add_argument("--force", action="store_true", help="Force push to the remote repository. Use with caution.")
     parser.add_argument("--dry-run", action="store_true", help="Show commands that would be executed without running them.")
-    parser.add_argument("--rebase", action="store_true", help="Use git pull --rebase instead of git pull --no-rebase (merge) when integrating remote changes.")
+    parser.add_argument("--rebase", action="store_true", help="Rebase onto the remote branch instead of merging it when integrating remote changes.")
     parser.add_argument("--message", type=str, default=DEFAULT_COMMIT_MESSAGE, help="Commit message to use.")
+    parser.add_argument("--policy", type=Path, default=None,
+                        help=f"Staging policy JSON (default: {POLICY_FILE} at the repository root, if present).")
+    parser.add_argument("--no-policy", action="store_true", help="Stage everything with 'git add .' (no staging policy).")
+    parser.add_argument("--max-file-mb", type=float, default=None,
+                        help=f"Largest file that may be staged, in MB (default: {DEFAULT_MAX_FILE_MB:g}).")
+    parser.add_argument("--oversize", choices=OVERSIZE_ACTIONS, default=None,
+                        help="What to do with files above the size limit: refuse (stop, default), skip them, or route them to Git LFS.")
+    parser.add_argument("--batch-mb", type=float, default=DEFAULT_BATCH_MB,
+                        help=f"Push histories larger than this in commit batches, in MB (default: {DEFAULT_BATCH_MB:g}, 0 = never).")
+    parser.add_argument("--on-reject", choices=REJECT_ACTIONS, default=None,
+                        help="When the remote has new commits: ask, integrate them automatically, or fail "
+                             "(default: ask on a terminal, integrate otherwise).")
+    parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS,
+                        help=f"Fetch/integrate/push rounds before giving up (default: {DEFAULT_MAX_ATTEMPTS}).")
+    parser.add_argument("--integrate-timeout", type=float, default=DEFAULT_INTEGRATE_SECS,
+                        help=f"Time budget in seconds for all integration rounds (default: {DEFAULT_INTEGRATE_SECS:g}).")
+    parser.add_argument("--force-with-lease", action="store_true",
+                        help="After integrating, push with a lease on the fetched remote commit instead of a plain push.")
     args = parser.parse_args()
 
+    policy: Optional[StagingPolicy] = None
+    if not args.no_policy:
+        policy_path = args.policy or Path(POLICY_FILE)
+        try:
+            policy = StagingPolicy.load(policy_path) if policy_path.exists() or args.policy else StagingPolicy()
+        except (OSError, ValueError, TypeError) as e:
+            c_print(Colors.FAIL, f"Invalid staging policy {policy_path}: {e}")
+            sys.exit(1)
+        if args.max_file_mb is not None:
+            policy.max_file_mb = args.max_file_mb
+        if args.oversize:
+            policy.oversize = args.oversize
+
     if args.force:
         c_print(Colors.WARNING, "You are about to perform a force push. This will overwrite the remote history.")
         confirm = input("Are you sure you want to continue? (yes/no): ").lower()
@@ -277,7 +865,10 @@ def main():
             c_print(Colors.FAIL, "Force push aborted by user.")
             sys.exit(0)
 
-    pusher = GitPusher(REPO_URL, DEFAULT_BRANCH, dry_run=args.dry_run, use_rebase=args.rebase)
+    on_reject = args.on_reject or ("ask" if sys.stdin.isatty() else "integrate")
+    pusher = GitPusher(REPO_URL, DEFAULT_BRANCH, dry_run=args.dry_run, use_rebase=args.rebase, policy=policy,
+                       batch_mb=args.batch_mb, on_reject=on_reject, max_attempts=max(args.max_attempts, 1),
+                       integrate_secs=args.integrate_timeout, force_with_lease=args.force_with_lease)
     pusher.run(commit_message=args.message, force_push=args.force)
 
 if __name__ == "__main__":
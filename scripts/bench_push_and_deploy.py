@@ -0,0 +1,805 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmarks for push_and_deploy.py against local stand-ins.
+
+Every scenario runs the deploy script's main() in-process, unmodified, inside a
+throwaway workspace:
+- Remote: a bare git repository whose post-receive hook notifies the fake
+  Vercel API of each push, the way the GitHub integration triggers builds.
+- Checkout: a synthetic project of N files (100 to 100k) spread over the staged
+  directories, with the script under test copied into scripts/.
+- Vercel: a local HTTP server implementing the project and deployment
+  list/get/create/cancel endpoints with a configurable build duration, build
+  failure rate and API error rate; it also serves the deployed site, so the
+  health checks hit it too.
+- CLI: a stub `vercel` on PATH that builds (--prebuilt) and deploys through
+  the fake API.
+
+Each run changes a few files, then commits, pushes and deploys them. Wall time,
+subprocess count, Vercel API calls and health probes are broken down per
+pipeline phase from the run's trace, summarized (median over --repeat runs) and
+written as JSON to reports/bench/. --compare flags phases that got slower or
+started spawning more subprocesses / making more API calls than in an earlier
+result file, and exits 1 when it finds any.
+
+--startup benchmarks the utility commands instead (--help, --list-remotes,
+--list-branches, stats, a dry run): each one in a fresh interpreter, the way a
+shell or the old demo ran them, and in-process through run_cli(), next to the
+bare interpreter start and the module import.
+
+Usage examples:
+  # Default matrix: 100 / 1k / 10k files, GitHub integration and CLI modes
+  python3 scripts/bench_push_and_deploy.py
+
+  # Large checkout, flaky builds, compared with an earlier version's results
+  python3 scripts/bench_push_and_deploy.py --files 100000 --repeat 3 \
+    --build-secs 5 --failure-rate 0.2 --compare reports/bench/bench_20261018_120000.json
+
+  # Benchmark another version of the script
+  git show HEAD~5:scripts/push_and_deploy.py > /tmp/push_and_deploy_old.py
+  python3 scripts/bench_push_and_deploy.py --script /tmp/push_and_deploy_old.py
+
+  # Startup time of the utility commands
+  python3 scripts/bench_push_and_deploy.py --startup --repeat 10
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import platform
+import py_compile
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, redirect_stderr, redirect_stdout
+from io import StringIO
+from dataclasses import dataclass, asdict
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_SCRIPT = REPO_ROOT / "scripts" / "push_and_deploy.py"
+BENCH_DIR = REPO_ROOT / "reports" / "bench"
+
+RESULT_VERSION = 1
+MODES: Dict[str, List[str]] = {
+    "github": ["--via-github"],
+    "cli": ["--vercel-cli"],
+    "prebuilt": ["--prebuilt"],
+}
+# Staged top-level directories the synthetic files are spread over
+SYNTHETIC_DIRS = ("app", "components", "lib", "hooks", "utils", "public", "types")
+FILES_PER_DIR = 100
+# Phases faster than this are not compared (timer noise)
+MIN_COMPARE_SECS = 0.05
+# Utility commands timed by --startup
+STARTUP_COMMANDS: Dict[str, List[str]] = {
+    "help": ["--help"],
+    "list-remotes": ["--list-remotes"],
+    "list-branches": ["--list-branches"],
+    "stats": ["stats"],
+    "dry-run": ["--dry-run", "--no-metrics", "-m", "chore(bench): dry run"],
+}
+
+
+@dataclass
+class BenchSettings:
+    build_secs: float = 2.0  # remote build duration of the fake Vercel
+    local_build_secs: float = 0.5  # duration of the stub `vercel build` (--prebuilt)
+    failure_rate: float = 0.0  # share of builds ending in ERROR
+    api_error_rate: float = 0.0  # share of API requests answered with 503
+    poll_secs: float = 1.0  # DEPLOY_POLL_SECS for the script under test
+    retry_delay: int = 1
+    changed: int = 10  # files modified per run (plus one added)
+    file_bytes: int = 256
+    seed: int = 1
+
+
+# ---------------- Fake Vercel API ----------------
+
+def _ms(ts: float) -> int:
+    return int(ts * 1000)
+
+
+class FakeVercel:
+    """In-memory Vercel deployments API with simulated builds.
+
+    Deployments are created by the remote's post-receive hook (GitHub
+    integration), by the stub CLI or by POST /v13/deployments, and move from
+    BUILDING to READY (or ERROR, at `failure_rate`) after `build_secs`.
+    Any path outside the API is the deployed site and answers 200.
+    """
+
+    def __init__(self, settings: BenchSettings, production_branch: str = "main"):
+        self.settings = settings
+        self.production_branch = production_branch
+        self.deployments: List[Dict[str, Any]] = []
+        self.calls: Dict[str, int] = {}
+        self._rng = random.Random(settings.seed)
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeVercelHandler)
+        self.server.daemon_threads = True
+        self.server.api = self  # type: ignore[attr-defined]
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self) -> None:
+        threading.Thread(target=self.server.serve_forever, name="fake-vercel", daemon=True).start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def take_calls(self) -> Dict[str, int]:
+        """Request counts by route since the last call"""
+        with self._lock:
+            calls, self.calls = self.calls, {}
+        return calls
+
+    def _count(self, route: str) -> None:
+        with self._lock:
+            self.calls[route] = self.calls.get(route, 0) + 1
+
+    def _roll(self, rate: float) -> bool:
+        with self._lock:
+            return self._rng.random() < rate
+
+    def create(self, branch: str, sha: str, target: str, build_secs: Optional[float] = None) -> Dict[str, Any]:
+        now = time.time()
+        fails = self._roll(self.settings.failure_rate)
+        with self._lock:
+            dep = {
+                "uid": f"dpl_bench{len(self.deployments) + 1}",
+                "name": "bench",
+                "url": self.url,
+                "target": target,
+                "meta": {"gitBranch": branch, "githubCommitSha": sha},
+                "createdAt": _ms(now),
+                "_done_at": now + (self.settings.build_secs if build_secs is None else build_secs),
+                "_fails": fails,
+                "_canceled": False,
+            }
+            self.deployments.append(dep)
+        return self.view(dep)
+
+    def view(self, dep: Dict[str, Any]) -> Dict[str, Any]:
+        out = {k: v for k, v in dep.items() if not k.startswith("_")}
+        out["buildingAt"] = dep["createdAt"]
+        if dep["_canceled"]:
+            state = "CANCELED"
+        elif time.time() < dep["_done_at"]:
+            state = "BUILDING"
+        else:
+            state = "ERROR" if dep["_fails"] else "READY"
+            out["ready"] = _ms(dep["_done_at"])
+        out["readyState"] = out["state"] = state
+        return out
+
+    def find(self, uid: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return next((d for d in self.deployments if d["uid"] == uid), None)
+
+    def handle(self, method: str, path: str, query: Dict[str, List[str]], body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        segments = [s for s in path.split("/") if s]
+        if not segments or segments[0] not in ("v9", "v13", "_bench"):
+            self._count("site")
+            return 200, {"ok": True}
+
+        if segments[0] == "_bench":
+            # Stand-in plumbing (push hook, stub CLI); not counted as script API calls
+            route = f"{method} /_bench/{segments[1] if len(segments) > 1 else ''}"
+            self._count(route)
+            if route == "POST /_bench/push":
+                branch = body.get("ref", "")
+                target = "production" if branch == self.production_branch else "preview"
+                return 200, self.create(branch, body.get("sha", ""), target)
+            if route == "POST /_bench/deploy":
+                build_secs = 0.0 if body.get("prebuilt") else None
+                return 200, self.create("", "", body.get("target") or "preview", build_secs)
+            if route == "GET /_bench/deployments" and len(segments) == 3:
+                dep = self.find(segments[2])
+                return (200, self.view(dep)) if dep else (404, {"error": "not found"})
+            return 404, {"error": "unknown bench route"}
+
+        template = "/".join("{id}" if i == 2 else s for i, s in enumerate(segments))
+        self._count(f"{method} /{template}")
+        if self._roll(self.settings.api_error_rate):
+            return 503, {"error": {"code": "bench_injected", "message": "injected API error"}}
+
+        if segments[:2] == ["v9", "projects"] and len(segments) == 3 and method == "GET":
+            return 200, {"id": segments[2], "name": "bench", "link": {"type": "github", "repoId": 1}}
+        if segments[:2] != ["v13", "deployments"]:
+            return 404, {"error": {"code": "not_found"}}
+        if len(segments) == 2 and method == "GET":
+            target = (query.get("target") or [None])[0]
+            limit = int((query.get("limit") or ["20"])[0])
+            with self._lock:
+                deps = [d for d in reversed(self.deployments) if target is None or d["target"] == target][:limit]
+            return 200, {"deployments": [self.view(d) for d in deps]}
+        if len(segments) == 2 and method == "POST":
+            source = body.get("gitSource") or {}
+            return 200, self.create(source.get("ref", ""), source.get("sha", ""), body.get("target") or "preview")
+        dep = self.find(segments[2])
+        if dep is None:
+            return 404, {"error": {"code": "not_found"}}
+        if len(segments) == 4 and segments[3] == "cancel" and method == "PATCH":
+            dep["_canceled"] = True
+        return 200, self.view(dep)
+
+
+class _FakeVercelHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _dispatch(self, method: str) -> None:
+        parts = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            body = json.loads(raw) if raw else {}
+        except ValueError:
+            body = {}
+        status, payload = self.server.api.handle(method, parts.path, parse_qs(parts.query), body)  # type: ignore[attr-defined]
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        self._dispatch("GET")
+
+    def do_POST(self) -> None:
+        self._dispatch("POST")
+
+    def do_PATCH(self) -> None:
+        self._dispatch("PATCH")
+
+
+# ---------------- Workspace ----------------
+
+POST_RECEIVE_HOOK = '''#!{python}
+import json, sys, urllib.request
+
+for line in sys.stdin:
+    old, new, ref = line.split()
+    if ref.startswith("refs/heads/") and set(new) != {{"0"}}:
+        body = json.dumps({{"ref": ref[len("refs/heads/"):], "sha": new}}).encode("utf-8")
+        req = urllib.request.Request("{api}/_bench/push", data=body, method="POST",
+                                     headers={{"Content-Type": "application/json"}})
+        urllib.request.urlopen(req, timeout=10).read()
+'''
+
+STUB_VERCEL = '''#!{python}
+"""Stub `vercel` CLI: builds locally and deploys through the fake Vercel API"""
+import json, os, sys, time, urllib.request
+
+API = "{api}"
+args = sys.argv[1:]
+
+
+def call(method, path, payload=None):
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    req = urllib.request.Request(API + path, data=data, method=method, headers={{"Content-Type": "application/json"}})
+    with urllib.request.urlopen(req, timeout=30) as resp:
+        return json.load(resp)
+
+
+if args[:1] == ["--version"]:
+    print("Vercel CLI 0.0.0 (bench stub)")
+    sys.exit(0)
+if args[:1] == ["build"]:
+    time.sleep({local_build_secs})
+    os.makedirs(".next/cache", exist_ok=True)
+    os.makedirs(".vercel/output", exist_ok=True)
+    with open(".next/cache/build.json", "w") as f:
+        json.dump({{"built_at": time.time()}}, f)
+    with open(".vercel/output/config.json", "w") as f:
+        json.dump({{"version": 3}}, f)
+    sys.exit(0)
+
+dep = call("POST", "/_bench/deploy", {{"target": "production" if "--prod" in args else "preview",
+                                      "prebuilt": "--prebuilt" in args}})
+while dep["readyState"] not in ("READY", "ERROR", "CANCELED"):
+    time.sleep(0.1)
+    dep = call("GET", "/_bench/deployments/" + dep["uid"])
+if dep["readyState"] != "READY":
+    print("Error: deployment " + dep["uid"] + " " + dep["readyState"], file=sys.stderr)
+    sys.exit(1)
+print(dep["url"])
+'''
+
+
+@dataclass
+class Workspace:
+    root: Path
+    remote: Path
+    checkout: Path
+    script: Path
+    files: int
+    setup_secs: float = 0.0
+
+
+def _git(*args: str, cwd: Path) -> None:
+    subprocess.run(["git", *args], cwd=str(cwd), check=True, capture_output=True, text=True)
+
+
+def _write_executable(path: Path, content: str) -> None:
+    path.write_text(content, encoding="utf-8")
+    path.chmod(0o755)
+
+
+def synthetic_path(i: int) -> str:
+    top = SYNTHETIC_DIRS[i % len(SYNTHETIC_DIRS)]
+    return f"{top}/d{i // len(SYNTHETIC_DIRS) // FILES_PER_DIR:04d}/f{i:06d}.ts"
+
+
+def synthetic_content(i: int, size: int) -> str:
+    head = f"// synthetic module {i}\nexport const value{i} = {i};\n"
+    return head + "//" + "x" * max(size - len(head) - 3, 0) + "\n"
+
+
+def make_workspace(base: Path, files: int, script: Path, api_url: str, settings: BenchSettings) -> Workspace:
+    """Bare remote + synthetic checkout of `files` files, pushed once"""
+    start = time.perf_counter()
+    remote = base / f"remote-{files}.git"
+    checkout = base / f"checkout-{files}"
+    _git("init", "-q", "--bare", "-b", "main", str(remote), cwd=base)
+    _write_executable(remote / "hooks" / "post-receive", POST_RECEIVE_HOOK.format(python=sys.executable, api=api_url))
+
+    _git("init", "-q", "-b", "main", str(checkout), cwd=base)
+    for key, value in (("user.name", "Bench"), ("user.email", "bench@example.invalid"), ("commit.gpgsign", "false")):
+        _git("config", key, value, cwd=checkout)
+    for i in range(files):
+        path = checkout / synthetic_path(i)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(synthetic_content(i, settings.file_bytes), encoding="utf-8")
+    (checkout / "package.json").write_text(json.dumps({"name": "bench", "private": True}) + "\n", encoding="utf-8")
+    (checkout / ".gitignore").write_text(".next/\n.vercel/output/\nreports/\n", encoding="utf-8")
+    (checkout / "scripts").mkdir(exist_ok=True)
+    shutil.copy2(script, checkout / "scripts" / "push_and_deploy.py")
+    _git("add", "-A", cwd=checkout)
+    _git("commit", "-q", "-m", f"bench: synthetic checkout ({files} files)", cwd=checkout)
+    _git("remote", "add", "origin", str(remote), cwd=checkout)
+    _git("push", "-q", "-u", "origin", "main", cwd=checkout)
+    return Workspace(base, remote, checkout, checkout / "scripts" / "push_and_deploy.py", files,
+                     round(time.perf_counter() - start, 3))
+
+
+def mutate_checkout(ws: Workspace, run_no: int, settings: BenchSettings, rng: random.Random) -> None:
+    """Modify `changed` synthetic files and add one, like a small feature commit"""
+    for i in rng.sample(range(ws.files), min(settings.changed, ws.files)):
+        with open(ws.checkout / synthetic_path(i), "a", encoding="utf-8") as f:
+            f.write(f"// edited in run {run_no}\n")
+    added = ws.checkout / "app" / "bench" / f"run_{run_no:04d}.ts"
+    added.parent.mkdir(parents=True, exist_ok=True)
+    added.write_text(synthetic_content(run_no, settings.file_bytes), encoding="utf-8")
+
+
+@contextmanager
+def bench_environ(api: FakeVercel, bin_dir: Path, settings: BenchSettings) -> Iterator[None]:
+    """Point the script under test at the stand-ins for the duration of the session"""
+    updates = {
+        "VERCEL_TOKEN": "bench",
+        "VERCEL_PROJECT_ID": "bench-project",
+        "VERCEL_API_URL": api.url,
+        "DEPLOY_POLL_SECS": str(settings.poll_secs),
+        "PATH": f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}",
+        "GIT_TERMINAL_PROMPT": "0",
+    }
+    removed = ("VERCEL_ORG_ID", "DEPLOY_METRICS_FILE", "DEPLOY_TIME_BUDGET", "DEPLOY_DAEMON_SOCKET", "DEPLOY_BUILD_CACHE_DIR")
+    saved = {k: os.environ.get(k) for k in (*updates, *removed)}
+    os.environ.update(updates)
+    for key in removed:
+        os.environ.pop(key, None)
+    try:
+        yield
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+# ---------------- Runs ----------------
+
+def load_script(path: Path, tag: str) -> ModuleType:
+    """Fresh copy of the script under test (fresh globals, like a new process)"""
+    name = f"push_and_deploy_bench_{tag}"
+    spec = importlib.util.spec_from_file_location(name, path)
+    if spec is None or spec.loader is None:
+        raise ImportError(f"Cannot load {path}")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module  # dataclasses resolve annotations through sys.modules
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        sys.modules.pop(name, None)
+        raise
+    return module
+
+
+def _empty_phase() -> Dict[str, Any]:
+    return {"wall_secs": 0.0, "subprocesses": 0, "api_calls": 0, "http_probes": 0, "sleep_secs": 0.0}
+
+
+def phase_breakdown(events: List[Dict[str, Any]], phase_names: List[str], wall: float) -> Dict[str, Dict[str, Any]]:
+    """Attribute subprocess, API, probe and sleep spans to the top-level phase containing them"""
+    phases = sorted((e for e in events if e["cat"] == "phase" and e["name"] in phase_names), key=lambda e: e["ts"])
+    phase_names = list(dict.fromkeys([p["name"] for p in phases] + phase_names))  # in pipeline order
+    out: Dict[str, Dict[str, Any]] = {name: _empty_phase() for name in phase_names}
+    out["other"] = _empty_phase()
+    for span in phases:
+        out[span["name"]]["wall_secs"] += span["dur"] / 1_000_000
+    counters = {"subprocess": "subprocesses", "vercel_api": "api_calls", "http": "http_probes"}
+    for event in events:
+        if event["cat"] not in counters and event["cat"] != "wait":
+            continue
+        owner = next((p["name"] for p in phases if p["ts"] <= event["ts"] <= p["ts"] + p["dur"]), "other")
+        if event["cat"] == "wait":
+            out[owner]["sleep_secs"] += event["dur"] / 1_000_000
+        else:
+            out[owner][counters[event["cat"]]] += 1
+    out["other"]["wall_secs"] = max(wall - sum(out[name]["wall_secs"] for name in phase_names), 0.0)
+    for stats in out.values():
+        stats["wall_secs"] = round(stats["wall_secs"], 4)
+        stats["sleep_secs"] = round(stats["sleep_secs"], 4)
+    return out
+
+
+def _history_lines(ws: Workspace) -> List[str]:
+    try:
+        return (ws.checkout / "reports" / "deploy_history.jsonl").read_text(encoding="utf-8").splitlines()
+    except OSError:
+        return []
+
+
+def run_once(ws: Workspace, mode: str, run_no: int, settings: BenchSettings, api: FakeVercel,
+             rng: random.Random, log: Any) -> Dict[str, Any]:
+    """One end-to-end main() run against the stand-ins"""
+    mutate_checkout(ws, run_no, settings, rng)
+    argv = ["-m", f"feat(bench): run {run_no}", "--retry-delay", str(settings.retry_delay), *MODES[mode]]
+    if mode == "prebuilt":
+        argv += ["--build-cache-dir", str(ws.root / f"build-cache-{ws.files}")]
+    history_before = len(_history_lines(ws))
+    api.take_calls()
+
+    module = load_script(ws.script, f"{ws.files}_{mode}_{run_no}")
+    cwd = os.getcwd()
+    os.chdir(ws.checkout)
+    start = time.perf_counter()
+    try:
+        with redirect_stdout(log), redirect_stderr(log):
+            try:
+                exit_code = module.main(argv)
+            except SystemExit as e:
+                exit_code = e.code if isinstance(e.code, int) else 1
+    finally:
+        wall = time.perf_counter() - start
+        os.chdir(cwd)
+        module.HTTP_POOL.close()
+        sys.modules.pop(module.__name__, None)
+
+    lines = _history_lines(ws)
+    record = json.loads(lines[-1]) if len(lines) > history_before else {}
+    events = module.TRACER.spans()
+    return {
+        "run": run_no,
+        "exit_code": exit_code,
+        "state": record.get("state", "UNKNOWN"),
+        "wall_secs": round(wall, 4),
+        "subprocesses": sum(1 for e in events if e["cat"] == "subprocess"),
+        "api_calls": sum(1 for e in events if e["cat"] == "vercel_api"),
+        "http_probes": sum(1 for e in events if e["cat"] == "http"),
+        "retries": record.get("retries", 0),
+        "phases": phase_breakdown(events, list(record.get("phases") or {}), wall),
+        "server_calls": api.take_calls(),
+    }
+
+
+# ---------------- Startup ----------------
+
+def _spawn_secs(argv: List[str], cwd: Path) -> Tuple[float, int]:
+    start = time.perf_counter()
+    res = subprocess.run(argv, cwd=str(cwd), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start, res.returncode
+
+
+def _call_in_process(module: ModuleType, argv: List[str]) -> int:
+    if hasattr(module, "run_cli"):
+        return module.run_cli(argv).returncode
+    # Script versions without run_cli(): call main() the way run_once() does
+    sink = StringIO()
+    with redirect_stdout(sink), redirect_stderr(sink):
+        try:
+            return module.main(argv)
+        except SystemExit as e:
+            return e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+
+
+def bench_startup(ws: Workspace, repeat: int) -> Dict[str, Any]:
+    """Median wall time of each utility command: fresh interpreter vs in-process"""
+    med = statistics.median
+    # Compiled once up front, so the import timing sees cached bytecode like an installed module
+    py_compile.compile(str(ws.script), doraise=True)
+    interpreter = [_spawn_secs([sys.executable, "-c", "pass"], ws.checkout)[0] for _ in range(repeat)]
+    import_probe = f"import sys; sys.path.insert(0, {str(ws.script.parent)!r}); import push_and_deploy"
+    imports = [_spawn_secs([sys.executable, "-c", import_probe], ws.checkout)[0] for _ in range(repeat)]
+
+    module = load_script(ws.script, "startup")
+    cwd = os.getcwd()
+    os.chdir(ws.checkout)
+    commands: Dict[str, Dict[str, Any]] = {}
+    try:
+        for name, argv in STARTUP_COMMANDS.items():
+            spawned = [_spawn_secs([sys.executable, str(ws.script), *argv], ws.checkout) for _ in range(repeat)]
+            in_process: List[float] = []
+            exit_code = 0
+            for _ in range(repeat):
+                start = time.perf_counter()
+                exit_code = _call_in_process(module, argv)
+                in_process.append(time.perf_counter() - start)
+            commands[name] = {
+                "argv": argv,
+                "exit_code": spawned[-1][1],
+                "in_process_exit_code": exit_code,
+                "subprocess_secs": round(med(t for t, _ in spawned), 4),
+                "in_process_secs": round(med(in_process), 4),
+            }
+    finally:
+        os.chdir(cwd)
+        module.HTTP_POOL.close()
+        sys.modules.pop(module.__name__, None)
+    return {
+        "repeat": repeat,
+        "interpreter_secs": round(med(interpreter), 4),
+        "import_secs": round(med(imports), 4),
+        "commands": commands,
+    }
+
+
+def print_startup(startup: Dict[str, Any]) -> None:
+    print(f"\nStartup: bare interpreter {startup['interpreter_secs'] * 1000:.0f} ms, "
+          f"interpreter + import {startup['import_secs'] * 1000:.0f} ms (median of {startup['repeat']})")
+    print(f"  {'command':<16} {'subprocess ms':>14} {'in-process ms':>14} {'exit':>5}")
+    for name, c in startup["commands"].items():
+        print(f"  {name:<16} {c['subprocess_secs'] * 1000:>14.1f} {c['in_process_secs'] * 1000:>14.1f} {c['exit_code']:>5}")
+
+
+def compare_startup(old: Dict[str, Any], new: Dict[str, Any], threshold_pct: float) -> List[str]:
+    regressions: List[str] = []
+    rows = [("import", old.get("import_secs", 0.0), new["import_secs"])]
+    for name, c in new["commands"].items():
+        before = old.get("commands", {}).get(name)
+        if before is None:
+            print(f"  startup {name}: no baseline")
+            continue
+        rows += [(f"{name} subprocess", before["subprocess_secs"], c["subprocess_secs"]),
+                 (f"{name} in-process", before["in_process_secs"], c["in_process_secs"])]
+    for name, b, a in rows:
+        label = f"startup {name}"
+        slower = b >= MIN_COMPARE_SECS and _pct(b, a) > threshold_pct
+        line = f"  {label:<32} {b * 1000:.1f} ms -> {a * 1000:.1f} ms ({_pct(b, a):+.1f}%)"
+        if slower:
+            regressions.append(label)
+            line += "  REGRESSION"
+        print(line)
+    return regressions
+
+
+# ---------------- Results ----------------
+
+def summarize(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Medians over the repeated runs of a scenario"""
+    med = statistics.median
+    phase_names: Dict[str, None] = {}
+    for run in runs:
+        phase_names.update(dict.fromkeys(run["phases"]))
+    return {
+        "runs": len(runs),
+        "ok": sum(1 for r in runs if r["exit_code"] == 0),
+        "states": sorted({r["state"] for r in runs}),
+        "wall_secs": round(med(r["wall_secs"] for r in runs), 4),
+        "wall_secs_min": round(min(r["wall_secs"] for r in runs), 4),
+        "subprocesses": med(r["subprocesses"] for r in runs),
+        "api_calls": med(r["api_calls"] for r in runs),
+        "http_probes": med(r["http_probes"] for r in runs),
+        "phases": {
+            name: {
+                metric: med(r["phases"].get(name, _empty_phase())[metric] for r in runs)
+                for metric in _empty_phase()
+            }
+            for name in phase_names
+        },
+    }
+
+
+def print_summary(scenario: Dict[str, Any]) -> None:
+    s = scenario["summary"]
+    print(f"\n{scenario['name']}: {s['ok']}/{s['runs']} ok ({', '.join(s['states'])}), "
+          f"wall {s['wall_secs']:.2f}s (min {s['wall_secs_min']:.2f}s), {s['subprocesses']:g} subprocesses, "
+          f"{s['api_calls']:g} API calls, {s['http_probes']:g} probes; setup {scenario['setup_secs']:.1f}s")
+    print(f"  {'phase':<16} {'wall s':>8} {'sleep s':>8} {'subproc':>8} {'api':>5} {'probes':>7}")
+    for name, p in s["phases"].items():
+        print(f"  {name:<16} {p['wall_secs']:>8.3f} {p['sleep_secs']:>8.3f} {p['subprocesses']:>8g} "
+              f"{p['api_calls']:>5g} {p['http_probes']:>7g}")
+
+
+def _pct(old: float, new: float) -> float:
+    return (new - old) / old * 100 if old else 0.0
+
+
+def compare_results(old: Dict[str, Any], new: Dict[str, Any], threshold_pct: float) -> List[str]:
+    """Print per-scenario/phase deltas against an earlier result; return the regressions"""
+    regressions: List[str] = []
+    previous = {s["name"]: s["summary"] for s in old.get("scenarios", [])}
+    print(f"\nCompared with {old.get('created_at', '?')} (script {old.get('script_sha256', '?')[:12]}), "
+          f"threshold {threshold_pct:g}%")
+    if new.get("startup") and old.get("startup"):
+        regressions += compare_startup(old["startup"], new["startup"], threshold_pct)
+    for scenario in new["scenarios"]:
+        before = previous.get(scenario["name"])
+        if before is None:
+            print(f"  {scenario['name']}: no baseline")
+            continue
+        after = scenario["summary"]
+        rows = [("total", before, after)] + [
+            (name, before["phases"][name], stats)
+            for name, stats in after["phases"].items() if name in before["phases"]
+        ]
+        for name, b, a in rows:
+            label = f"{scenario['name']} {name}"
+            slower = b["wall_secs"] >= MIN_COMPARE_SECS and _pct(b["wall_secs"], a["wall_secs"]) > threshold_pct
+            more = [m for m in ("subprocesses", "api_calls") if a[m] > b[m]]
+            if not slower and not more and name != "total":
+                continue
+            line = (f"  {label:<32} wall {b['wall_secs']:.3f}s -> {a['wall_secs']:.3f}s "
+                    f"({_pct(b['wall_secs'], a['wall_secs']):+.1f}%), subprocesses {b['subprocesses']:g} -> "
+                    f"{a['subprocesses']:g}, API calls {b['api_calls']:g} -> {a['api_calls']:g}")
+            if slower or more:
+                regressions.append(label)
+                line += "  REGRESSION"
+            print(line)
+    return regressions
+
+
+def _parse_list(value: str) -> List[str]:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of push_and_deploy.py against local stand-ins")
+    parser.add_argument("--files", default="100,1000,10000",
+                        help="Comma-separated synthetic checkout sizes (default: 100,1000,10000)")
+    parser.add_argument("--modes", default="github,cli", help=f"Comma-separated deploy modes: {', '.join(MODES)} (default: github,cli)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per scenario (default: 3)")
+    parser.add_argument("--changed", type=int, default=10, help="Files modified per run (default: 10)")
+    parser.add_argument("--file-bytes", type=int, default=256, help="Size of each synthetic file (default: 256)")
+    parser.add_argument("--build-secs", type=float, default=2.0, help="Remote build duration of the fake Vercel (default: 2)")
+    parser.add_argument("--local-build-secs", type=float, default=0.5, help="Duration of the stub `vercel build` (default: 0.5)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of builds that end in ERROR (default: 0)")
+    parser.add_argument("--api-error-rate", type=float, default=0.0, help="Share of API requests answered with 503 (default: 0)")
+    parser.add_argument("--poll-secs", type=float, default=1.0, help="Deployment poll interval of the script under test (default: 1)")
+    parser.add_argument("--retry-delay", type=int, default=1, help="--retry-delay passed to the script (default: 1)")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for file selection and injected failures (default: 1)")
+    parser.add_argument("--script", type=Path, default=DEFAULT_SCRIPT, help="Script under test (default: scripts/push_and_deploy.py)")
+    parser.add_argument("--output", type=Path, default=None, help="Result file (default: reports/bench/bench_<timestamp>.json)")
+    parser.add_argument("--compare", type=Path, default=None, metavar="RESULT", help="Earlier result file to compare against")
+    parser.add_argument("--threshold", type=float, default=20.0, help="Slowdown in percent counted as a regression (default: 20)")
+    parser.add_argument("--workdir", type=Path, default=None, help="Keep workspaces in this directory instead of a temp dir")
+    parser.add_argument("--verbose", action="store_true", help="Show the script's output instead of logging it to a file")
+    parser.add_argument("--startup", action="store_true",
+                        help="Time the utility commands (fresh interpreter vs in-process) instead of deploy scenarios")
+    args = parser.parse_args(argv)
+
+    sizes = [int(v) for v in _parse_list(args.files)]
+    modes = _parse_list(args.modes)
+    unknown = [m for m in modes if m not in MODES]
+    if unknown or not sizes or any(n < 1 for n in sizes) or args.repeat < 1:
+        parser.error(f"invalid --files/--modes/--repeat (unknown modes: {', '.join(unknown) or 'none'})")
+    settings = BenchSettings(
+        build_secs=args.build_secs,
+        local_build_secs=args.local_build_secs,
+        failure_rate=args.failure_rate,
+        api_error_rate=args.api_error_rate,
+        poll_secs=args.poll_secs,
+        retry_delay=args.retry_delay,
+        changed=args.changed,
+        file_bytes=args.file_bytes,
+        seed=args.seed,
+    )
+    baseline = json.loads(args.compare.read_text(encoding="utf-8")) if args.compare else None
+
+    ts_slug = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output = args.output or BENCH_DIR / f"bench_{ts_slug}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    log_path = output.with_suffix(".log")
+    log = sys.stdout if args.verbose else open(log_path, "w", encoding="utf-8", buffering=1)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+                        datefmt="%Y-%m-%d %H:%M:%S", handlers=[logging.StreamHandler(log)], force=True)
+
+    base = args.workdir or Path(tempfile.mkdtemp(prefix="push_and_deploy_bench_"))
+    base.mkdir(parents=True, exist_ok=True)
+    bin_dir = base / "bin"
+    bin_dir.mkdir(exist_ok=True)
+    api = FakeVercel(settings)
+    api.start()
+    _write_executable(bin_dir / "vercel", STUB_VERCEL.format(
+        python=sys.executable, api=api.url, local_build_secs=settings.local_build_secs))
+
+    result: Dict[str, Any] = {
+        "version": RESULT_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "script": str(args.script),
+        "script_sha256": hashlib.sha256(args.script.read_bytes()).hexdigest(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": asdict(settings),
+        "scenarios": [],
+    }
+    rng = random.Random(settings.seed)
+    if args.startup:
+        print(f"Benchmarking startup of {args.script} ({len(STARTUP_COMMANDS)} commands x {args.repeat} runs)")
+    else:
+        print(f"Benchmarking {args.script} ({len(sizes)} sizes x {len(modes)} modes x {args.repeat} runs); "
+              f"script output in {'stdout' if args.verbose else log_path}")
+    try:
+        with bench_environ(api, bin_dir, settings):
+            if args.startup:
+                ws = make_workspace(base, min(sizes), args.script, api.url, settings)
+                result["startup"] = bench_startup(ws, args.repeat)
+                print_startup(result["startup"])
+                sizes = []
+            for files in sizes:
+                print(f"Creating synthetic checkout with {files} files...")
+                ws = make_workspace(base, files, args.script, api.url, settings)
+                run_no = 0
+                for mode in modes:
+                    runs = []
+                    for i in range(args.repeat):
+                        run_no += 1
+                        run = run_once(ws, mode, run_no, settings, api, rng, log)
+                        runs.append(run)
+                        print(f"  {mode}/{files} run {i + 1}: {run['state']} in {run['wall_secs']:.2f}s, "
+                              f"{run['subprocesses']} subprocesses, {run['api_calls']} API calls")
+                    scenario = {"name": f"{mode}/{files}", "mode": mode, "files": files,
+                                "setup_secs": ws.setup_secs, "summary": summarize(runs), "runs": runs}
+                    result["scenarios"].append(scenario)
+                    print_summary(scenario)
+    finally:
+        api.stop()
+        if log is not sys.stdout:
+            log.close()
+        if args.workdir is None:
+            shutil.rmtree(base, ignore_errors=True)
+
+    output.write_text(json.dumps(result, indent=2), encoding="utf-8")
+    print(f"\nResults written to {output}")
+    if baseline is not None:
+        regressions = compare_results(baseline, result, args.threshold)
+        if regressions:
+            print(f"❌ {len(regressions)} regression(s): {', '.join(regressions)}")
+            return 1
+        print("✅ No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
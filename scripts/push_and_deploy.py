@@ -4,14 +4,57 @@ Enhanced Push and Deploy Helper for Zignals Trading Platform.
 
 Features
 - Rebase safety: hard-stop if a rebase is in progress.
+- Pre-flight: env vars, Vercel token, remote reachability and required CLIs are
+  checked concurrently with the repository checks, before anything is mutated.
 - Staging policy: include only specified project files/dirs.
 - Commit: Conventional Commits message (overridable via -m).
-- Push: to the specified branch (default: main).
+- Push: to the specified branch (default: main); --mirror pushes to extra remotes
+  concurrently with per-remote timeouts/retries and a --push-quorum of successes.
+  Progress is streamed into the log; histories above --push-batch-mb go in commit batches.
+- Worktree: --worktree commits, builds and pushes from a detached worktree of the target
+  branch under .git/deploy-worktrees/, reused between runs; the primary checkout's files,
+  index and branch are never touched.
+- Watch: --watch polls the include paths and, debounced, restages only changed files and
+  refreshes the tree hash and pre-flight, so a deploy triggered with Enter/SIGUSR1 commits
+  and pushes at once (or is skipped when that tree is already live).
+- Prepare: the `prepare` subcommand enables the commit-graph, multi-pack-index, untracked
+  cache, split index and builtin fsmonitor on the deploy checkout and times status,
+  rev-list and add before and after.
 - Deployment:
   * Option A (default): via GitHub integration. Poll Vercel API for latest deployment of project/branch.
   * Option B: via Vercel CLI (--vercel-cli). Uses `vercel --prod --confirm` unless --preview is passed.
-- Monitoring: health checks on deployed URL (/, /api/health if present, /favicon.ico).
+  * --projects: multi-project fan-out driven by deploy-projects.json; only projects whose
+    path filters match the pushed range deploy, concurrently, into one report.
+  * --matrix: preview deployments for several branches / PR refs at once, created
+    through the Vercel API under a parallelism cap and awaited by one shared poller.
+  * --prebuilt: `vercel build` locally with .next/cache and .vercel/output kept in a
+    size-bounded LRU cache across runs, then `vercel deploy --prebuilt`.
+- Monitoring: concurrent health checks on the deployed URL: the app/ routes changed in
+  the pushed range (dynamic segments filled from deploy-health.json) plus /, /api/health.
 - Reporting: writes deployment report to reports/.
+- Tracing: every phase, subprocess and HTTP request is recorded as a nested span
+  and written next to the report as a Chrome/Perfetto trace (deploy_*.trace.json).
+- Record/replay: --record saves every git/CLI command, Vercel API request and health
+  probe with its timing to a cassette; --replay serves them back deterministically
+  (optionally time-compressed with --replay-speed) without touching remotes or Vercel.
+- Metrics: updates a cumulative Prometheus textfile (node-exporter textfile
+  collector) with run, phase, subprocess, API, retry and health-check series.
+- Profiling: --profile runs the pipeline under cProfile/tracemalloc with per-command
+  subprocess accounting and prints the most expensive operations.
+- Daemon: --daemon stays resident on a Unix socket with warm git state, pooled
+  Vercel connections and cached project metadata; --via-daemon forwards a run (with
+  the client's cwd and VERCEL_/DEPLOY_/GIT_/SSH_ environment) to it.
+- Time budget: --time-budget gives the whole run one deadline; subprocess and HTTP
+  timeouts, retry backoff and polling draw from it, optional steps are skipped near
+  the deadline and a reserve is always kept for writing the report.
+- Queue: runs are serialized per branch through a file lock; a run superseded by a
+  newer request exits (or stops waiting on its build) so only the newest commit deploys.
+- Skip unchanged: when the git tree hash of INCLUDE_PATHS matches the last READY
+  deployment, push, deploy and health checks are skipped and the run is recorded as NOOP.
+- History: appends a structured record per run to reports/deploy_history.jsonl,
+  indexed in reports/deploy_history.sqlite3 for fast lookups.
+- Library use: run_cli(argv) runs a command line in-process and returns the exit code
+  with captured stdout/stderr; heavy stdlib modules are imported on first use.
 - Enhanced Error Handling: Retry mechanisms, fallback strategies, and comprehensive error recovery.
 - One-Shot Deployment: Automatic retry and fallback to ensure successful deployment.
 
@@ -41,25 +84,39 @@ Usage examples:
 from __future__ import annotations
 
 import argparse
+import codecs
+import fnmatch
+import io
 import json
 import os
+import re
 import subprocess
 import sys
 import time
 import logging
 import signal
+import threading
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple, Callable
-from urllib.parse import urlencode
-from urllib.request import Request, urlopen
-from urllib.error import URLError, HTTPError
-from contextlib import contextmanager
-from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Callable
+from urllib.parse import quote, urlencode, urlsplit
+from contextlib import contextmanager, redirect_stderr, redirect_stdout
+from dataclasses import dataclass, field, asdict, replace
 from enum import Enum
 
+# http.client (with ssl), urllib.request, sqlite3, hashlib, shutil and
+# concurrent.futures are imported where they are used, so the utility commands
+# and in-process callers don't pay for them. re, io and threading stay: argparse,
+# logging and subprocess load them on every path anyway.
+if TYPE_CHECKING:
+    import http.client
+    import sqlite3
+
 REPO_ROOT = Path(__file__).resolve().parents[1]
 REPORTS_DIR = REPO_ROOT / "reports"
+HISTORY_LOG = REPORTS_DIR / "deploy_history.jsonl"
+HISTORY_DB = REPORTS_DIR / "deploy_history.sqlite3"
+METRICS_FILE = Path(os.environ.get("DEPLOY_METRICS_FILE") or REPORTS_DIR / "deploy_metrics.prom")
 
 DEFAULT_COMMIT_MESSAGE = (
     "chore(deploy): push to main for production release\n\n"
@@ -118,8 +175,29 @@ class DeployConfig:
     source_branch: Optional[str] = None  # Source branch (defaults to current)
     create_branch: bool = False  # Create branch if it doesn't exist
     switch_branch: bool = True  # Switch to target branch before deployment
+    use_worktree: bool = False  # Commit, build and push from a reused per-branch worktree, never the primary checkout
     push_to_remote: bool = True  # Push to remote repository
     remote_name: str = "origin"  # Remote repository name
+    mirror_remotes: List[str] = field(default_factory=list)  # Pushed concurrently with remote_name
+    push_quorum: Optional[int] = None  # Successful pushes needed (None = every remote)
+    push_timeout_secs: int = 300  # Per remote and attempt
+    push_batch_mb: float = 100.0  # Larger pending histories are pushed in commit batches (0 = never)
+    preview: bool = False  # Deploy/poll the preview target instead of production
+    projects_manifest: Optional[Path] = None  # Multi-project fan-out manifest (None = single project)
+    # Global time budget
+    time_budget_secs: Optional[float] = None  # Deadline for the whole run (None = unlimited)
+    report_reserve_secs: float = 20.0  # Kept back from the budget for writing the report
+    skip_unchanged: bool = True  # Skip deploy when the deployable tree matches the last READY one
+    # Health checks
+    targeted_health: bool = True  # Probe the app/ routes changed in the pushed range plus a core set
+    health_routes_file: Optional[Path] = None  # Sample params/core endpoints (defaults to deploy-health.json)
+    # Prebuilt deploys
+    prebuilt: bool = False  # `vercel build` locally, then `vercel deploy --prebuilt`
+    build_cache_dir: Optional[Path] = None  # Defaults to BUILD_CACHE_DIR
+    build_cache_max_mb: int = 4096
+    # Deploy queue
+    use_queue: bool = True  # Serialize runs per branch and coalesce superseded ones
+    cancel_superseded: bool = False  # Cancel in-flight Vercel builds of older commits
 
 class DeployStatus(Enum):
     SUCCESS = "SUCCESS"
@@ -152,41 +230,494 @@ class HealthCheckError(DeployError):
     def __init__(self, message: str, retryable: bool = True):
         super().__init__(message, DeployStatus.FAILED, retryable)
 
+class CassetteMiss(DeployError):
+    """A replayed run made a call that was never recorded"""
+    def __init__(self, message: str):
+        super().__init__(message, DeployStatus.ERROR, retryable=False)
+
 # Health check settings
 HC_RETRIES = 3
 HC_TIMEOUT_SECS = 15
+HEALTH_CHECK_PARALLEL = 8
+
+# Final states that count as a successful run (exit code 0)
+SUCCESS_STATES = ("READY", "SUPERSEDED", "NOOP")
+
+# Per-run counters, reset at the start of every deploy run
+RUN_COUNTERS: Dict[str, int] = {"retries": 0}
+
+
+def count_retry() -> None:
+    RUN_COUNTERS["retries"] += 1
+
+
+# ---------------- Time budget ----------------
+
+# Minimum budget left to start optional steps
+HEALTH_CHECK_MIN_SECS = 10
+ROLLBACK_MIN_SECS = 30
+# Floor for each command while writing the report, even past the deadline
+REPORT_MIN_SECS = 5
+
+
+class TimeBudget:
+    """One deadline for the whole run that every phase draws its time from.
+
+    Timeouts are clamped to what is left, retry backoff shrinks to a quarter
+    of the remainder, and a reserve is held back so the report can always be
+    written; `reserved()` releases it for the report phase.
+    """
+
+    def __init__(self):
+        self.reset(None)
+
+    def reset(self, total_secs: Optional[float], reserve_secs: float = 0.0) -> None:
+        self.total_secs = total_secs
+        self.reserve_secs = reserve_secs if total_secs else 0.0
+        self._deadline = time.monotonic() + total_secs if total_secs else None
+        self._in_reserve = False
+        self.exhausted_at: Optional[str] = None  # first phase that ran out of time
+
+    @property
+    def limited(self) -> bool:
+        return self._deadline is not None
+
+    def remaining(self) -> float:
+        """Seconds left for work (excluding the report reserve, unless released)"""
+        if self._deadline is None:
+            return float("inf")
+        if self._in_reserve:
+            return max(self._deadline - time.monotonic(), REPORT_MIN_SECS)
+        return max(self._deadline - time.monotonic() - self.reserve_secs, 0.0)
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def allows(self, secs: float) -> bool:
+        return self.remaining() >= secs
+
+    def timeout(self, wanted: float) -> float:
+        return min(wanted, self.remaining())
+
+    def backoff(self, wanted: float) -> float:
+        """Retry delay: never more than a quarter of what is left, so the retry itself still fits"""
+        if self._deadline is None:
+            return wanted
+        return min(wanted, self.remaining() / 4)
+
+    def wall_deadline(self, wanted: float) -> float:
+        """Cap a time.time()-based deadline at the end of the budget"""
+        return min(wanted, time.time() + self.remaining())
+
+    def note_exhausted(self, where: str) -> None:
+        if self.exhausted_at is None:
+            self.exhausted_at = where
+
+    @contextmanager
+    def reserved(self):
+        """Release the report reserve for the duration of the block"""
+        previous = self._in_reserve
+        self._in_reserve = True
+        try:
+            yield
+        finally:
+            self._in_reserve = previous
+
+
+BUDGET = TimeBudget()
+
+
+# ---------------- Tracing ----------------
+
+class Tracer:
+    """Collects nested timing spans and exports them in Chrome trace format.
+
+    Spans are complete ("X") events; the trace viewer nests them by time
+    containment per thread, so a subprocess span started inside a phase span
+    shows up underneath it in chrome://tracing or ui.perfetto.dev.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.events: List[Dict[str, Any]] = []
+            self._origin = time.perf_counter()
+            self._threads: Dict[int, str] = {}
+
+    def _now_us(self) -> float:
+        return round((time.perf_counter() - self._origin) * 1_000_000, 1)
+
+    @contextmanager
+    def span(self, name: str, cat: str = "phase", **args: Any):
+        """Record a span; the yielded dict can be filled with extra args (exit code, status, ...)"""
+        start = self._now_us()
+        try:
+            yield args
+        except BaseException as e:
+            args.setdefault("error", f"{type(e).__name__}: {e}"[:500])
+            raise
+        finally:
+            event = {
+                "name": name,
+                "cat": cat,
+                "ph": "X",
+                "ts": start,
+                "dur": max(round(self._now_us() - start, 1), 0.1),
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": args,
+            }
+            with self._lock:
+                self._threads.setdefault(event["tid"], threading.current_thread().name)
+                self.events.append(event)
+
+    def spans(self, cat: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [e for e in self.events if cat is None or e["cat"] == cat]
+
+    def write(self, path: Path) -> None:
+        pid = os.getpid()
+        with self._lock:
+            meta: List[Dict[str, Any]] = [
+                {"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": "push_and_deploy"}}
+            ]
+            meta.extend(
+                {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": tname}}
+                for tid, tname in self._threads.items()
+            )
+            events = sorted(self.events, key=lambda e: e["ts"])
+        path.write_text(
+            json.dumps({"traceEvents": meta + events, "displayTimeUnit": "ms"}),
+            encoding="utf-8",
+        )
+
+
+TRACER = Tracer()
+
+
+def pause(seconds: float, reason: str = "retry") -> None:
+    """Sleep, recorded as a wait span so backoff time is visible in the trace"""
+    seconds = BUDGET.backoff(seconds) if reason.endswith("retry") else BUDGET.timeout(seconds)
+    if seconds <= 0:
+        return
+    with TRACER.span(f"sleep:{reason}", cat="wait", seconds=seconds):
+        if CASSETTE is not None:
+            CASSETTE.advance(seconds)
+        if CASSETTE is None or not CASSETTE.replaying:
+            time.sleep(seconds)
+
+
+# ---------------- Record / replay ----------------
+
+# Env vars stored in a cassette so replays build the same API URLs (never the token)
+CASSETTE_ENV = ("VERCEL_PROJECT_ID", "VERCEL_ORG_ID")
+
+
+class Cassette:
+    """Subprocess and HTTP exchanges of a run, recorded (--record) or served back (--replay).
+
+    Each interaction is stored with its start offset, duration and position
+    on a simulated clock that only pauses and recorded durations advance.
+    Replay runs the same clock, sleeping for its advance divided by `speed`
+    (0 = no sleeping). GET requests, which is what the pollers make, get the
+    response recorded at or before the current simulated time, so an
+    unchanged run replays exactly and a changed poll or retry interval still
+    sees realistic state transitions. Commands and other requests are
+    served in recorded order per key, repeating the last answer once
+    exhausted. The simulated clock is shared, so concurrent calls replay
+    approximately rather than exactly in parallel.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: Path, mode: str = "record", speed: float = 1.0):
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self.clock = 0.0
+        self.interactions: List[Dict[str, Any]] = []
+        self.env: Dict[str, str] = {}
+        self.served = 0
+        self._origin = time.monotonic()
+        self._lock = threading.Lock()
+        self._by_key: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        self._cursor: Dict[Tuple[str, str], int] = {}
+        if mode == "record":
+            self.env = {name: os.environ[name] for name in CASSETTE_ENV if os.environ.get(name)}
+        else:
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError) as e:
+                raise DeployError(f"Cannot read cassette {path}: {e}", retryable=False)
+            if data.get("version") != self.VERSION:
+                raise DeployError(f"Unsupported cassette version in {path}: {data.get('version')}", retryable=False)
+            self.env = data.get("env") or {}
+            self.interactions = data.get("interactions") or []
+            for item in self.interactions:
+                self._by_key.setdefault((item["kind"], item["key"]), []).append(item)
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    @staticmethod
+    def shell_key(cmd: List[str], cwd: Optional[Path]) -> str:
+        key = " ".join(cmd)
+        if cwd is not None and Path(cwd) != REPO_ROOT:
+            try:
+                key = f"({Path(cwd).relative_to(REPO_ROOT)}) {key}"
+            except ValueError:
+                key = f"({cwd}) {key}"
+        return key
+
+    def record(self, kind: str, key: str, started: float, **data: Any) -> None:
+        elapsed = round(time.monotonic() - started, 6)
+        with self._lock:
+            self.interactions.append({
+                "kind": kind,
+                "key": key,
+                "t": round(started - self._origin, 6),
+                "v": round(self.clock, 6),
+                "elapsed": elapsed,
+                **data,
+            })
+            self.clock += elapsed
+
+    def lookup(self, kind: str, key: str) -> Dict[str, Any]:
+        with self._lock:
+            items = self._by_key.get((kind, key))
+            if not items:
+                raise CassetteMiss(f"No recorded {kind} interaction for: {key}")
+            if kind == "http_get" or key.startswith("GET "):
+                chosen = items[0]
+                now = round(self.clock, 6) + 1e-6
+                for item in items:
+                    if item["v"] > now:
+                        break
+                    chosen = item
+            else:
+                n = self._cursor.get((kind, key), 0)
+                chosen = items[min(n, len(items) - 1)]
+                self._cursor[(kind, key)] = n + 1
+            self.served += 1
+        self.advance(chosen.get("elapsed", 0.0))
+        return chosen
+
+    def advance(self, seconds: float) -> None:
+        """Move the simulated clock; when replaying, sleep for the compressed interval"""
+        if seconds <= 0:
+            return
+        with self._lock:
+            self.clock += seconds
+        if self.replaying and self.speed > 0:
+            time.sleep(seconds / self.speed)
+
+    def apply_env(self) -> None:
+        """Replay: provide the recorded project ids and a placeholder token"""
+        for name, value in self.env.items():
+            os.environ.setdefault(name, value)
+        os.environ.setdefault("VERCEL_TOKEN", "replay")
+
+    def save(self) -> None:
+        with self._lock:
+            data = {
+                "version": self.VERSION,
+                "recorded_at": datetime.now(timezone.utc).isoformat(),
+                "duration_secs": round(time.monotonic() - self._origin, 3),
+                "env": self.env,
+                "simulated_secs": round(self.clock, 3),
+                "interactions": sorted(self.interactions, key=lambda item: item["t"]),
+            }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps(data, indent=1), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+
+# Active cassette (set by --record / --replay)
+CASSETTE: Optional[Cassette] = None
+
+
+class ShellAccounting:
+    """Per-command subprocess accounting (enabled by --profile)"""
+
+    def __init__(self):
+        self.enabled = False
+        self.entries: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def reset(self, enabled: bool) -> None:
+        with self._lock:
+            self.enabled = enabled
+            self.entries = []
+
+    @contextmanager
+    def attempt(self, number: int):
+        """Mark subprocesses started inside the block as retry attempt `number`"""
+        previous = getattr(self._local, "attempt", 1)
+        self._local.attempt = number
+        try:
+            yield
+        finally:
+            self._local.attempt = previous
+
+    def record(self, cmd: List[str], wall: float, res: Optional[subprocess.CompletedProcess]) -> None:
+        entry = {
+            "argv": list(cmd),
+            "wall_secs": round(wall, 6),
+            "exit_code": res.returncode if res is not None else None,
+            "stdout_bytes": len((res.stdout or "").encode("utf-8", "replace")) if res is not None else 0,
+            "stderr_bytes": len((res.stderr or "").encode("utf-8", "replace")) if res is not None else 0,
+            "attempt": getattr(self._local, "attempt", 1),
+        }
+        with self._lock:
+            self.entries.append(entry)
+
+
+SHELL_ACCOUNTING = ShellAccounting()
+
+
+def split_progress(text: str) -> List[str]:
+    """Split progress output on CR as well as LF (git redraws its meters with CR)"""
+    return [line for line in re.split(r"[\r\n]", text) if line.strip()]
 
 
 class Shell:
+    @staticmethod
+    def _pump_lines(pipe: Any, chunks: List[str], on_line: Callable[[str], None]) -> None:
+        """Read a pipe as data arrives, handing every CR/LF-terminated line to on_line"""
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        pending = ""
+        while True:
+            data = pipe.buffer.read1(8192)
+            text = decoder.decode(data, final=not data)
+            chunks.append(text)
+            parts = re.split(r"[\r\n]", pending + text)
+            pending = parts.pop() if data else ""
+            for line in parts + ([pending] if not data else []):
+                if line.strip():
+                    try:
+                        on_line(line)
+                    except Exception as e:  # progress display must never break the command
+                        logging.getLogger(__name__).debug(f"progress callback failed: {e}")
+            if not data:
+                return
+
+    @staticmethod
+    def _communicate_streaming(
+        proc: subprocess.Popen, timeout: float, on_stderr: Callable[[str], None]
+    ) -> Tuple[str, str]:
+        stdout: List[str] = []
+        stderr: List[str] = []
+        readers = [
+            threading.Thread(target=lambda: stdout.append(proc.stdout.read()), daemon=True),
+            threading.Thread(target=Shell._pump_lines, args=(proc.stderr, stderr, on_stderr), daemon=True),
+        ]
+        for reader in readers:
+            reader.start()
+        proc.wait(timeout=timeout)
+        for reader in readers:
+            reader.join()
+        return "".join(stdout), "".join(stderr)
+
+    @staticmethod
+    def _spawn(
+        cmd: List[str], cwd: Optional[Path], timeout: float, env: Optional[Dict[str, str]], clamped: bool,
+        on_stderr: Optional[Callable[[str], None]] = None,
+    ) -> subprocess.CompletedProcess:
+        # Own process group, so a timeout also kills grandchildren (CLI
+        # helpers) that would otherwise hold the pipes open past it
+        proc = subprocess.Popen(
+            cmd,
+            cwd=str(cwd or REPO_ROOT),
+            text=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env={**os.environ, **env} if env else None,
+            start_new_session=True,
+        )
+        try:
+            if on_stderr is None:
+                stdout, stderr = proc.communicate(timeout=timeout)
+            else:
+                stdout, stderr = Shell._communicate_streaming(proc, timeout, on_stderr)
+        except BaseException as e:
+            if clamped and isinstance(e, subprocess.TimeoutExpired):
+                BUDGET.note_exhausted(" ".join(cmd[:3]))
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except OSError:
+                pass
+            if on_stderr is None:
+                proc.communicate()
+            else:
+                proc.wait()  # the reader threads drain and close the pipes
+            raise
+        return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+
+    @staticmethod
+    def _exec(
+        cmd: List[str], cwd: Optional[Path], check: bool, timeout: int, env: Optional[Dict[str, str]] = None,
+        on_stderr: Optional[Callable[[str], None]] = None,
+    ) -> subprocess.CompletedProcess:
+        if BUDGET.expired():
+            BUDGET.note_exhausted(" ".join(cmd[:3]))
+            raise subprocess.TimeoutExpired(cmd, 0)
+        clamped = BUDGET.timeout(timeout) < timeout
+        timeout = BUDGET.timeout(timeout)
+        start = time.perf_counter()
+        res: Optional[subprocess.CompletedProcess] = None
+        try:
+            with TRACER.span(" ".join(cmd[:3]), cat="subprocess", argv=cmd) as span:
+                if CASSETTE is not None and CASSETTE.replaying:
+                    item = CASSETTE.lookup("shell", Cassette.shell_key(cmd, cwd))
+                    if item.get("timeout"):
+                        raise subprocess.TimeoutExpired(cmd, timeout)
+                    res = subprocess.CompletedProcess(cmd, item["returncode"], item["stdout"], item["stderr"])
+                    for line in split_progress(res.stderr) if on_stderr else []:
+                        on_stderr(line)
+                elif CASSETTE is not None:
+                    started = time.monotonic()
+                    try:
+                        res = Shell._spawn(cmd, cwd, timeout, env, clamped, on_stderr)
+                    except subprocess.TimeoutExpired:
+                        CASSETTE.record("shell", Cassette.shell_key(cmd, cwd), started, timeout=True)
+                        raise
+                    CASSETTE.record("shell", Cassette.shell_key(cmd, cwd), started,
+                                    returncode=res.returncode, stdout=res.stdout, stderr=res.stderr)
+                else:
+                    res = Shell._spawn(cmd, cwd, timeout, env, clamped, on_stderr)
+                span["exit_code"] = res.returncode
+        finally:
+            if SHELL_ACCOUNTING.enabled:
+                SHELL_ACCOUNTING.record(cmd, time.perf_counter() - start, res)
+        if check and res.returncode != 0:
+            raise subprocess.CalledProcessError(res.returncode, cmd, res.stdout, res.stderr)
+        return res
+
     @staticmethod
     def run(cmd: List[str], cwd: Optional[Path] = None, check: bool = True, timeout: int = 300) -> subprocess.CompletedProcess:
         try:
-            return subprocess.run(
-                cmd, 
-                cwd=str(cwd or REPO_ROOT), 
-                check=check, 
-                text=True, 
-                capture_output=True,
-                timeout=timeout
-            )
+            return Shell._exec(cmd, cwd, check, timeout)
         except subprocess.TimeoutExpired as e:
-            raise DeployError(f"Command timed out after {timeout}s: {' '.join(cmd)}", DeployStatus.TIMEOUT)
+            raise DeployError(f"Command timed out after {e.timeout:g}s: {' '.join(cmd)}", DeployStatus.TIMEOUT)
         except subprocess.CalledProcessError as e:
             raise DeployError(f"Command failed with exit code {e.returncode}: {' '.join(cmd)}\nSTDOUT: {e.stdout}\nSTDERR: {e.stderr}")
 
     @staticmethod
-    def run_no_check(cmd: List[str], cwd: Optional[Path] = None, timeout: int = 300) -> subprocess.CompletedProcess:
+    def run_no_check(
+        cmd: List[str], cwd: Optional[Path] = None, timeout: int = 300, env: Optional[Dict[str, str]] = None,
+        on_stderr: Optional[Callable[[str], None]] = None,
+    ) -> subprocess.CompletedProcess:
+        """Run without raising on a non-zero exit; on_stderr receives stderr lines as they arrive"""
         try:
-            return subprocess.run(
-                cmd, 
-                cwd=str(cwd or REPO_ROOT), 
-                check=False, 
-                text=True, 
-                capture_output=True,
-                timeout=timeout
-            )
+            return Shell._exec(cmd, cwd, False, timeout, env, on_stderr)
         except subprocess.TimeoutExpired as e:
-            raise DeployError(f"Command timed out after {timeout}s: {' '.join(cmd)}", DeployStatus.TIMEOUT)
+            raise DeployError(f"Command timed out after {e.timeout:g}s: {' '.join(cmd)}", DeployStatus.TIMEOUT)
 
     @staticmethod
     def run_with_retry(cmd: List[str], max_retries: int = 3, delay: int = 5, cwd: Optional[Path] = None) -> subprocess.CompletedProcess:
@@ -194,26 +725,30 @@ class Shell:
         last_error = None
         for attempt in range(max_retries):
             try:
-                return Shell.run(cmd, cwd=cwd, check=True)
+                with SHELL_ACCOUNTING.attempt(attempt + 1):
+                    return Shell.run(cmd, cwd=cwd, check=True)
             except DeployError as e:
                 last_error = e
-                if attempt < max_retries - 1:
+                if attempt < max_retries - 1 and not BUDGET.expired():
                     print(f"Attempt {attempt + 1} failed, retrying in {delay}s...")
-                    time.sleep(delay)
+                    count_retry()
+                    pause(delay)
                 else:
                     raise e
         raise last_error or DeployError("Max retries exceeded")
 
 
 # Enhanced logging setup
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_DATEFMT = '%Y-%m-%d %H:%M:%S'
+
+
 def setup_logging(verbose: bool = False) -> logging.Logger:
     """Setup enhanced logging with proper formatting"""
     level = logging.DEBUG if verbose else logging.INFO
-    logging.basicConfig(
-        level=level,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
+    logging.basicConfig(level=level, format=LOG_FORMAT, datefmt=LOG_DATEFMT)
+    # basicConfig is a no-op once handlers exist (daemon, run_cli); still honour --verbose
+    logging.getLogger().setLevel(level)
     return logging.getLogger(__name__)
 
 @contextmanager
@@ -256,12 +791,20 @@ def is_rebase_in_progress(repo_root: Path) -> bool:
     return (repo_root / ".git/rebase-apply").exists() or (repo_root / ".git/rebase-merge").exists()
 
 
+# Set once the checkout has been verified; a resident daemon skips re-discovery
+_GIT_REPO_VERIFIED = False
+
+
 def ensure_git_repo() -> None:
     """Ensure we're in a git repository with enhanced error handling"""
+    global _GIT_REPO_VERIFIED
+    if _GIT_REPO_VERIFIED:
+        return
     try:
         res = Shell.run_no_check(["git", "rev-parse", "--is-inside-work-tree"])
         if res.returncode != 0 or res.stdout.strip() != "true":
             raise GitError("Not inside a git repository", retryable=False)
+        _GIT_REPO_VERIFIED = True
     except DeployError:
         raise
     except Exception as e:
@@ -296,11 +839,11 @@ def get_actor() -> Tuple[str, str]:
         return name, email
 
 
-def get_commit_sha_and_title() -> Tuple[str, str]:
+def get_commit_sha_and_title(cwd: Optional[Path] = None) -> Tuple[str, str]:
     """Get commit info with error handling"""
     try:
-        sha_res = Shell.run(["git", "rev-parse", "HEAD"])
-        title_res = Shell.run(["git", "log", "-1", "--pretty=%s"])
+        sha_res = Shell.run(["git", "rev-parse", "HEAD"], cwd=cwd)
+        title_res = Shell.run(["git", "log", "-1", "--pretty=%s"], cwd=cwd)
         
         sha = sha_res.stdout.strip()
         title = title_res.stdout.strip()
@@ -312,10 +855,24 @@ def get_commit_sha_and_title() -> Tuple[str, str]:
         raise GitError(f"Failed to get commit info: {e}")
 
 
+def staging_paths(config: DeployConfig) -> List[str]:
+    """INCLUDE_PATHS plus, in multi-project mode, every manifest project's paths"""
+    paths = list(INCLUDE_PATHS)
+    if config.projects_manifest:
+        for spec in load_projects_manifest(config.projects_manifest):
+            for pattern in spec.paths:
+                if any(ch in pattern for ch in "*?["):
+                    matches = [str(m.relative_to(REPO_ROOT)) for m in sorted(REPO_ROOT.glob(pattern))]
+                else:
+                    matches = [pattern.rstrip("/")]
+                paths.extend(m for m in matches if m not in paths)
+    return paths
+
+
 def git_add_includes(config: DeployConfig) -> None:
     """Stage only included paths with retry mechanism"""
     try:
-        for p in INCLUDE_PATHS:
+        for p in staging_paths(config):
             path = REPO_ROOT / p
             if path.exists():
                 # Force-add the .vercel/project.json even if ignored elsewhere
@@ -327,20 +884,21 @@ def git_add_includes(config: DeployConfig) -> None:
         raise GitError(f"Failed to stage files: {e}")
 
 
-def git_has_staged_changes() -> bool:
+def git_has_staged_changes(cwd: Optional[Path] = None) -> bool:
     """Check staged changes with error handling"""
     try:
-        res = Shell.run_no_check(["git", "diff", "--cached", "--name-only"])
+        res = Shell.run_no_check(["git", "diff", "--cached", "--name-only"], cwd=cwd)
         return len(res.stdout.strip()) > 0
     except DeployError:
         return False
 
 
-def git_commit(message: str, config: DeployConfig) -> Optional[str]:
-    """Commit changes with retry mechanism"""
+def git_commit(message: str, config: DeployConfig, stage: bool = True) -> Optional[str]:
+    """Commit changes with retry mechanism (stage=False when the index is already up to date)"""
     try:
         # Stage includes first
-        git_add_includes(config)
+        if stage:
+            git_add_includes(config)
         
         # If still nothing staged, return None
         if not git_has_staged_changes():
@@ -356,8 +914,14 @@ def git_commit(message: str, config: DeployConfig) -> Optional[str]:
         raise GitError(f"Failed to commit changes: {e}")
 
 
-def git_push(branch: str, config: DeployConfig) -> None:
-    """Push to remote with enhanced error handling and retry"""
+def git_push(branch: str, config: DeployConfig) -> List["PushResult"]:
+    """Push to the remote (and any mirrors) with enhanced error handling and retry"""
+    if config.use_worktree:
+        # The deploy worktree's detached HEAD goes straight to the remote branch
+        head = Shell.run(["git", "rev-parse", "HEAD"], cwd=worktree_path(branch)).stdout.strip()
+        results = push_to_remotes(branch, config, source=head)
+        check_push_quorum(results, config, f"Failed to push to {branch}")
+        return results
     try:
         # Ensure we are on the target branch; switch if needed
         curr = current_branch()
@@ -368,13 +932,13 @@ def git_push(branch: str, config: DeployConfig) -> None:
                 Shell.run_with_retry(["git", "checkout", "-b", branch], config.max_retries, config.retry_delay)
             else:
                 Shell.run_with_retry(["git", "checkout", branch], config.max_retries, config.retry_delay)
-        
-        # Push to origin with retry
-        Shell.run_with_retry(["git", "push", "-u", "origin", branch], config.max_retries, config.retry_delay)
-        
     except DeployError as e:
         raise GitError(f"Failed to push to {branch}: {e}")
 
+    results = push_to_remotes(branch, config)
+    check_push_quorum(results, config, f"Failed to push to {branch}")
+    return results
+
 
 def git_rollback(previous_sha: str, config: DeployConfig) -> None:
     """Rollback to previous commit if deployment fails"""
@@ -383,13 +947,261 @@ def git_rollback(previous_sha: str, config: DeployConfig) -> None:
         
     try:
         print(f"Rolling back to previous commit: {previous_sha}")
-        Shell.run_with_retry(["git", "reset", "--hard", previous_sha], config.max_retries, config.retry_delay)
-        Shell.run_with_retry(["git", "push", "--force", config.remote_name, current_branch()], config.max_retries, config.retry_delay)
+        if config.use_worktree:
+            Shell.run_with_retry(["git", "reset", "-q", "--hard", previous_sha], config.max_retries, config.retry_delay,
+                                 cwd=worktree_path(config.target_branch))
+            results = push_to_remotes(config.target_branch, config, force=True, source=previous_sha)
+        else:
+            Shell.run_with_retry(["git", "reset", "--hard", previous_sha], config.max_retries, config.retry_delay)
+            results = push_to_remotes(current_branch(), config, force=True)
+        check_push_quorum(results, config, "Failed to force-push the rollback")
         print("Rollback completed successfully")
     except DeployError as e:
         print(f"Rollback failed: {e}", file=sys.stderr)
 
 
+def rollback_within_budget(original_sha: str, config: DeployConfig, record: "DeployRecord", logger: logging.Logger) -> None:
+    """Roll back unless the time budget is too low to finish the force-push"""
+    if not BUDGET.allows(ROLLBACK_MIN_SECS):
+        BUDGET.note_exhausted("rollback")
+        logger.warning(f"Skipping rollback: time budget nearly exhausted; roll back manually to {original_sha}")
+        return
+    logger.info("Attempting rollback...")
+    with record.phase("rollback"):
+        git_rollback(original_sha, config)
+
+
+# ---------------- Mirror push ----------------
+
+# A `git push --progress` meter line: "Writing objects:  45% (450/1000), 12.00 MiB | 3.00 MiB/s"
+_PROGRESS_LINE = re.compile(
+    r"^(?P<phase>[A-Z][a-z]+(?: [a-z]+)*):\s+(?P<pct>\d+)% \((?P<done>\d+)/(?P<total>\d+)\)"
+    r"(?:, (?P<size>[\d.]+) (?P<unit>bytes|KiB|MiB|GiB)(?: \| (?P<rate>[\d.]+) (?P<rate_unit>bytes|KiB|MiB|GiB)/s)?)?"
+)
+_SIZE_UNITS = {"bytes": 1, "KiB": 1024, "MiB": 1024 ** 2, "GiB": 1024 ** 3}
+
+
+def _fmt_bytes(num: float) -> str:
+    for unit in ("bytes", "KiB", "MiB"):
+        if num < 1024:
+            return f"{num:.0f} {unit}" if unit == "bytes" else f"{num:.1f} {unit}"
+        num /= 1024
+    return f"{num:.2f} GiB"
+
+
+class PushProgress:
+    """Parses `git push --progress` stderr as it streams and logs a throttled progress line"""
+
+    LOG_EVERY_SECS = 2.0
+
+    def __init__(self, label: str):
+        self.label = label
+        self.phase = ""
+        self.objects = 0
+        self.bytes = 0
+        self.rate = 0.0  # git's current transfer rate, bytes/s
+        self.peak_rate = 0.0
+        self._logged_at = 0.0
+        self._finished: set = set()
+
+    def feed(self, line: str) -> None:
+        match = _PROGRESS_LINE.match(line.strip())
+        if not match:
+            return
+        self.phase = match["phase"]
+        if self.phase != "Writing objects":
+            self._log(match)
+            return
+        self.objects = int(match["done"])
+        if match["size"]:
+            self.bytes = int(float(match["size"]) * _SIZE_UNITS[match["unit"]])
+        if match["rate"]:
+            self.rate = float(match["rate"]) * _SIZE_UNITS[match["rate_unit"]]
+            self.peak_rate = max(self.peak_rate, self.rate)
+        self._log(match)
+
+    def _log(self, match: "re.Match[str]") -> None:
+        now = time.monotonic()
+        phase = match["phase"]
+        if match["pct"] == "100":
+            if phase in self._finished:
+                return  # git redraws the final meter with ", done."
+            self._finished.add(phase)
+        elif phase != "Writing objects" or now - self._logged_at < self.LOG_EVERY_SECS:
+            return  # only the transfer itself is logged while in progress
+        text = f"push {self.label}: {phase} {match['pct']}% ({match['done']}/{match['total']})"
+        if phase == "Writing objects" and self.bytes:
+            text += f", {_fmt_bytes(self.bytes)}"
+            if self.rate:
+                text += f" at {_fmt_bytes(self.rate)}/s"
+        logging.getLogger(__name__).info(text)
+        self._logged_at = now
+
+
+@dataclass
+class PushResult:
+    remote: str
+    ok: bool = False
+    attempts: int = 0
+    duration_secs: float = 0.0  # including retries
+    transfer_secs: float = 0.0  # the successful attempt of every batch
+    objects: int = 0
+    bytes: int = 0
+    peak_rate: float = 0.0  # highest rate git reported, bytes/s
+    batches: int = 0  # pushes that completed (more than one for a batched history)
+    error: str = ""
+
+    @property
+    def throughput(self) -> Optional[float]:
+        """Bytes per second of the successful attempt"""
+        return self.bytes / self.transfer_secs if self.bytes and self.transfer_secs else None
+
+    def describe(self) -> str:
+        text = f"{self.remote}: {'ok' if self.ok else 'FAILED'} in {self.duration_secs:.2f}s, {self.attempts} attempt(s)"
+        if self.batches > 1:
+            text += f", {self.batches} batches"
+        if self.ok:
+            text += f", {self.objects} objects, {_fmt_bytes(self.bytes)}"
+            if self.throughput:
+                text += f" at {_fmt_bytes(self.throughput)}/s"
+        elif self.error:
+            text += f" ({self.error})"
+        return text
+
+
+def push_remotes(config: DeployConfig) -> List[str]:
+    """The primary remote followed by the mirrors, without duplicates"""
+    return list(dict.fromkeys([config.remote_name, *config.mirror_remotes]))
+
+
+def push_batches(remote: str, rev: str, config: DeployConfig) -> List[str]:
+    """Intermediate commits to push first when the history of `rev` not yet on `remote` exceeds push_batch_mb.
+
+    Commits along the first-parent chain are split into equal-count batches, enough
+    of them that an average batch stays under the limit; the branch tip is always
+    the final push and is not included.
+    """
+    if config.push_batch_mb <= 0:
+        return []
+    pending = Shell.run_no_check(["git", "rev-list", "--objects", "--disk-usage", rev, "--not", f"--remotes={remote}"])
+    size = pending.stdout.strip()
+    limit = int(config.push_batch_mb * 1024 * 1024)
+    if pending.returncode != 0 or not size.isdigit() or int(size) <= limit:
+        return []
+    commits = Shell.run_no_check(
+        ["git", "rev-list", "--reverse", "--first-parent", rev, "--not", f"--remotes={remote}"]
+    ).stdout.split()
+    count = min(-(-int(size) // limit), len(commits))
+    if count <= 1:
+        return []
+    print(f"Pushing {_fmt_bytes(int(size))} of history to {remote} in {count} batches of ~{len(commits) // count} commits")
+    step = len(commits) / count
+    return [commits[int(step * i) - 1] for i in range(1, count)]
+
+
+def _push_error(stderr: str, returncode: int) -> str:
+    lines = [line.strip() for line in stderr.splitlines() if line.strip()]
+    wanted = [line for line in lines if line.startswith(("fatal:", "error:", "!", "remote: error"))]
+    return (wanted or lines or [f"git push exited {returncode}"])[0][:300]
+
+
+def _push_with_retries(cmd: List[str], label: str, config: DeployConfig, result: PushResult) -> bool:
+    """One push command with its own retries, streaming progress into `result`"""
+    for attempt in range(1, config.max_retries + 1):
+        result.attempts += 1
+        progress = PushProgress(label)
+        attempt_start = time.perf_counter()
+        rejected = False
+        try:
+            with SHELL_ACCOUNTING.attempt(attempt):
+                res = Shell.run_no_check(cmd, timeout=config.push_timeout_secs, env={"GIT_TERMINAL_PROMPT": "0"},
+                                         on_stderr=progress.feed)
+        except DeployError as e:
+            result.error = str(e)
+        else:
+            if res.returncode == 0:
+                result.error = ""
+                result.transfer_secs = round(result.transfer_secs + time.perf_counter() - attempt_start, 3)
+                result.objects += progress.objects
+                result.bytes += progress.bytes
+                result.peak_rate = max(result.peak_rate, progress.peak_rate)
+                return True
+            result.error = _push_error(res.stderr, res.returncode)
+            rejected = "[rejected]" in res.stderr or "[remote rejected]" in res.stderr
+        if rejected or attempt == config.max_retries or BUDGET.expired():
+            return False
+        print(f"Push to {label} failed (attempt {attempt}), retrying in {config.retry_delay * attempt}s...")
+        count_retry()
+        pause(config.retry_delay * attempt, "push_retry")
+    return False
+
+
+def push_remote(
+    remote: str, branch: str, config: DeployConfig, set_upstream: bool = False, force: bool = False,
+    source: Optional[str] = None,
+) -> PushResult:
+    """Push to one remote with its own timeout and retries; rejections are not retried.
+
+    `source` pushes that commit to `branch` instead of the local branch of that name.
+    """
+    result = PushResult(remote)
+    start = time.perf_counter()
+    with TRACER.span(f"push {remote}", cat="push", remote=remote) as span:
+        steps = [] if force else push_batches(remote, source or branch, config)
+        refspecs = [f"{sha}:refs/heads/{branch}" for sha in steps] + [f"{source}:refs/heads/{branch}" if source else branch]
+        for number, refspec in enumerate(refspecs, 1):
+            final = number == len(refspecs)
+            cmd = ["git", "push", "--progress", *(["-u"] if set_upstream and final and not source else []),
+                   *(["--force"] if force else []), remote, refspec]
+            label = remote if len(refspecs) == 1 else f"{remote} [batch {number}/{len(refspecs)}]"
+            if not _push_with_retries(cmd, label, config, result):
+                break
+            result.batches = number
+        result.ok = result.batches == len(refspecs)
+        span.update(ok=result.ok, attempts=result.attempts, batches=result.batches,
+                    objects=result.objects, bytes=result.bytes)
+    result.duration_secs = round(time.perf_counter() - start, 3)
+    return result
+
+
+def push_to_remotes(branch: str, config: DeployConfig, force: bool = False, source: Optional[str] = None) -> List[PushResult]:
+    """Push `branch` (or the `source` commit to it) to the primary remote and every mirror concurrently"""
+    remotes = push_remotes(config)
+    if len(remotes) == 1:
+        return [push_remote(remotes[0], branch, config, set_upstream=True, force=force, source=source)]
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=len(remotes), thread_name_prefix="push") as pool:
+        futures = [
+            pool.submit(push_remote, remote, branch, config, set_upstream=remote == config.remote_name, force=force,
+                        source=source)
+            for remote in remotes
+        ]
+        results = [future.result() for future in futures]
+    for result in results:
+        print(f"  {'✅' if result.ok else '❌'} {result.describe()}")
+    return results
+
+
+def check_push_quorum(results: List[PushResult], config: DeployConfig, what: str) -> None:
+    """Raise unless enough remotes accepted the push"""
+    succeeded = sum(1 for r in results if r.ok)
+    quorum = min(max(config.push_quorum or len(results), 1), len(results))
+    failed = [r for r in results if not r.ok]
+    if succeeded < quorum:
+        detail = "; ".join(f"{r.remote}: {r.error}" for r in failed)
+        if len(results) == 1:
+            raise GitError(f"{what}: {detail}")
+        raise GitError(f"{what}: {succeeded}/{len(results)} remotes succeeded, quorum is {quorum} ({detail})")
+    if len(results) > 1:
+        print(f"Push quorum met: {succeeded}/{len(results)} remotes (quorum {quorum})")
+    if failed:
+        print(f"⚠️  Not pushed to {', '.join(r.remote for r in failed)}", file=sys.stderr)
+        if not results[0].ok:
+            print(f"⚠️  Primary remote {results[0].remote} was not updated; its deploy integration will not see this push",
+                  file=sys.stderr)
+
+
 # ---------------- Repository Management Functions ----------------
 
 def get_remote_url(remote_name: str = "origin") -> Optional[str]:
@@ -533,8 +1345,8 @@ def setup_repository_and_branch(config: DeployConfig) -> str:
                     raise GitError(f"Remote '{config.target_repo}' does not exist")
                 config.remote_name = config.target_repo
         
-        # Handle branch operations
-        if config.switch_branch and config.target_branch != original_branch:
+        # Handle branch operations (a deploy worktree never switches the primary checkout)
+        if config.switch_branch and not config.use_worktree and config.target_branch != original_branch:
             logger.info(f"Switching to target branch: {config.target_branch}")
             
             if not branch_exists(config.target_branch) and not branch_exists(config.target_branch, remote=True):
@@ -550,12 +1362,18 @@ def setup_repository_and_branch(config: DeployConfig) -> str:
         # Fetch latest changes from remote
         if config.push_to_remote:
             logger.info("Fetching latest changes from remote")
-            Shell.run_with_retry(["git", "fetch", config.remote_name], config.max_retries, config.retry_delay)
-        
+            with TRACER.span("fetch"):
+                Shell.run_with_retry(["git", "fetch", config.remote_name], config.max_retries, config.retry_delay)
+
+        if config.use_worktree:
+            # Rollback target is the commit the worktree starts from, not the primary HEAD
+            return prepare_worktree(config, logger)
         return original_sha
         
     except DeployError as e:
         logger.error(f"Repository setup failed: {e}")
+        if config.use_worktree:
+            raise e
         # Attempt to restore original state
         try:
             Shell.run_with_retry(["git", "checkout", original_branch], config.max_retries, config.retry_delay)
@@ -564,8 +1382,311 @@ def setup_repository_and_branch(config: DeployConfig) -> str:
         raise e
 
 
+# ---------------- Deploy worktrees ----------------
+
+DEPLOY_WORKTREES_DIR = REPO_ROOT / ".git" / "deploy-worktrees"
+# Untracked build state a reused worktree keeps between runs even where it isn't gitignored
+WORKTREE_WARM_PATHS: List[str] = [".next", ".vercel", "node_modules"]
+WORKTREE_SNAPSHOTS_KEPT = 10
+
+
+def worktree_path(branch: str) -> Path:
+    """The deploy worktree for `branch`: one per branch, reused across runs"""
+    return DEPLOY_WORKTREES_DIR / re.sub(r"[^A-Za-z0-9._-]+", "-", branch)
+
+
+def deploy_checkout(config: DeployConfig) -> Path:
+    """Where the pipeline commits, builds and runs the Vercel CLI"""
+    return worktree_path(config.target_branch) if config.use_worktree else REPO_ROOT
+
+
+def _snapshot_refs(branch: str) -> str:
+    # refs/deploy-worktrees/<branch>/<deployed commit> -> the snapshot it was made from
+    return f"refs/deploy-worktrees/{worktree_path(branch).name}/"
+
+
+def _resolve_commit(rev: str, cwd: Optional[Path] = None) -> Optional[str]:
+    res = Shell.run_no_check(["git", "rev-parse", "--verify", "-q", f"{rev}^{{commit}}"], cwd=cwd)
+    return res.stdout.strip() if res.returncode == 0 else None
+
+
+def worktree_base(config: DeployConfig) -> str:
+    """Commit a deploy of target_branch builds on.
+
+    The local branch while it has commits the remote-tracking branch lacks,
+    otherwise the (just fetched) remote-tracking branch; a branch that exists
+    nowhere starts from source_branch or the primary HEAD when create_branch
+    is set.
+    """
+    branch = config.target_branch
+    local = _resolve_commit(f"refs/heads/{branch}")
+    remote = _resolve_commit(f"refs/remotes/{config.remote_name}/{branch}")
+    if local and remote:
+        behind = Shell.run_no_check(["git", "merge-base", "--is-ancestor", local, remote]).returncode == 0
+        return remote if behind else local
+    if local or remote:
+        return local or remote
+    if not config.create_branch:
+        raise GitError(f"Branch '{branch}' does not exist and create_branch is False")
+    source = config.source_branch or "HEAD"
+    base = _resolve_commit(source)
+    if not base:
+        raise GitError(f"Source branch '{source}' does not exist")
+    return base
+
+
+def prepare_worktree(config: DeployConfig, logger: logging.Logger) -> str:
+    """Create or reuse the target branch's deploy worktree and reset it to worktree_base.
+
+    The worktree stays detached so the branch remains free to be checked out
+    elsewhere; `reset --hard` plus `clean -fd` (without -x, and excluding
+    WORKTREE_WARM_PATHS) leaves build state such as .next/ and node_modules/
+    warm for the next run.
+    """
+    import shutil
+
+    path = worktree_path(config.target_branch)
+    base = worktree_base(config)
+    try:
+        if (path / ".git").is_file() and _resolve_commit("HEAD", cwd=path):
+            logger.info(f"Reusing deploy worktree {path} at {base[:7]}")
+            Shell.run_with_retry(["git", "reset", "-q", "--hard", base], config.max_retries, config.retry_delay, cwd=path)
+            excludes = [f"--exclude=/{p}" for p in WORKTREE_WARM_PATHS]
+            Shell.run_with_retry(["git", "clean", "-fdq", *excludes], config.max_retries, config.retry_delay, cwd=path)
+        else:
+            # Drop registrations of deleted worktrees and any half-created directory
+            Shell.run_no_check(["git", "worktree", "prune"])
+            shutil.rmtree(path, ignore_errors=True)
+            DEPLOY_WORKTREES_DIR.mkdir(parents=True, exist_ok=True)
+            logger.info(f"Creating deploy worktree {path} at {base[:7]}")
+            with TRACER.span("worktree add"):
+                Shell.run_with_retry(["git", "worktree", "add", "-q", "--detach", str(path), base],
+                                     config.max_retries, config.retry_delay)
+    except DeployError as e:
+        raise GitError(f"Failed to prepare deploy worktree for '{config.target_branch}': {e}")
+    return base
+
+
+def stage_private_index(index: Path, config: DeployConfig) -> Dict[str, str]:
+    """Stage the staging paths into `index`, a copy of the primary index; returns the env selecting it.
+
+    Starting from a copy keeps the primary's stat cache valid, so only files
+    that actually changed are rehashed.
+    """
+    import shutil
+
+    primary = REPO_ROOT / Shell.run(["git", "rev-parse", "--git-path", "index"]).stdout.strip()
+    if primary.is_file():
+        shutil.copyfile(primary, index)
+    elif index.exists():
+        index.unlink()
+    env = {"GIT_INDEX_FILE": str(index)}
+    for p in staging_paths(config):
+        if (REPO_ROOT / p).exists():
+            res = Shell.run_no_check(["git", "add", *(["-f"] if p == ".vercel/project.json" else []), p], env=env)
+            if res.returncode != 0:
+                raise GitError(f"Failed to stage {p}: {res.stderr.strip()}")
+    return env
+
+
+def write_index_tree(env: Optional[Dict[str, str]] = None) -> str:
+    """Tree id of an index (the primary one unless `env` selects another)"""
+    res = Shell.run_no_check(["git", "write-tree"], env=env)
+    if res.returncode != 0:
+        raise GitError(f"Failed to write the staged tree: {res.stderr.strip()}")
+    return res.stdout.strip()
+
+
+def snapshot_changes(config: DeployConfig, message: str, index: Optional[Path] = None) -> Optional[str]:
+    """Commit the primary checkout's changes to the staging paths without touching its index.
+
+    The paths are staged into a copy of the index (or `index`, one already
+    kept staged by watch mode) and the resulting tree becomes an unreferenced
+    commit on top of the primary HEAD, or on top of the last deployed snapshot
+    while the worktree still contains that deploy, so that uncommitted work
+    deployed run after run only replays what changed since; None when the
+    tree matches that parent.
+    """
+    import tempfile
+
+    if index is not None:
+        tree = write_index_tree({"GIT_INDEX_FILE": str(index)})
+    else:
+        fd, scratch = tempfile.mkstemp(prefix="deploy-index-")
+        os.close(fd)
+        try:
+            tree = write_index_tree(stage_private_index(Path(scratch), config))
+        finally:
+            if os.path.exists(scratch):
+                os.unlink(scratch)
+
+    parent = deployed_snapshot(config) or _resolve_commit("HEAD")
+    if parent and tree == Shell.run(["git", "rev-parse", f"{parent}^{{tree}}"]).stdout.strip():
+        return None
+    return Shell.run(["git", "commit-tree", tree, *(["-p", parent] if parent else []), "-m", message]).stdout.strip()
+
+
+def worktree_commit(snapshot: Optional[str], message: str, config: DeployConfig) -> Optional[str]:
+    """Apply a snapshot_changes commit to the deploy worktree and commit it there (hooks run in the worktree)"""
+    if snapshot is None:
+        return None
+    path = worktree_path(config.target_branch)
+    try:
+        res = Shell.run_no_check(["git", "cherry-pick", "--no-commit", snapshot], cwd=path)
+        if res.returncode != 0:
+            conflicts = Shell.run_no_check(["git", "diff", "--name-only", "--diff-filter=U"], cwd=path).stdout.split()
+            Shell.run_no_check(["git", "reset", "-q", "--hard"], cwd=path)
+            detail = f"conflicts in {', '.join(conflicts)}" if conflicts else res.stderr.strip()
+            raise GitError(f"Local changes do not apply to '{config.target_branch}': {detail}")
+        if not git_has_staged_changes(cwd=path):
+            return None
+        Shell.run_with_retry(["git", "commit", "-q", "-m", message], config.max_retries, config.retry_delay, cwd=path)
+        return Shell.run(["git", "rev-parse", "HEAD"], cwd=path).stdout.strip()
+    except GitError:
+        raise
+    except DeployError as e:
+        raise GitError(f"Failed to commit in the deploy worktree: {e}")
+
+
+def deployed_snapshot(config: DeployConfig) -> Optional[str]:
+    """Snapshot behind the newest recorded deploy commit the worktree still contains (rollbacks drop out)"""
+    res = Shell.run_no_check(["git", "for-each-ref", "--format=%(refname:lstrip=-1) %(objectname)",
+                              _snapshot_refs(config.target_branch)])
+    snapshots = dict(line.split() for line in res.stdout.splitlines())
+    if not snapshots:
+        return None
+    # Descendants first, so the latest deploy wins even when several share a timestamp
+    history = Shell.run_no_check(["git", "rev-list", "--topo-order", "--max-count=1000", "HEAD"],
+                                 cwd=worktree_path(config.target_branch))
+    for sha in history.stdout.split():
+        if sha in snapshots:
+            return snapshots[sha]
+    return None
+
+
+def remember_worktree_deploy(snapshot: str, deployed: str, config: DeployConfig) -> None:
+    """Record a pushed snapshot for the next snapshot_changes to build on, keeping the newest few"""
+    prefix = _snapshot_refs(config.target_branch)
+    Shell.run_no_check(["git", "update-ref", f"{prefix}{deployed}", snapshot])
+    refs = Shell.run_no_check(["git", "for-each-ref", "--sort=-committerdate", "--format=%(refname)", prefix])
+    for ref in refs.stdout.splitlines()[WORKTREE_SNAPSHOTS_KEPT:]:
+        Shell.run_no_check(["git", "update-ref", "-d", ref])
+
+
+# ---------------- HTTP connection pool ----------------
+
+class HTTPConnectionPool:
+    """Keep-alive HTTP(S) connections reused across requests.
+
+    urlopen opens a new TCP+TLS connection for every call; the Vercel poller
+    makes one request every few seconds to the same host, so reusing the
+    connection removes a handshake per poll (and, in daemon mode, per run).
+    """
+
+    def __init__(self, max_idle_per_host: int = 4):
+        self.max_idle_per_host = max_idle_per_host
+        self._idle: Dict[Tuple[str, str, Optional[int]], List[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+        self.connections_opened = 0
+
+    def _checkout(self, key: Tuple[str, str, Optional[int]], timeout: float) -> http.client.HTTPConnection:
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                conn = idle.pop()
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                return conn
+            self.connections_opened += 1
+        scheme, host, port = key
+        import http.client
+
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=timeout)
+        return http.client.HTTPConnection(host, port, timeout=timeout)
+
+    def _checkin(self, key: Tuple[str, str, Optional[int]], conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def request(self, method: str, url: str, headers: Dict[str, str], body: Optional[bytes] = None, timeout: float = 30) -> Tuple[int, bytes]:
+        if CASSETTE is None:
+            return self._request(method, url, headers, body, timeout)
+        key = f"{method} {url}"
+        if CASSETTE.replaying:
+            item = CASSETTE.lookup("http", key)
+            if "error" in item:
+                raise OSError(item["error"])
+            return item["status"], item["body"].encode("utf-8")
+        import http.client
+
+        started = time.monotonic()
+        try:
+            status, data = self._request(method, url, headers, body, timeout)
+        except (OSError, http.client.HTTPException) as e:
+            CASSETTE.record("http", key, started, error=str(e))
+            raise
+        CASSETTE.record("http", key, started, status=status, body=data.decode("utf-8", errors="replace"))
+        return status, data
+
+    def _request(self, method: str, url: str, headers: Dict[str, str], body: Optional[bytes], timeout: float) -> Tuple[int, bytes]:
+        import http.client
+
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname or "", parts.port)
+        path = parts.path or "/"
+        if parts.query:
+            path = f"{path}?{parts.query}"
+        for attempt in range(2):
+            conn = self._checkout(key, timeout)
+            reused = conn.sock is not None
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+                data = resp.read()
+            except (http.client.RemoteDisconnected, http.client.BadStatusLine, ConnectionResetError, BrokenPipeError):
+                conn.close()
+                if reused and attempt == 0:
+                    continue  # server closed an idle keep-alive connection; retry on a fresh one
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            if resp.will_close:
+                conn.close()
+            else:
+                self._checkin(key, conn)
+            return resp.status, data
+        raise http.client.HTTPException("unreachable")
+
+    def close(self) -> None:
+        with self._lock:
+            for conns in self._idle.values():
+                for conn in conns:
+                    conn.close()
+            self._idle.clear()
+
+
+HTTP_POOL = HTTPConnectionPool()
+
+# Vercel project metadata keyed by (project, org); survives between runs in daemon mode
+PROJECT_CACHE_TTL = 600
+_PROJECT_CACHE: Dict[Tuple[str, Optional[str]], Tuple[float, Dict[str, Any]]] = {}
+
+
 # ---------------- Vercel API helpers ----------------
 
+# API base URL (overridable to point the script at a local stand-in, e.g. the benchmark suite)
+VERCEL_API_URL = (os.environ.get("VERCEL_API_URL") or "https://api.vercel.com").rstrip("/")
+# Interval between deployment status polls
+DEPLOY_POLL_SECS = float(os.environ.get("DEPLOY_POLL_SECS") or 10)
+
+
 class VercelAPI:
     def __init__(self, token: str, project: str, org_id: Optional[str] = None, config: Optional[DeployConfig] = None):
         self.token = token
@@ -573,32 +1694,50 @@ class VercelAPI:
         self.org_id = org_id
         self.config = config or DeployConfig()
 
-    def _request(self, method: str, url: str, params: Optional[Dict[str, Any]] = None, retries: int = 3) -> Dict[str, Any]:
+    def _request(
+        self,
+        method: str,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        retries: int = 3,
+        body: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
         """Make HTTP request with retry mechanism"""
+        import http.client
+
         last_error = None
+        if params:
+            url = f"{url}?{urlencode(params)}"
+        payload = json.dumps(body).encode("utf-8") if body is not None else None
+        headers = {
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": "application/json",
+            "User-Agent": "Zignals-Deploy-Script/1.0",
+        }
         
         for attempt in range(retries):
             try:
-                if params:
-                    url = f"{url}?{urlencode(params)}"
-                req = Request(url, method=method)
-                req.add_header("Authorization", f"Bearer {self.token}")
-                req.add_header("Content-Type", "application/json")
-                req.add_header("User-Agent", "Zignals-Deploy-Script/1.0")
-                
-                with urlopen(req, timeout=self.config.health_check_timeout) as resp:
-                    data = json.loads(resp.read().decode("utf-8"))
-                    return data
-                    
-            except HTTPError as e:
-                body = e.read().decode("utf-8", errors="ignore")
-                last_error = VercelError(f"Vercel API HTTPError {e.code}: {body}")
-                
+                with TRACER.span(f"{method} {url.split('?')[0]}", cat="vercel_api", attempt=attempt + 1) as span:
+                    if BUDGET.expired():
+                        BUDGET.note_exhausted("vercel_api")
+                        raise VercelError(f"Time budget exhausted before {method} {url.split('?')[0]}", retryable=False)
+                    status, data = HTTP_POOL.request(
+                        method, url, headers, body=payload, timeout=BUDGET.timeout(self.config.health_check_timeout)
+                    )
+                    span["status"] = status
+
+                if status < 400:
+                    return json.loads(data.decode("utf-8")) if data else {}
+
+                last_error = VercelError(f"Vercel API HTTPError {status}: {data.decode('utf-8', errors='ignore')}")
                 # Don't retry on client errors (4xx)
-                if 400 <= e.code < 500:
+                if 400 <= status < 500:
                     raise last_error
                     
-            except URLError as e:
+            except DeployError:
+                raise
+                    
+            except (OSError, http.client.HTTPException) as e:
                 last_error = VercelError(f"Vercel API URLError: {e}")
                 
             except Exception as e:
@@ -606,17 +1745,33 @@ class VercelAPI:
             
             # Wait before retry
             if attempt < retries - 1:
-                time.sleep(self.config.retry_delay * (attempt + 1))  # Exponential backoff
+                if BUDGET.expired():
+                    break
+                count_retry()
+                pause(self.config.retry_delay * (attempt + 1))  # Exponential backoff
         
         raise last_error or VercelError("Max retries exceeded")
 
-    def list_deployments_v13(self, limit: int = 20) -> Dict[str, Any]:
+    def project_info(self, retries: int = 3) -> Dict[str, Any]:
+        """Project metadata, cached per process (kept warm across runs in daemon mode)"""
+        key = (self.project, self.org_id)
+        cached = _PROJECT_CACHE.get(key)
+        if cached and time.time() - cached[0] < PROJECT_CACHE_TTL:
+            return cached[1]
+        params: Dict[str, Any] = {"teamId": self.org_id} if self.org_id else {}
+        info = self._request("GET", f"{VERCEL_API_URL}/v9/projects/{quote(self.project, safe='')}", params or None, retries=retries)
+        _PROJECT_CACHE[key] = (time.time(), info)
+        return info
+
+    def list_deployments_v13(self, limit: int = 20, target: Optional[str] = None) -> Dict[str, Any]:
         """List deployments with enhanced error handling"""
         try:
             params: Dict[str, Any] = {"project": self.project, "limit": str(limit)}
+            if target:
+                params["target"] = target
             if self.org_id:
                 params["teamId"] = self.org_id
-            return self._request("GET", "https://api.vercel.com/v13/deployments", params)
+            return self._request("GET", f"{VERCEL_API_URL}/v13/deployments", params)
         except VercelError as e:
             raise e
         except Exception as e:
@@ -625,17 +1780,39 @@ class VercelAPI:
     def get_deployment_status(self, deployment_id: str) -> Dict[str, Any]:
         """Get specific deployment status"""
         try:
-            url = f"https://api.vercel.com/v13/deployments/{deployment_id}"
+            url = f"{VERCEL_API_URL}/v13/deployments/{deployment_id}"
             return self._request("GET", url)
         except VercelError as e:
             raise e
         except Exception as e:
             raise VercelError(f"Failed to get deployment status: {e}")
 
+    def create_git_deployment(self, ref: str, sha: Optional[str] = None, target: Optional[str] = None) -> Dict[str, Any]:
+        """Create a deployment of a git ref of the project's linked repository.
+
+        Vercel fetches the source itself, so no local checkout of `ref` is
+        needed; omitting `target` creates a preview deployment.
+        """
+        info = self.project_info()
+        link = info.get("link") or {}
+        repo_id = link.get("repoId")
+        if not repo_id:
+            raise VercelError("Project has no linked git repository (link.repoId); cannot deploy git refs")
+        git_source: Dict[str, Any] = {"type": link.get("type") or "github", "repoId": repo_id, "ref": ref}
+        if sha:
+            git_source["sha"] = sha
+        body: Dict[str, Any] = {"name": info.get("name") or self.project, "project": info.get("id") or self.project,
+                                "gitSource": git_source}
+        if target:
+            body["target"] = target
+        params: Dict[str, Any] = {"teamId": self.org_id} if self.org_id else {}
+        # POST is not idempotent: a retried create could start a second build
+        return self._request("POST", f"{VERCEL_API_URL}/v13/deployments", params or None, retries=1, body=body)
+
     def cancel_deployment(self, deployment_id: str) -> bool:
         """Cancel a deployment"""
         try:
-            url = f"https://api.vercel.com/v13/deployments/{deployment_id}/cancel"
+            url = f"{VERCEL_API_URL}/v13/deployments/{deployment_id}/cancel"
             self._request("PATCH", url)
             return True
         except VercelError as e:
@@ -660,9 +1837,15 @@ def select_latest_deployment(deployments: Dict[str, Any], branch: str, target: s
     return filtered[0]
 
 
-def wait_for_vercel_deployment(vercel: VercelAPI, branch: str, target: str = "production", timeout_minutes: int = 15) -> Tuple[Optional[Dict[str, Any]], str]:
+def wait_for_vercel_deployment(
+    vercel: VercelAPI,
+    branch: str,
+    target: str = "production",
+    timeout_minutes: int = 15,
+    should_abort: Optional[Callable[[], bool]] = None,
+) -> Tuple[Optional[Dict[str, Any]], str]:
     """Wait for deployment with enhanced error handling and progress tracking"""
-    deadline = time.time() + timeout_minutes * 60
+    deadline = BUDGET.wall_deadline(time.time() + timeout_minutes * 60)
     last_state = "UNKNOWN"
     consecutive_errors = 0
     max_consecutive_errors = 3
@@ -670,6 +1853,9 @@ def wait_for_vercel_deployment(vercel: VercelAPI, branch: str, target: str = "pr
     print(f"Waiting for deployment on branch '{branch}' (target: {target})...")
     
     while time.time() < deadline:
+        if should_abort is not None and should_abort():
+            print("⏭️  A newer deploy request is queued for this branch; no longer waiting")
+            return None, "SUPERSEDED"
         try:
             data = vercel.list_deployments_v13(limit=20)
             dep = select_latest_deployment(data, branch=branch, target=target)
@@ -720,30 +1906,49 @@ def wait_for_vercel_deployment(vercel: VercelAPI, branch: str, target: str = "pr
                 return None, last_state
         
         # Wait before next check
-        time.sleep(10)
+        pause(DEPLOY_POLL_SECS, "poll")
     
-    print(f"⏰ Deployment timeout after {timeout_minutes} minutes")
+    if BUDGET.expired():
+        BUDGET.note_exhausted("deploy_wait")
+        print("⏰ Time budget exhausted while waiting for the deployment")
+    else:
+        print(f"⏰ Deployment timeout after {timeout_minutes} minutes")
     return None, f"TIMEOUT: {last_state}"
 
 
 def http_get(url: str, timeout: int = HC_TIMEOUT_SECS) -> Tuple[int, float]:
+    if CASSETTE is not None and CASSETTE.replaying:
+        with TRACER.span(f"GET {url}", cat="http") as span:
+            item = CASSETTE.lookup("http_get", url)
+            span["status"] = item["status"]
+        return item["status"], item["elapsed"]
+    from urllib.error import HTTPError, URLError
+    from urllib.request import Request, urlopen
+
     start = time.time()
+    started = time.monotonic()
     req = Request(url, method="GET")
-    try:
-        with urlopen(req, timeout=timeout) as resp:
-            status = resp.getcode()
-    except HTTPError as e:
-        status = e.code
-    except URLError:
-        status = 0
+    with TRACER.span(f"GET {url}", cat="http") as span:
+        try:
+            with urlopen(req, timeout=timeout) as resp:
+                status = resp.getcode()
+        except HTTPError as e:
+            status = e.code
+        except URLError:
+            status = 0
+        span["status"] = status
     elapsed = time.time() - start
+    if CASSETTE is not None:
+        CASSETTE.record("http_get", url, started, status=status)
     return status, elapsed
 
 
-def perform_health_checks(base_url: str, config: DeployConfig) -> List[Tuple[str, int, float]]:
-    """Perform comprehensive health checks with retry mechanism"""
-    results: List[Tuple[str, int, float]] = []
-    
+def perform_health_checks(
+    base_url: str,
+    config: DeployConfig,
+    endpoints: Optional[List[Tuple[str, str]]] = None,
+) -> List[Tuple[str, int, float]]:
+    """Probe the endpoints concurrently, each with its own retries; results keep the endpoint order"""
     # Ensure https scheme
     if base_url.startswith("http://") or base_url.startswith("https://"):
         origin = base_url
@@ -751,7 +1956,7 @@ def perform_health_checks(base_url: str, config: DeployConfig) -> List[Tuple[str
         origin = f"https://{base_url}"
 
     # Enhanced endpoint list for better health checking
-    endpoints = [
+    endpoints = endpoints or [
         ("/", "Homepage"),
         ("/api/health", "Health API"),
         ("/favicon.ico", "Favicon"),
@@ -760,8 +1965,12 @@ def perform_health_checks(base_url: str, config: DeployConfig) -> List[Tuple[str
     ]
     
     print(f"🔍 Performing health checks on {origin}")
-    
-    for ep, description in endpoints:
+
+    def probe(ep: str, description: str) -> Optional[Tuple[str, int, float]]:
+        if BUDGET.expired():
+            BUDGET.note_exhausted("health_checks")
+            print(f"⏭️  Skipping health check {ep}: time budget exhausted")
+            return None
         url = origin.rstrip("/") + ep
         status = 0
         latency = 0.0
@@ -770,7 +1979,7 @@ def perform_health_checks(base_url: str, config: DeployConfig) -> List[Tuple[str
         # Retry with exponential backoff
         for attempt in range(HC_RETRIES):
             try:
-                status, latency = http_get(url, timeout=config.health_check_timeout)
+                status, latency = http_get(url, timeout=BUDGET.timeout(config.health_check_timeout))
                 
                 if status and status < 500 and status != 404:
                     success = True
@@ -783,153 +1992,3414 @@ def perform_health_checks(base_url: str, config: DeployConfig) -> List[Tuple[str
                 print(f"❌ {description} ({ep}): Error - {e} (attempt {attempt + 1}/{HC_RETRIES})")
             
             if attempt < HC_RETRIES - 1:
-                time.sleep(config.retry_delay * (attempt + 1))
+                if BUDGET.expired():
+                    break
+                count_retry()
+                pause(config.retry_delay * (attempt + 1), "health_retry")
         
         if not success:
             print(f"💥 {description} ({ep}): Failed after {HC_RETRIES} attempts")
-            
-        results.append((ep, status, latency))
-    
-    return results
+        return (ep, status, latency)
 
+    from concurrent.futures import ThreadPoolExecutor
 
-def deploy_with_fallback(config: DeployConfig, logger: logging.Logger) -> Tuple[Optional[Dict[str, Any]], str]:
-    """Deploy with fallback mechanism between GitHub integration and Vercel CLI"""
-    dep: Optional[Dict[str, Any]] = None
-    dep_state: str = "SKIPPED"
+    workers = max(1, min(len(endpoints), HEALTH_CHECK_PARALLEL))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="health") as pool:
+        probed = list(pool.map(lambda item: probe(*item), endpoints))
+    return [result for result in probed if result is not None]
+
+
+# ---------------- Targeted health checks ----------------
+
+HEALTH_ROUTES_FILE = REPO_ROOT / "deploy-health.json"
+# Probed on every run next to the routes the pushed range changed
+HEALTH_CORE_ENDPOINTS: List[str] = ["/", "/api/health"]
+HEALTH_MAX_ROUTES = 20
+APP_DIR = "app"
+ROUTE_FILE_STEMS = ("page", "route")
+# Files that wrap every page below their directory
+WRAPPER_FILE_STEMS = ("layout", "template", "loading", "error", "not-found")
+ROUTE_FILE_EXTENSIONS = (".tsx", ".ts", ".jsx", ".js", ".mdx")
+# Metadata files served under their own URL
+METADATA_ROUTES: Dict[str, str] = {
+    "favicon.ico": "favicon.ico",
+    "robots.txt": "robots.txt",
+    "robots.ts": "robots.txt",
+    "sitemap.xml": "sitemap.xml",
+    "sitemap.ts": "sitemap.xml",
+    "manifest.ts": "manifest.webmanifest",
+    "manifest.json": "manifest.json",
+}
+_DYNAMIC_SEGMENT = re.compile(r"\[\[\.\.\.(?P<optional>[^\]]+)\]\]|\[\.\.\.(?P<catchall>[^\]]+)\]|\[(?P<param>[^\]]+)\]")
+_INTERCEPTING_SEGMENT = re.compile(r"^(\(\.{1,3}\))+")
+# `export async function GET`, `export const GET =`, `export { handler as GET }`
+_GET_HANDLER_EXPORT = re.compile(r"export\s+(?:async\s+)?(?:function|const|let)\s+GET\b|export\s*\{[^}]*\bGET\b[^}]*\}")
+
+
+@dataclass
+class HealthRoutes:
+    """deploy-health.json: sample values for dynamic segments and the always-probed core endpoints"""
+    params: Dict[str, str] = field(default_factory=dict)
+    core: List[str] = field(default_factory=lambda: list(HEALTH_CORE_ENDPOINTS))
+    max_routes: int = HEALTH_MAX_ROUTES
+
+
+def load_health_routes(path: Optional[Path] = None) -> HealthRoutes:
+    path = path or HEALTH_ROUTES_FILE
+    if not path.is_file():
+        if path != HEALTH_ROUTES_FILE:
+            raise DeployError(f"Health routes file {path} does not exist", retryable=False)
+        return HealthRoutes()
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError) as e:
+        raise DeployError(f"Cannot read health routes file {path}: {e}", retryable=False)
+    unknown = set(data) - set(HealthRoutes.__dataclass_fields__)
+    if unknown:
+        raise DeployError(f"{path}: unknown keys: {', '.join(sorted(unknown))}", retryable=False)
+    return HealthRoutes(**data)
+
+
+def route_url(segments: List[str], params: Dict[str, str]) -> Tuple[Optional[str], str]:
+    """URL of an app/ directory: (url, "") or (None, why it cannot be probed).
+
+    Route groups `(name)` and parallel-route slots `@name` are not part of the
+    URL; `[param]` and `[...param]` take their sample value from `params`, and
+    an optional catch-all `[[...param]]` without one is left out.
+    """
+    parts: List[str] = []
+    for segment in segments:
+        if _INTERCEPTING_SEGMENT.match(segment):
+            return None, f"intercepting route {segment}"
+        if segment.startswith("(") and segment.endswith(")") or segment.startswith("@"):
+            continue
+        match = _DYNAMIC_SEGMENT.fullmatch(segment)
+        if match is None:
+            parts.append(segment)
+            continue
+        name = match.group("optional") or match.group("catchall") or match.group("param")
+        value = params.get(name)
+        if value is None:
+            if match.group("optional"):
+                continue
+            return None, f"no sample value for [{name}]"
+        if value:
+            parts.append(quote(value, safe="/"))
+    return "/" + "/".join(parts), ""
+
+
+def _is_route_file(name: str) -> bool:
+    stem, ext = os.path.splitext(name)
+    return stem in ROUTE_FILE_STEMS and ext in ROUTE_FILE_EXTENSIONS
+
+
+def _serves_get(directory: Path) -> bool:
+    """Whether a GET probe exercises the directory: a page, or a route handler exporting GET"""
+    for stem in ROUTE_FILE_STEMS:
+        for ext in ROUTE_FILE_EXTENSIONS:
+            path = directory / f"{stem}{ext}"
+            if not path.is_file():
+                continue
+            if stem == "page":
+                return True
+            try:
+                return bool(_GET_HANDLER_EXPORT.search(path.read_text(encoding="utf-8", errors="replace")))
+            except OSError:
+                return False
+    return False
+
+
+def _route_dirs(app_root: Path, segments: List[str]) -> Iterator[Tuple[List[str], bool]]:
+    """Directories at or below `segments` holding a page/route, shallowest first, with whether it is a page"""
+    queue = [segments]
+    while queue:
+        current = queue.pop(0)
+        directory = app_root.joinpath(*current)
+        try:
+            entries = sorted(directory.iterdir())
+        except OSError:
+            continue
+        route_files = [entry.name for entry in entries if entry.is_file() and _is_route_file(entry.name)]
+        if route_files:
+            yield current, any(name.startswith("page.") for name in route_files)
+        queue.extend(current + [entry.name] for entry in entries
+                     if entry.is_dir() and not entry.name.startswith(("_", ".")) and not _INTERCEPTING_SEGMENT.match(entry.name))
+
+
+def changed_routes(changed: List[str], params: Dict[str, str], checkout: Path = REPO_ROOT) -> Tuple[Dict[str, str], List[str]]:
+    """URL routes affected by the changed files under app/ ({url: file}) and notes on the unprobeable ones.
+
+    Routes whose own page/route file changed come first, then the ones
+    reached through a changed layout or component (shallowest first).
+    """
+    app_root = checkout / APP_DIR
+    direct: Dict[str, str] = {}
+    wrapped: Dict[str, str] = {}
+    notes: List[str] = []
+    for path in changed:
+        if not path.startswith(f"{APP_DIR}/") or not (checkout / path).is_file():
+            continue
+        *dirs, name = path.split("/")[1:]
+        # Private folders (_components, _lib) hold code colocated with the route above them
+        private = next((i for i, d in enumerate(dirs) if d.startswith("_")), None)
+        if private is not None:
+            dirs, name = dirs[:private], ""
+        routes = direct
+        if name in METADATA_ROUTES:
+            targets = [dirs + [METADATA_ROUTES[name]]]
+        elif _is_route_file(name):
+            targets = [dirs]
+        elif os.path.splitext(name)[0] in WRAPPER_FILE_STEMS:
+            # A layout (template, loading/error UI) wraps every page below it
+            routes = wrapped
+            targets = [segments for segments, is_page in _route_dirs(app_root, dirs) if is_page]
+        else:
+            # Components and styles: the route they are colocated with
+            routes = wrapped
+            nearest = next(_route_dirs(app_root, dirs), None)
+            targets = [nearest[0]] if nearest else []
+        for segments in targets:
+            # A POST-only handler answers a GET probe with 405, which checks nothing
+            if name not in METADATA_ROUTES and not _serves_get(app_root.joinpath(*segments)):
+                notes.append(f"{path}: route handler does not export GET")
+                continue
+            url, why = route_url(segments, params)
+            if url is None:
+                notes.append(f"{path}: {why}")
+            else:
+                routes.setdefault(url, path)
+    return {**direct, **{url: path for url, path in wrapped.items() if url not in direct}}, notes
+
+
+def targeted_health_endpoints(
+    changed: Optional[List[str]], config: DeployConfig, logger: logging.Logger
+) -> Optional[List[Tuple[str, str]]]:
+    """Core endpoints plus the app/ routes changed in the pushed range.
+
+    None (perform_health_checks' fixed list) when targeting is off or the
+    range is unknown.
+    """
+    if not config.targeted_health or changed is None:
+        return None
+    spec = load_health_routes(config.health_routes_file)
+    routes, notes = changed_routes(changed, spec.params, deploy_checkout(config))
+    for note in notes:
+        logger.info(f"Not probing {note}")
+    endpoints = [(ep, "Core") for ep in spec.core]
+    targeted = [(url, f"Changed {path}") for url, path in routes.items() if url not in spec.core]
+    if len(targeted) > spec.max_routes:
+        logger.info(f"{len(targeted)} changed routes; probing the first {spec.max_routes}")
+        targeted = targeted[:spec.max_routes]
+    logger.info(f"Targeted health checks: {len(targeted)} changed route(s) + {len(endpoints)} core endpoint(s)")
+    return endpoints + targeted
+
+
+# ---------------- Prebuilt deploys ----------------
+
+BUILD_CACHE_DIR = Path(os.environ.get("DEPLOY_BUILD_CACHE_DIR") or Path.home() / ".cache" / "zignals-deploy" / "build-cache")
+BUILD_CACHE_MAX_MB = 4096
+
+# Directories carried between `vercel build` runs (relative to the repo root)
+BUILD_CACHE_PATHS: List[str] = [".next/cache", ".vercel/output"]
+# Files whose content decides which cache entry a build may reuse
+BUILD_CACHE_KEY_FILES: List[str] = ["package-lock.json", "yarn.lock", "pnpm-lock.yaml", "bun.lockb", "next.config.mjs"]
+
+
+def _dir_size(path: Path) -> int:
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                continue
+    return total
+
+
+class BuildCache:
+    """Size-bounded LRU store of build outputs kept outside the checkout.
+
+    Each entry is a directory named after the cache key holding a copy of
+    BUILD_CACHE_PATHS plus a meta.json with its size; the entry mtime is
+    bumped on every use and the least recently used entries are evicted
+    once the total exceeds the limit.
+    """
+
+    def __init__(self, root: Path = BUILD_CACHE_DIR, max_bytes: int = BUILD_CACHE_MAX_MB * 1024 * 1024,
+                 checkout: Path = REPO_ROOT):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.checkout = checkout
+
+    def key(self, target: str) -> str:
+        import hashlib
+
+        digest = hashlib.sha1(target.encode("utf-8"))
+        for name in BUILD_CACHE_KEY_FILES:
+            path = self.checkout / name
+            if path.is_file():
+                digest.update(name.encode("utf-8"))
+                digest.update(path.read_bytes())
+        return digest.hexdigest()[:16]
+
+    def restore(self, key: str, logger: logging.Logger) -> List[str]:
+        """Copy cached directories into the checkout where they are missing"""
+        import shutil
+
+        entry = self.root / key
+        restored: List[str] = []
+        if not entry.is_dir():
+            return restored
+        for rel in BUILD_CACHE_PATHS:
+            src = entry / rel
+            dst = self.checkout / rel
+            if src.is_dir() and not dst.exists():
+                with TRACER.span(f"cache restore {rel}", cat="cache"):
+                    dst.parent.mkdir(parents=True, exist_ok=True)
+                    shutil.copytree(src, dst, symlinks=True)
+                restored.append(rel)
+        os.utime(entry)
+        if restored:
+            logger.info(f"Restored build cache {key}: {', '.join(restored)}")
+        return restored
+
+    def save(self, key: str, logger: logging.Logger) -> None:
+        """Replace the cache entry with the checkout's current build outputs"""
+        import shutil
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        staging = self.root / f".{key}.{os.getpid()}.tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        with TRACER.span("cache save", cat="cache"):
+            for rel in BUILD_CACHE_PATHS:
+                src = self.checkout / rel
+                if src.is_dir():
+                    shutil.copytree(src, staging / rel, symlinks=True)
+            if not staging.exists():
+                return
+            size = _dir_size(staging)
+            (staging / "meta.json").write_text(json.dumps({"size": size, "saved_at": time.time()}), encoding="utf-8")
+            entry = self.root / key
+            old = self.root / f".{key}.{os.getpid()}.old"
+            if entry.exists():
+                os.replace(entry, old)
+            os.replace(staging, entry)
+            shutil.rmtree(old, ignore_errors=True)
+        logger.info(f"Saved build cache {key} ({size / 1024 / 1024:.1f} MiB)")
+        self.evict(logger, keep=key)
+
+    def evict(self, logger: logging.Logger, keep: Optional[str] = None) -> List[str]:
+        """Drop least recently used entries until the cache fits in max_bytes"""
+        import shutil
+
+        entries: List[Tuple[float, int, Path]] = []
+        for entry in self.root.iterdir():
+            if not entry.is_dir() or entry.name.startswith("."):
+                continue
+            try:
+                size = int(json.loads((entry / "meta.json").read_text(encoding="utf-8"))["size"])
+            except (OSError, ValueError, KeyError):
+                size = _dir_size(entry)
+            entries.append((entry.stat().st_mtime, size, entry))
+        total = sum(size for _, size, _ in entries)
+        evicted: List[str] = []
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if entry.name == keep:
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            evicted.append(entry.name)
+        if evicted:
+            logger.info(f"Evicted build cache entries: {', '.join(evicted)}")
+        return evicted
+
+
+def build_prebuilt(
+    config: DeployConfig,
+    logger: logging.Logger,
+    target: str = "production",
+    workdir: Optional[Path] = None,
+    project: Optional[str] = None,
+    env: Optional[Dict[str, str]] = None,
+) -> bool:
+    """Run `vercel build` locally around a restore/save of the persistent build cache.
+
+    `workdir`/`project` build one project of a multi-project manifest; its
+    cache entries are keyed by project so projects never share outputs.
+    """
+    checkout = workdir or deploy_checkout(config)
+    cache = BuildCache(config.build_cache_dir or BUILD_CACHE_DIR, config.build_cache_max_mb * 1024 * 1024, checkout)
+    key = cache.key(f"{target} {project}" if project else target)
+    try:
+        cache.restore(key, logger)
+    except OSError as e:
+        logger.warning(f"Build cache restore failed, building cold: {e}")
+
+    build_cmd = ["vercel", "build"] + (["--prod"] if target == "production" else [])
+    with TRACER.span("vercel_build"):
+        res = Shell.run_no_check(build_cmd, cwd=checkout, timeout=config.deployment_timeout * 60, env=env)
+    if res.returncode != 0:
+        logger.error(f"vercel build failed: {res.stderr.strip()[-2000:]}")
+        return False
+
+    try:
+        cache.save(key, logger)
+    except OSError as e:
+        logger.warning(f"Build cache save failed: {e}")
+    return True
+
+
+def cli_deployment_url(stdout: str) -> Optional[str]:
+    """Deployment URL printed by `vercel deploy` (the only thing it writes to stdout)"""
+    for line in stdout.splitlines():
+        line = line.strip()
+        if line.startswith(("https://", "http://")) and " " not in line:
+            return line
+    return None
+
+
+def deploy_with_fallback(
+    config: DeployConfig,
+    logger: logging.Logger,
+    should_abort: Optional[Callable[[], bool]] = None,
+    project: Optional[str] = None,
+    workdir: Optional[Path] = None,
+) -> Tuple[Optional[Dict[str, Any]], str]:
+    """Deploy with fallback mechanism between GitHub integration and Vercel CLI
+
+    `project` and `workdir` select one project of a multi-project manifest
+    (default: $VERCEL_PROJECT_ID built from the deploy checkout).
+    """
+    dep: Optional[Dict[str, Any]] = None
+    dep_state: str = "SKIPPED"
+    target = "preview" if config.preview else "production"
+    workdir = workdir or deploy_checkout(config)
+    org = os.environ.get("VERCEL_ORG_ID")
+    # The CLI reads the project from the environment when it is not the checkout's linked one
+    cli_env = {"VERCEL_PROJECT_ID": project, **({"VERCEL_ORG_ID": org} if org else {})} if project else None
     
     # Try GitHub integration first (if configured)
     if not config.fallback_to_cli:
         logger.info("Attempting deployment via GitHub integration")
         try:
-            token = os.environ.get("VERCEL_TOKEN")
-            project = os.environ.get("VERCEL_PROJECT_ID")
-            org = os.environ.get("VERCEL_ORG_ID")
-            
-            if not token or not project:
-                raise VercelError("Missing VERCEL_TOKEN or VERCEL_PROJECT_ID env variables")
-            
-            vercel = VercelAPI(token=token, project=project, org_id=org, config=config)
-            dep, dep_state = wait_for_vercel_deployment(
-                vercel, 
-                branch=config.target_branch, 
-                target="production",
-                timeout_minutes=config.deployment_timeout
+            token = os.environ.get("VERCEL_TOKEN")
+            project_id = project or os.environ.get("VERCEL_PROJECT_ID")
+
+            if not token or not project_id:
+                raise VercelError("Missing VERCEL_TOKEN or VERCEL_PROJECT_ID env variables")
+            
+            vercel = VercelAPI(token=token, project=project_id, org_id=org, config=config)
+            if config.cancel_superseded:
+                head_sha = Shell.run(["git", "rev-parse", "HEAD"], cwd=deploy_checkout(config)).stdout.strip()
+                cancel_superseded_deployments(vercel, config.target_branch, head_sha, target=target)
+            with TRACER.span("deploy_wait") as span:
+                dep, dep_state = wait_for_vercel_deployment(
+                    vercel, 
+                    branch=config.target_branch, 
+                    target=target,
+                    timeout_minutes=config.deployment_timeout,
+                    should_abort=should_abort,
+                )
+                span["state"] = dep_state
+            
+            if dep_state == "READY":
+                logger.info("✅ GitHub integration deployment successful")
+                return dep, dep_state
+            if dep_state == "SUPERSEDED":
+                return dep, dep_state
+            else:
+                logger.warning(f"GitHub integration deployment failed: {dep_state}")
+                
+        except VercelError as e:
+            logger.error(f"GitHub integration failed: {e}")
+            if not config.fallback_to_cli:
+                raise e
+    
+    # Fallback to Vercel CLI
+    if config.fallback_to_cli:
+        logger.info("Attempting deployment via Vercel CLI (fallback)")
+        try:
+            prod_flag = ["--prod"] if target == "production" else []
+            if config.prebuilt:
+                with TRACER.span("prebuild"):
+                    if not build_prebuilt(config, logger, target=target, workdir=workdir, project=project, env=cli_env):
+                        return dep, "BUILD_ERROR"
+                cli_cmd = ["vercel", "deploy", "--prebuilt", *prod_flag]
+            else:
+                cli_cmd = ["vercel", "deploy", *prod_flag, "--confirm"]
+            
+            # Add timeout to CLI command
+            with TRACER.span("cli"):
+                cli_res = Shell.run_no_check(cli_cmd, cwd=workdir, timeout=config.deployment_timeout * 60, env=cli_env)
+            
+            if cli_res.returncode == 0:
+                logger.info("✅ Vercel CLI deployment successful")
+                
+                # Try to extract URL from CLI output
+                url = cli_deployment_url(cli_res.stdout)
+                
+                if url:
+                    dep_state = "READY"
+                    dep = {"url": url, "state": "READY", "uid": "cli-deployment"}
+                else:
+                    dep_state = "CLI_SUCCESS_NO_URL"
+                    
+            else:
+                logger.error(f"Vercel CLI failed: {cli_res.stderr}")
+                dep_state = "CLI_ERROR"
+                
+        except DeployError as e:
+            logger.error(f"Vercel CLI deployment failed: {e}")
+            dep_state = "TIMEOUT: CLI" if e.status == DeployStatus.TIMEOUT else "CLI_ERROR"
+    
+    return dep, dep_state
+
+
+# ---------------- Pre-flight ----------------
+
+# Network probes give up after this long; local checks answer immediately
+PREFLIGHT_TIMEOUT_SECS = 2
+
+
+@dataclass
+class PreflightCheck:
+    name: str
+    ok: bool
+    detail: str = ""
+    secs: float = 0.0
+
+
+def _preflight_repo() -> Tuple[bool, str]:
+    ensure_git_repo()
+    if is_rebase_in_progress(REPO_ROOT):
+        return False, "rebase in progress; resolve it and run again"
+    return True, "work tree ok"
+
+
+def _preflight_env(names: List[str]) -> Tuple[bool, str]:
+    missing = [name for name in names if not os.environ.get(name)]
+    if missing:
+        return False, f"missing {', '.join(missing)}"
+    return True, ", ".join(names)
+
+
+def _preflight_token(config: DeployConfig, project: str) -> Tuple[bool, str]:
+    # One request validates token, team and project together (and warms the project cache)
+    probe_config = replace(config, health_check_timeout=PREFLIGHT_TIMEOUT_SECS, retry_delay=0)
+    vercel = VercelAPI(os.environ["VERCEL_TOKEN"], project, os.environ.get("VERCEL_ORG_ID"), probe_config)
+    try:
+        info = vercel.project_info(retries=1)
+    except VercelError as e:
+        return False, str(e)[:300]
+    return True, f"project {info.get('name') or project}"
+
+
+def _preflight_remote(remote: str) -> Tuple[bool, str]:
+    env = {"GIT_TERMINAL_PROMPT": "0"}
+    if "GIT_SSH_COMMAND" not in os.environ:
+        env["GIT_SSH_COMMAND"] = f"ssh -o BatchMode=yes -o ConnectTimeout={PREFLIGHT_TIMEOUT_SECS}"
+    try:
+        res = Shell.run_no_check(["git", "ls-remote", remote, "HEAD"], timeout=PREFLIGHT_TIMEOUT_SECS, env=env)
+    except DeployError:
+        return False, f"{remote} did not answer within {PREFLIGHT_TIMEOUT_SECS}s"
+    if res.returncode != 0:
+        lines = res.stderr.strip().splitlines()
+        fatal = [line for line in lines if line.startswith("fatal:")]
+        return False, (fatal or lines or [f"git ls-remote {remote} exited {res.returncode}"])[0]
+    return True, f"{remote} reachable"
+
+
+def _preflight_binary(name: str) -> Tuple[bool, str]:
+    import shutil
+
+    if CASSETTE is not None and CASSETTE.replaying:
+        path = CASSETTE.lookup("which", name).get("path")
+    else:
+        started = time.monotonic()
+        path = shutil.which(name)
+        if CASSETTE is not None:
+            CASSETTE.record("which", name, started, path=path)
+    return (True, path) if path else (False, f"'{name}' not found on PATH")
+
+
+def preflight_plan(
+    config: DeployConfig, push: bool = True, matrix: bool = False, dry_run: bool = False
+) -> List[Tuple[str, Callable[[], Tuple[bool, str]]]]:
+    """The checks that apply to this run's configuration.
+
+    A dry run touches neither Vercel nor the remotes, so it only checks the
+    manifest; credentials, reachability and binaries are left to real runs.
+    """
+    checks: List[Tuple[str, Callable[[], Tuple[bool, str]]]] = []
+    specs: Optional[List[ProjectSpec]] = None
+    if config.projects_manifest:
+        try:
+            specs = load_projects_manifest(config.projects_manifest)
+        except DeployError as e:
+            checks.append(("manifest", lambda e=e: (False, str(e))))
+    if dry_run:
+        return checks
+
+    if matrix or not config.fallback_to_cli:
+        required = ["VERCEL_TOKEN"]
+        if specs is None:
+            required.append("VERCEL_PROJECT_ID")
+            project = os.environ.get("VERCEL_PROJECT_ID")
+        else:
+            vercel_specs = [spec for spec in specs if spec.kind == "vercel"]
+            required += [spec.project_env for spec in vercel_specs if not spec.project_id and spec.project_env]
+            project = next((spec.vercel_project() for spec in vercel_specs if spec.vercel_project()), None)
+        checks.append(("env", lambda: _preflight_env(required)))
+        if os.environ.get("VERCEL_TOKEN") and project:
+            checks.append(("vercel_token", lambda: _preflight_token(config, project)))
+
+    if push or matrix:
+        remote = config.target_repo or config.remote_name
+        checks.append(("remote", lambda: _preflight_remote(remote)))
+    if config.fallback_to_cli or config.prebuilt:
+        checks.append(("vercel_cli", lambda: _preflight_binary("vercel")))
+    if specs and any(spec.kind == "compose" for spec in specs):
+        checks.append(("docker", lambda: _preflight_binary("docker")))
+    return checks
+
+
+def run_preflight(
+    config: DeployConfig, logger: logging.Logger, push: bool = True, matrix: bool = False, dry_run: bool = False
+) -> List[PreflightCheck]:
+    """Run every applicable check concurrently with the local repository checks.
+
+    Raises on the first failure without waiting for slower probes, so a
+    missing env var or CLI is reported immediately and nothing is mutated.
+    """
+    def timed(name: str, check: Callable[[], Tuple[bool, str]]) -> PreflightCheck:
+        start = time.perf_counter()
+        with TRACER.span(f"preflight:{name}", cat="phase") as span:
+            try:
+                ok, detail = check()
+            except Exception as e:
+                ok, detail = False, str(e)
+            span["ok"] = ok
+        return PreflightCheck(name, ok, detail, round(time.perf_counter() - start, 3))
+
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    plan = preflight_plan(config, push=push, matrix=matrix, dry_run=dry_run)
+    results: List[PreflightCheck] = []
+    pool = ThreadPoolExecutor(max_workers=max(1, len(plan)), thread_name_prefix="preflight")
+    try:
+        futures = [pool.submit(timed, name, check) for name, check in plan]
+        results.append(timed("git_repo", _preflight_repo))
+        if results[0].ok:
+            for future in as_completed(futures):
+                results.append(future.result())
+                if not results[-1].ok:
+                    break
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    for check in results:
+        logger.info(f"  {'✅' if check.ok else '❌'} pre-flight {check.name}: {check.detail} ({check.secs:.2f}s)")
+    failed = [check for check in results if not check.ok]
+    if failed:
+        raise DeployError(
+            "Pre-flight failed: " + "; ".join(f"{c.name}: {c.detail}" for c in failed),
+            DeployStatus.FAILED,
+            retryable=False,
+        )
+    return results
+
+
+# ---------------- Deployment history ----------------
+
+def _epoch_ms_delta(later: Any, earlier: Any) -> Optional[float]:
+    """Seconds between two Vercel epoch-millisecond timestamps, if both are present"""
+    if isinstance(later, (int, float)) and isinstance(earlier, (int, float)) and later >= earlier:
+        return round((later - earlier) / 1000.0, 3)
+    return None
+
+
+@dataclass
+class DeployRecord:
+    """Structured record of a single deploy run (one line of the history log)"""
+    timestamp: str
+    branch: str
+    target: str = "production"
+    actor: str = ""
+    commit_sha: str = ""
+    commit_title: str = ""
+    tree_hash: Optional[str] = None
+    deployment_id: Optional[str] = None
+    deployment_url: Optional[str] = None
+    state: str = "SKIPPED"
+    build_secs: Optional[float] = None
+    time_to_ready_secs: Optional[float] = None
+    duration_secs: float = 0.0
+    retries: int = 0
+    phases: Dict[str, float] = field(default_factory=dict)
+    health: List[Dict[str, Any]] = field(default_factory=list)
+    projects: Dict[str, str] = field(default_factory=dict)  # multi-project runs: name -> state
+    pushes: List[Dict[str, Any]] = field(default_factory=list)  # per-remote push results
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time a named phase of the run (also traced); repeated phases accumulate"""
+        start = time.perf_counter()
+        try:
+            with TRACER.span(name):
+                yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.phases[name] = round(self.phases.get(name, 0.0) + elapsed, 3)
+
+    def set_deployment(self, dep: Optional[Dict[str, Any]], dep_state: str) -> None:
+        self.state = dep_state
+        if not dep:
+            return
+        self.deployment_id = dep.get("uid") or dep.get("id")
+        self.deployment_url = dep.get("url")
+        created = dep.get("createdAt")
+        ready = dep.get("ready")
+        self.build_secs = _epoch_ms_delta(ready, dep.get("buildingAt"))
+        self.time_to_ready_secs = _epoch_ms_delta(ready, created)
+
+    def set_health(self, health: Optional[List[Tuple[str, int, float]]]) -> None:
+        self.health = [
+            {"endpoint": ep, "status": status, "latency": round(latency, 3)}
+            for ep, status, latency in (health or [])
+        ]
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), sort_keys=True, separators=(",", ":"))
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "DeployRecord":
+        known = {f for f in cls.__dataclass_fields__}
+        return cls(**{k: v for k, v in data.items() if k in known})
+
+
+class DeployHistory:
+    """Append-only JSONL deploy log with a SQLite index over it.
+
+    The JSONL file is the source of truth; the SQLite database only stores the
+    queryable columns plus the byte offset of each record in the log, so it can
+    be deleted at any time and is rebuilt (incrementally) on the next open.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS deploys (
+            id INTEGER PRIMARY KEY,
+            ts TEXT NOT NULL,
+            branch TEXT NOT NULL,
+            target TEXT,
+            commit_sha TEXT,
+            deployment_id TEXT,
+            state TEXT NOT NULL,
+            duration REAL,
+            log_offset INTEGER NOT NULL UNIQUE,
+            log_length INTEGER NOT NULL,
+            tree_hash TEXT
+        );
+        CREATE INDEX IF NOT EXISTS ix_deploys_branch_state_ts ON deploys (branch, state, ts);
+        CREATE INDEX IF NOT EXISTS ix_deploys_ts ON deploys (ts);
+        CREATE INDEX IF NOT EXISTS ix_deploys_commit ON deploys (commit_sha);
+        CREATE INDEX IF NOT EXISTS ix_deploys_deployment ON deploys (deployment_id);
+        CREATE TABLE IF NOT EXISTS phases (
+            deploy_id INTEGER NOT NULL REFERENCES deploys (id),
+            phase TEXT NOT NULL,
+            secs REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS ix_phases_phase ON phases (phase, deploy_id);
+        CREATE TABLE IF NOT EXISTS health (
+            deploy_id INTEGER NOT NULL REFERENCES deploys (id),
+            endpoint TEXT NOT NULL,
+            status INTEGER,
+            latency REAL
+        );
+        CREATE INDEX IF NOT EXISTS ix_health_endpoint ON health (endpoint, deploy_id);
+    """
+
+    def __init__(self, log_path: Path = HISTORY_LOG, db_path: Path = HISTORY_DB):
+        self.log_path = log_path
+        self.db_path = db_path
+
+    @contextmanager
+    def _connect(self):
+        import sqlite3
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.db_path))
+        try:
+            conn.executescript(self.SCHEMA)
+            self._migrate(conn)
+            self._catch_up(conn)
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _migrate(self, conn: sqlite3.Connection) -> None:
+        """Bring indexes created by older versions of this script up to date"""
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(deploys)")}
+        if "tree_hash" not in columns:
+            conn.execute("ALTER TABLE deploys ADD COLUMN tree_hash TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_deploys_tree ON deploys (tree_hash)")
+
+    def _indexed_bytes(self, conn: sqlite3.Connection) -> int:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'indexed_bytes'").fetchone()
+        return int(row[0]) if row else 0
+
+    def _catch_up(self, conn: sqlite3.Connection) -> None:
+        """Index any log lines appended since the last indexed byte"""
+        if not self.log_path.exists():
+            return
+        indexed = self._indexed_bytes(conn)
+        size = self.log_path.stat().st_size
+        if size < indexed:
+            # Log was truncated or replaced: rebuild the index from scratch
+            conn.executescript("DELETE FROM health; DELETE FROM phases; DELETE FROM deploys;")
+            indexed = 0
+        if size == indexed:
+            return
+        with open(self.log_path, "rb") as fh:
+            fh.seek(indexed)
+            offset = indexed
+            for raw in fh:
+                if not raw.endswith(b"\n"):
+                    break  # partial write in progress; pick it up next time
+                try:
+                    record = DeployRecord.from_dict(json.loads(raw.decode("utf-8")))
+                except (ValueError, TypeError):
+                    record = None
+                if record is not None:
+                    self._index(conn, record, offset, len(raw))
+                offset += len(raw)
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('indexed_bytes', ?)", (str(offset),)
+        )
+
+    def _index(self, conn: sqlite3.Connection, record: DeployRecord, offset: int, length: int) -> None:
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO deploys"
+            " (ts, branch, target, commit_sha, deployment_id, state, duration, log_offset, log_length, tree_hash)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                record.timestamp, record.branch, record.target, record.commit_sha,
+                record.deployment_id, record.state, record.duration_secs, offset, length,
+                record.tree_hash,
+            ),
+        )
+        if not cur.rowcount:
+            return
+        deploy_id = cur.lastrowid
+        conn.executemany(
+            "INSERT INTO phases (deploy_id, phase, secs) VALUES (?, ?, ?)",
+            [(deploy_id, name, secs) for name, secs in record.phases.items()],
+        )
+        conn.executemany(
+            "INSERT INTO health (deploy_id, endpoint, status, latency) VALUES (?, ?, ?, ?)",
+            [(deploy_id, h.get("endpoint"), h.get("status"), h.get("latency")) for h in record.health],
+        )
+
+    def append(self, record: DeployRecord) -> None:
+        """Append a record to the log and index it"""
+        self.log_path.parent.mkdir(parents=True, exist_ok=True)
+        line = (record.to_json() + "\n").encode("utf-8")
+        with open(self.log_path, "ab") as fh:
+            fh.write(line)
+            fh.flush()
+            os.fsync(fh.fileno())
+        # Indexing happens through the normal catch-up path so that concurrent
+        # writers never index the same offset twice.
+        with self._connect():
+            pass
+
+    def _load(self, offset: int, length: int) -> DeployRecord:
+        with open(self.log_path, "rb") as fh:
+            fh.seek(offset)
+            return DeployRecord.from_dict(json.loads(fh.read(length).decode("utf-8")))
+
+    def recent(
+        self,
+        branch: Optional[str] = None,
+        state: Optional[str] = None,
+        limit: int = 20,
+        target: Optional[str] = None,
+    ) -> List[DeployRecord]:
+        """Most recent records first, optionally filtered by branch, state and target"""
+        clauses: List[str] = []
+        params: List[Any] = []
+        if branch:
+            clauses.append("branch = ?")
+            params.append(branch)
+        if state:
+            clauses.append("state = ?")
+            params.append(state)
+        if target:
+            clauses.append("target = ?")
+            params.append(target)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT log_offset, log_length FROM deploys {where} ORDER BY ts DESC LIMIT ?",
+                (*params, limit),
+            ).fetchall()
+        return [self._load(offset, length) for offset, length in rows]
+
+    def last(self, branch: str, state: str = "READY", target: Optional[str] = None) -> Optional[DeployRecord]:
+        """Latest record for a branch in the given state"""
+        found = self.recent(branch=branch, state=state, limit=1, target=target)
+        return found[0] if found else None
+
+    def phase_trend(self, phase: str, branch: Optional[str] = None, limit: int = 50) -> List[Tuple[str, float]]:
+        """(timestamp, seconds) for the most recent runs of a phase, oldest first"""
+        sql = (
+            "SELECT d.ts, p.secs FROM phases p JOIN deploys d ON d.id = p.deploy_id"
+            " WHERE p.phase = ?" + (" AND d.branch = ?" if branch else "") +
+            " ORDER BY d.ts DESC LIMIT ?"
+        )
+        params: Tuple[Any, ...] = (phase, branch, limit) if branch else (phase, limit)
+        with self._connect() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        return [(ts, secs) for ts, secs in reversed(rows)]
+
+
+def record_history(record: DeployRecord, logger: logging.Logger, history: Optional[DeployHistory] = None) -> None:
+    """Persist a run record; history failures never fail the deploy"""
+    if CASSETTE is not None and CASSETTE.replaying:
+        logger.info("Replay: not recording deploy history")
+        return
+    import sqlite3
+
+    try:
+        (history or DeployHistory()).append(record)
+        logger.info(f"History record appended to {HISTORY_LOG}")
+    except (OSError, sqlite3.Error) as e:
+        logger.warning(f"Failed to record deploy history: {e}")
+
+
+# ---------------- Deployment analytics ----------------
+
+class P2Quantile:
+    """Streaming quantile estimate (Jain & Chlamtac P² algorithm) in O(1) memory"""
+
+    def __init__(self, q: float):
+        self.q = q
+        self.count = 0
+        self._heights: List[float] = []
+        self._pos = [1.0, 2.0, 3.0, 4.0, 5.0]
+        self._desired = [1.0, 1 + 2 * q, 1 + 4 * q, 3 + 2 * q, 5.0]
+        self._incr = [0.0, q / 2, q, (1 + q) / 2, 1.0]
+
+    def add(self, x: float) -> None:
+        self.count += 1
+        h = self._heights
+        if len(h) < 5:
+            h.append(x)
+            h.sort()
+            return
+        if x < h[0]:
+            h[0] = x
+            k = 0
+        elif x >= h[4]:
+            h[4] = x
+            k = 3
+        else:
+            k = next(i for i in range(4) if h[i] <= x < h[i + 1])
+        for i in range(k + 1, 5):
+            self._pos[i] += 1
+        for i in range(5):
+            self._desired[i] += self._incr[i]
+        for i in range(1, 4):
+            d = self._desired[i] - self._pos[i]
+            if (d >= 1 and self._pos[i + 1] - self._pos[i] > 1) or (d <= -1 and self._pos[i - 1] - self._pos[i] < -1):
+                step = 1 if d > 0 else -1
+                n_prev, n, n_next = self._pos[i - 1], self._pos[i], self._pos[i + 1]
+                candidate = h[i] + step / (n_next - n_prev) * (
+                    (n - n_prev + step) * (h[i + 1] - h[i]) / (n_next - n)
+                    + (n_next - n - step) * (h[i] - h[i - 1]) / (n - n_prev)
+                )
+                if not h[i - 1] < candidate < h[i + 1]:
+                    candidate = h[i] + step * (h[i + step] - h[i]) / (self._pos[i + step] - n)
+                h[i] = candidate
+                self._pos[i] += step
+
+    def value(self) -> Optional[float]:
+        h = self._heights
+        if not h:
+            return None
+        if self.count <= 5:
+            # Exact (nearest-rank) for the first few samples
+            return h[min(len(h) - 1, max(0, int(round(self.q * (len(h) - 1)))))]
+        return h[2]
+
+
+class SeriesStats:
+    """Count/mean/median/p95/max of a numeric series in constant memory"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.median = P2Quantile(0.5)
+        self.p95 = P2Quantile(0.95)
+
+    def add(self, value: Optional[float]) -> None:
+        if value is None:
+            return
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.median.add(value)
+        self.p95.add(value)
+
+    def summary(self) -> Dict[str, Any]:
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 3),
+            "median": round(self.median.value() or 0.0, 3),
+            "p95": round(self.p95.value() or 0.0, 3),
+            "max": round(self.max, 3),
+        }
+
+
+# Report states that are not deploy attempts and are excluded from failure rates
+NON_DEPLOY_STATES = {"DRY_RUN", "SKIPPED", "SUPERSEDED", "NOOP"}
+
+
+def classify_state(record: DeployRecord) -> DeployStatus:
+    """Map a raw report state (Vercel readyState or script state) onto DeployStatus"""
+    state = (record.state or "").upper()
+    if state == "READY":
+        return DeployStatus.SUCCESS
+    if "rollback" in record.phases:
+        return DeployStatus.ROLLBACK
+    if state.startswith("TIMEOUT"):
+        return DeployStatus.TIMEOUT
+    if state == "FAILED":
+        return DeployStatus.FAILED
+    if state == "CLI_SUCCESS_NO_URL":
+        return DeployStatus.FALLBACK
+    return DeployStatus.ERROR
+
+
+def parse_text_report(path: Path) -> Optional[DeployRecord]:
+    """Parse a legacy reports/deploy_*.txt file into a DeployRecord"""
+    record: Optional[DeployRecord] = None
+    section = ""
+    try:
+        with open(path, encoding="utf-8") as fh:
+            for raw in fh:
+                line = raw.rstrip("\n")
+                if not line:
+                    continue
+                if not line.startswith(" "):
+                    key, _, value = line.partition(": ")
+                    section = key.rstrip(":") if line.endswith(":") else ""
+                    if key == "Timestamp":
+                        record = DeployRecord(timestamp=value.strip(), branch="")
+                    elif record is None:
+                        continue
+                    elif key == "Actor":
+                        record.actor = value.strip()
+                    elif key == "Branch":
+                        record.branch = value.strip()
+                    elif key == "Commit":
+                        record.commit_sha = value.strip()
+                    elif key == "Title":
+                        record.commit_title = value.strip()
+                    continue
+                if record is None:
+                    continue
+                item = line.strip()
+                if section == "Deployment":
+                    key, _, value = item.partition(": ")
+                    if key == "state":
+                        record.state = value.strip()
+                    elif key == "id" and value.strip() != "unknown":
+                        record.deployment_id = value.strip()
+                    elif key == "url":
+                        record.deployment_url = value.strip() or None
+                    elif key == "target" and value.strip():
+                        record.target = value.strip()
+                elif section == "Health checks" and item.startswith("GET "):
+                    # "GET /api/health -> 200 in 0.35s"
+                    try:
+                        ep, _, rest = item[4:].partition(" -> ")
+                        status, _, latency = rest.partition(" in ")
+                        record.health.append(
+                            {"endpoint": ep, "status": int(status), "latency": float(latency.rstrip("s"))}
+                        )
+                    except ValueError:
+                        continue
+                elif section == "Phases":
+                    name, _, secs = item.partition(": ")
+                    try:
+                        record.phases[name] = float(secs.rstrip("s"))
+                    except ValueError:
+                        continue
+    except OSError:
+        return None
+    return record
+
+
+def iter_text_reports(reports_dir: Path = REPORTS_DIR, before: Optional[str] = None) -> Iterator[DeployRecord]:
+    """Stream legacy text reports, optionally only those older than a timestamp"""
+    if not reports_dir.is_dir():
+        return
+    with os.scandir(reports_dir) as entries:
+        for entry in entries:
+            if not (entry.name.startswith("deploy_") and entry.name.endswith(".txt")):
+                continue
+            record = parse_text_report(Path(entry.path))
+            if record is None:
+                continue
+            if before and _parse_ts(record.timestamp) >= _parse_ts(before):
+                continue
+            yield record
+
+
+def iter_history_log(log_path: Path = HISTORY_LOG) -> Iterator[DeployRecord]:
+    """Stream structured records from the JSONL history log"""
+    if not log_path.exists():
+        return
+    with open(log_path, encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                yield DeployRecord.from_dict(json.loads(line))
+            except (ValueError, TypeError):
+                continue
+
+
+def iter_deploy_records(source: str = "auto", reports_dir: Path = REPORTS_DIR, log_path: Path = HISTORY_LOG) -> Iterator[DeployRecord]:
+    """Stream all known deploy records.
+
+    Runs since the structured log was introduced write both a text report and
+    a JSONL record; in "auto" mode text reports are only used for the period
+    before the first JSONL record, so no run is counted twice.
+    """
+    first_structured: Optional[str] = None
+    if source in ("auto", "jsonl"):
+        for record in iter_history_log(log_path):
+            first_structured = first_structured or record.timestamp
+            yield record
+    if source == "text" or source == "auto":
+        yield from iter_text_reports(reports_dir, before=first_structured if source == "auto" else None)
+
+
+def _parse_ts(value: str) -> datetime:
+    try:
+        ts = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return datetime.min.replace(tzinfo=timezone.utc)
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def parse_window(spec: str) -> Optional[float]:
+    """'24h', '7d', '30m', '2w' -> seconds; 'all' -> None"""
+    spec = spec.strip().lower()
+    if spec == "all":
+        return None
+    units = {"m": 60, "h": 3600, "d": 86400, "w": 604800}
+    if len(spec) < 2 or spec[-1] not in units:
+        raise ValueError(f"Invalid window '{spec}' (expected e.g. 24h, 7d, 2w or all)")
+    return float(spec[:-1]) * units[spec[-1]]
+
+
+class WindowStats:
+    """Aggregates for all deploy records inside one time window"""
+
+    def __init__(self, name: str, seconds: Optional[float]):
+        self.name = name
+        self.seconds = seconds
+        self.runs = 0
+        self.attempts = 0
+        self.by_status: Dict[str, int] = {s.value: 0 for s in DeployStatus}
+        self.build = SeriesStats()
+        self.time_to_ready = SeriesStats()
+        self.deploy_phase = SeriesStats()
+        self.duration = SeriesStats()
+        self.retries = SeriesStats()
+        self.health: Dict[str, SeriesStats] = {}
+
+    def add(self, record: DeployRecord) -> None:
+        self.runs += 1
+        if record.state in NON_DEPLOY_STATES:
+            return
+        self.attempts += 1
+        self.by_status[classify_state(record).value] += 1
+        self.build.add(record.build_secs)
+        self.time_to_ready.add(record.time_to_ready_secs)
+        self.deploy_phase.add(record.phases.get("deploy"))
+        self.duration.add(record.duration_secs or None)
+        self.retries.add(float(record.retries))
+        for check in record.health:
+            self.health.setdefault(check.get("endpoint") or "?", SeriesStats()).add(check.get("latency"))
+
+    def summary(self) -> Dict[str, Any]:
+        failures = self.attempts - self.by_status[DeployStatus.SUCCESS.value]
+        return {
+            "window": self.name,
+            "runs": self.runs,
+            "deploy_attempts": self.attempts,
+            "failure_rate": round(failures / self.attempts, 4) if self.attempts else None,
+            "by_status": {k: v for k, v in self.by_status.items() if v},
+            "build_secs": self.build.summary(),
+            "time_to_ready_secs": self.time_to_ready.summary(),
+            "deploy_phase_secs": self.deploy_phase.summary(),
+            "run_secs": self.duration.summary(),
+            "retries": self.retries.summary(),
+            "health_latency_secs": {ep: s.summary() for ep, s in sorted(self.health.items())},
+        }
+
+
+def compute_deploy_stats(
+    records: Iterable[DeployRecord],
+    windows: List[str],
+    branch: Optional[str] = None,
+    now: Optional[datetime] = None,
+) -> List[Dict[str, Any]]:
+    """Single pass over a record stream, feeding every matching window"""
+    now = now or datetime.now(timezone.utc)
+    buckets = [WindowStats(w, parse_window(w)) for w in windows]
+    for record in records:
+        if branch and record.branch != branch:
+            continue
+        age = (now - _parse_ts(record.timestamp)).total_seconds()
+        for bucket in buckets:
+            if bucket.seconds is None or age <= bucket.seconds:
+                bucket.add(record)
+    return [b.summary() for b in buckets]
+
+
+def _fmt_series(stats: Dict[str, Any]) -> str:
+    if not stats.get("count"):
+        return "n/a"
+    return f"median {stats['median']:.2f}s  p95 {stats['p95']:.2f}s  max {stats['max']:.2f}s  (n={stats['count']})"
+
+
+def print_deploy_stats(summaries: List[Dict[str, Any]]) -> None:
+    for s in summaries:
+        print(f"=== Window: {s['window']} ===")
+        rate = s["failure_rate"]
+        print(f"  Runs: {s['runs']}  Deploy attempts: {s['deploy_attempts']}  "
+              f"Failure rate: {'n/a' if rate is None else f'{rate * 100:.1f}%'}")
+        for status, count in s["by_status"].items():
+            print(f"    {status}: {count}")
+        print(f"  Build time:      {_fmt_series(s['build_secs'])}")
+        print(f"  Time to READY:   {_fmt_series(s['time_to_ready_secs'])}")
+        print(f"  Deploy phase:    {_fmt_series(s['deploy_phase_secs'])}")
+        print(f"  Total run:       {_fmt_series(s['run_secs'])}")
+        retries = s["retries"]
+        if retries.get("count"):
+            print(f"  Retries/run:     mean {retries['mean']:.2f}  p95 {retries['p95']:.0f}  max {retries['max']:.0f}")
+        if s["health_latency_secs"]:
+            print("  Health latency:")
+            for ep, stats in s["health_latency_secs"].items():
+                print(f"    {ep}: {_fmt_series(stats)}")
+        print("")
+
+
+def stats_main(argv: List[str]) -> int:
+    """`stats` subcommand: aggregate deploy history without loading it into memory"""
+    parser = argparse.ArgumentParser(
+        prog="push_and_deploy.py stats",
+        description="Deployment analytics over reports/deploy_*.txt and the structured history log",
+    )
+    parser.add_argument("--window", action="append", dest="windows",
+                        help="Time window to aggregate (e.g. 24h, 7d, 4w, all); repeatable (default: 7d, 30d, all)")
+    parser.add_argument("--branch", help="Only include runs for this branch")
+    parser.add_argument("--source", choices=["auto", "jsonl", "text"], default="auto",
+                        help="Record source (default: auto = JSONL plus older text reports)")
+    parser.add_argument("--reports-dir", type=Path, default=REPORTS_DIR, help="Directory holding deploy reports")
+    parser.add_argument("--json", action="store_true", help="Emit JSON instead of a table")
+    args = parser.parse_args(argv)
+
+    windows = args.windows or ["7d", "30d", "all"]
+    try:
+        for w in windows:
+            parse_window(w)
+    except ValueError as e:
+        parser.error(str(e))
+
+    records = iter_deploy_records(
+        args.source, reports_dir=args.reports_dir, log_path=args.reports_dir / HISTORY_LOG.name
+    )
+    summaries = compute_deploy_stats(records, windows, branch=args.branch)
+    if args.json:
+        print(json.dumps(summaries, indent=2))
+    else:
+        print_deploy_stats(summaries)
+    return 0
+
+
+# ---------------- Prometheus textfile metrics ----------------
+
+DURATION_BUCKETS: Tuple[float, ...] = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 1800)
+LATENCY_BUCKETS: Tuple[float, ...] = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+
+def _fmt_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    value = round(value, 6)
+    return repr(value) if value != int(value) else str(int(value))
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _parse_labels(text: str) -> LabelSet:
+    labels: List[Tuple[str, str]] = []
+    i = 0
+    while i < len(text):
+        eq = text.index("=", i)
+        key = text[i:eq].strip().lstrip(",").strip()
+        j = eq + 2  # skip ="
+        value_chars: List[str] = []
+        while text[j] != '"':
+            if text[j] == "\\":
+                j += 1
+                value_chars.append({"n": "\n"}.get(text[j], text[j]))
+            else:
+                value_chars.append(text[j])
+            j += 1
+        labels.append((key, "".join(value_chars)))
+        i = j + 1
+    return tuple(labels)
+
+
+class PromMetrics:
+    """Minimal counter/histogram registry rendered in the node-exporter textfile format.
+
+    Loading an existing file and adding to it keeps the series cumulative
+    across runs, which is what Prometheus expects from counters.
+    """
+
+    def __init__(self):
+        self.meta: Dict[str, Tuple[str, str]] = {}  # name -> (type, help)
+        self.counters: Dict[str, Dict[LabelSet, float]] = {}
+        self.gauges: Dict[str, Dict[LabelSet, float]] = {}
+        self.histograms: Dict[str, Dict[LabelSet, Dict[str, Any]]] = {}
+        self.buckets: Dict[str, Tuple[float, ...]] = {}
+
+    def declare(self, name: str, kind: str, help_text: str, buckets: Tuple[float, ...] = DURATION_BUCKETS) -> None:
+        self.meta.setdefault(name, (kind, help_text))
+        if kind == "counter":
+            self.counters.setdefault(name, {})
+        elif kind == "gauge":
+            self.gauges.setdefault(name, {})
+        else:
+            self.histograms.setdefault(name, {})
+            self.buckets.setdefault(name, tuple(buckets))
+
+    def inc(self, name: str, labels: Optional[Dict[str, str]] = None, value: float = 1.0) -> None:
+        key = tuple(sorted((labels or {}).items()))
+        series = self.counters[name]
+        series[key] = series.get(key, 0.0) + value
+
+    def set(self, name: str, labels: Optional[Dict[str, str]] = None, value: float = 0.0) -> None:
+        self.gauges[name][tuple(sorted((labels or {}).items()))] = value
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        key = tuple(sorted((labels or {}).items()))
+        bounds = self.buckets[name]
+        h = self.histograms[name].setdefault(key, {"buckets": [0.0] * len(bounds), "sum": 0.0, "count": 0.0})
+        for i, bound in enumerate(bounds):
+            if value <= bound:
+                h["buckets"][i] += 1
+        h["sum"] += value
+        h["count"] += 1
+
+    def load(self, path: Path) -> None:
+        """Merge previously written series from a textfile into this registry"""
+        if not path.exists():
+            return
+        types: Dict[str, str] = {}
+        for line in path.read_text(encoding="utf-8").splitlines():
+            if line.startswith("# TYPE "):
+                _, _, name, kind = line.split(" ", 3)
+                types[name] = kind
+                continue
+            if not line or line.startswith("#"):
+                continue
+            series, _, raw_value = line.rpartition(" ")
+            try:
+                value = float(raw_value)
+            except ValueError:
+                continue
+            name, _, label_text = series.partition("{")
+            labels = _parse_labels(label_text.rstrip("}")) if label_text else ()
+            if types.get(name) == "counter" and name in self.counters:
+                self.counters[name][labels] = self.counters[name].get(labels, 0.0) + value
+                continue
+            if types.get(name) == "gauge" and name in self.gauges:
+                self.gauges[name][labels] = value
+                continue
+            for suffix in ("_bucket", "_sum", "_count"):
+                base = name[: -len(suffix)]
+                if name.endswith(suffix) and types.get(base) == "histogram" and base in self.histograms:
+                    self._load_histogram_sample(base, suffix, labels, value)
+                    break
+
+    def _load_histogram_sample(self, name: str, suffix: str, labels: LabelSet, value: float) -> None:
+        bounds = self.buckets[name]
+        le = dict(labels).get("le")
+        key = tuple(kv for kv in labels if kv[0] != "le")
+        h = self.histograms[name].setdefault(key, {"buckets": [0.0] * len(bounds), "sum": 0.0, "count": 0.0})
+        if suffix == "_bucket":
+            if le is None or le == "+Inf":
+                return
+            try:
+                idx = bounds.index(float(le))
+            except ValueError:
+                return  # bucket layout changed; old bucket is dropped
+            h["buckets"][idx] += value
+        elif suffix == "_sum":
+            h["sum"] += value
+        else:
+            h["count"] += value
+
+    def render(self) -> str:
+        def series(name: str, labels: LabelSet) -> str:
+            if not labels:
+                return name
+            inner = ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels)
+            return f"{name}{{{inner}}}"
+
+        out: List[str] = []
+        for name, (kind, help_text) in sorted(self.meta.items()):
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            if kind in ("counter", "gauge"):
+                values = self.counters[name] if kind == "counter" else self.gauges[name]
+                for labels, value in sorted(values.items()):
+                    out.append(f"{series(name, labels)} {_fmt_value(value)}")
+                continue
+            bounds = self.buckets[name]
+            for labels, h in sorted(self.histograms[name].items()):
+                for bound, count in zip(bounds, h["buckets"]):
+                    out.append(f"{series(name + '_bucket', labels + (('le', _fmt_value(bound)),))} {_fmt_value(count)}")
+                out.append(f"{series(name + '_bucket', labels + (('le', '+Inf'),))} {_fmt_value(h['count'])}")
+                out.append(f"{series(name + '_sum', labels)} {_fmt_value(round(h['sum'], 6))}")
+                out.append(f"{series(name + '_count', labels)} {_fmt_value(h['count'])}")
+        return "\n".join(out) + "\n"
+
+
+METRICS_PREFIX = "zignals_deploy_"
+
+
+def declare_deploy_metrics(registry: PromMetrics) -> None:
+    p = METRICS_PREFIX
+    registry.declare(p + "runs_total", "counter", "Deploy runs by branch and final state")
+    registry.declare(p + "last_run_timestamp_seconds", "gauge", "Unix time of the last deploy run by branch and final state")
+    registry.declare(p + "run_duration_seconds", "histogram", "Wall time of complete deploy runs")
+    registry.declare(p + "phase_duration_seconds", "histogram", "Wall time per deploy phase")
+    registry.declare(p + "subprocess_total", "counter", "Subprocesses started by command")
+    registry.declare(p + "subprocess_seconds_total", "counter", "Wall time spent in subprocesses by command")
+    registry.declare(p + "vercel_api_requests_total", "counter", "Vercel API request attempts by method and status")
+    registry.declare(p + "retries_total", "counter", "Retries across git commands, Vercel API calls and health checks")
+    registry.declare(p + "health_check_latency_seconds", "histogram", "Health check latency per endpoint", LATENCY_BUCKETS)
+
+
+def build_run_metrics(registry: PromMetrics, record: DeployRecord, tracer: Optional[Tracer] = None) -> None:
+    """Add one run's record (and, if given, its trace spans) to a metrics registry"""
+    p = METRICS_PREFIX
+    declare_deploy_metrics(registry)
+    state = record.state if record.state in NON_DEPLOY_STATES else classify_state(record).value
+    labels = {"branch": record.branch, "state": state}
+    registry.inc(p + "runs_total", labels)
+    registry.set(p + "last_run_timestamp_seconds", labels, round(_parse_ts(record.timestamp).timestamp(), 3))
+    registry.observe(p + "run_duration_seconds", record.duration_secs, {"branch": record.branch})
+    for phase_name, secs in record.phases.items():
+        registry.observe(p + "phase_duration_seconds", secs, {"phase": phase_name})
+    for span in tracer.spans("subprocess") if tracer else []:
+        command = " ".join(span["args"].get("argv", [])[:2]) or span["name"]
+        registry.inc(p + "subprocess_total", {"command": command})
+        registry.inc(p + "subprocess_seconds_total", {"command": command}, span["dur"] / 1_000_000)
+    for span in tracer.spans("vercel_api") if tracer else []:
+        method = span["name"].split(" ", 1)[0]
+        registry.inc(p + "vercel_api_requests_total", {"method": method, "status": str(span["args"].get("status", 0))})
+    registry.inc(p + "retries_total", {"branch": record.branch}, record.retries)
+    for check in record.health:
+        registry.observe(p + "health_check_latency_seconds", check.get("latency") or 0.0, {"endpoint": check.get("endpoint") or "?"})
+
+
+def write_metrics_file(path: Path, records: List[DeployRecord], tracer: Tracer) -> None:
+    """Merge this run into the cumulative metrics textfile and replace it atomically.
+
+    A matrix run has one record per branch; the trace spans are counted once.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.with_name(path.name + ".lock"), "w") as lock:
+        try:
+            import fcntl
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        except ImportError:
+            pass  # no advisory locking on this platform
+        registry = PromMetrics()
+        declare_deploy_metrics(registry)
+        registry.load(path)
+        for i, record in enumerate(records):
+            build_run_metrics(registry, record, tracer if i == 0 else None)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            fh.write(registry.render())
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+
+
+# ---------------- Deploy queue ----------------
+
+DEPLOY_QUEUE_DIR = REPO_ROOT / ".git" / "deploy-queue"
+QUEUE_POLL_SECS = 1.0
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class DeployQueue:
+    """Per-branch, file-locked deploy queue that coalesces superseded requests.
+
+    Every run takes a ticket and then waits for the branch's run lock, so runs
+    against the same checkout never overlap. A ticket is superseded as soon as
+    a newer live ticket exists for the branch: the newer run stages the same
+    working tree and deploys a descendant commit, so the older run stops
+    waiting (for the lock or for its build) instead of deploying.
+    """
+
+    def __init__(self, branch: str, queue_dir: Path = DEPLOY_QUEUE_DIR):
+        safe = "".join(c if c.isalnum() or c in "._-" else "_" for c in branch)
+        self.branch = branch
+        self.state_path = queue_dir / f"{safe}.json"
+        self.lock_path = queue_dir / f"{safe}.lock"
+        self.ticket: Optional[int] = None
+        self._run_lock: Optional[Any] = None
+
+    @contextmanager
+    def _state(self):
+        """Read-modify-write the queue state under a short-lived lock"""
+        import fcntl
+
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.state_path.with_suffix(".state.lock"), "w") as guard:
+            fcntl.flock(guard.fileno(), fcntl.LOCK_EX)
+            try:
+                state = json.loads(self.state_path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                state = {}
+            state.setdefault("seq", 0)
+            # Drop tickets of runs that died without cleaning up
+            state["pending"] = [t for t in state.get("pending", []) if _pid_alive(t["pid"])]
+            yield state
+            tmp = self.state_path.with_suffix(".json.tmp")
+            tmp.write_text(json.dumps(state), encoding="utf-8")
+            os.replace(tmp, self.state_path)
+
+    def _pending(self) -> List[Dict[str, Any]]:
+        """Live tickets, read under a shared lock without writing the state back (polled while waiting)"""
+        import fcntl
+
+        guard_path = self.state_path.with_suffix(".state.lock")
+        if not guard_path.exists():
+            return []
+        with open(guard_path, "r") as guard:
+            fcntl.flock(guard.fileno(), fcntl.LOCK_SH)
+            try:
+                state = json.loads(self.state_path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                return []
+        return [t for t in state.get("pending", []) if _pid_alive(t["pid"])]
+
+    def enqueue(self) -> int:
+        with self._state() as state:
+            state["seq"] += 1
+            self.ticket = state["seq"]
+            state["pending"].append({"seq": self.ticket, "pid": os.getpid(), "requested_at": time.time()})
+        return self.ticket
+
+    def superseded(self) -> bool:
+        """True when a newer live request for the same branch is queued"""
+        if self.ticket is None:
+            return False
+        return any(t["seq"] > self.ticket for t in self._pending())
+
+    def acquire(self, poll: float = QUEUE_POLL_SECS) -> bool:
+        """Wait for the branch run lock; False if superseded while waiting"""
+        import fcntl
+
+        self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+        fh = open(self.lock_path, "w")
+        while True:
+            if self.superseded():
+                fh.close()
+                return False
+            try:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                if BUDGET.expired():
+                    fh.close()
+                    BUDGET.note_exhausted("queue_wait")
+                    raise DeployError("Time budget exhausted waiting for the deploy queue", DeployStatus.TIMEOUT, retryable=False)
+                pause(poll, "queue")
+                continue
+            if self.superseded():
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+                fh.close()
+                return False
+            self._run_lock = fh
+            return True
+
+    def release(self) -> None:
+        if self.ticket is not None:
+            with self._state() as state:
+                state["pending"] = [t for t in state["pending"] if t["seq"] != self.ticket]
+            self.ticket = None
+        if self._run_lock is not None:
+            self._run_lock.close()  # closing the descriptor drops the flock
+            self._run_lock = None
+
+
+def cancel_superseded_deployments(vercel: VercelAPI, branch: str, keep_sha: str, target: str = "production") -> List[str]:
+    """Cancel in-flight deployments of older commits on a branch; returns cancelled ids"""
+    cancelled: List[str] = []
+    data = vercel.list_deployments_v13(limit=20)
+    for d in data.get("deployments") or data.get("data") or []:
+        state = d.get("readyState") or d.get("state")
+        meta = d.get("meta") or {}
+        d_branch = meta.get("gitBranch") or meta.get("githubCommitRef") or meta.get("branch")
+        d_sha = meta.get("githubCommitSha") or meta.get("gitCommitSha")
+        d_target = d.get("target") or d.get("deploymentTarget")
+        if state not in ("QUEUED", "INITIALIZING", "BUILDING") or d_branch != branch or d_target != target:
+            continue
+        if not d_sha or d_sha == keep_sha:
+            continue
+        dep_id = d.get("uid") or d.get("id")
+        if dep_id and vercel.cancel_deployment(dep_id):
+            print(f"🛑 Cancelled superseded deployment {dep_id} ({d_sha[:7]})")
+            cancelled.append(dep_id)
+    return cancelled
+
+
+def write_report(
+    report_path: Path,
+    actor_name: str,
+    actor_email: str,
+    branch: str,
+    commit_sha: str,
+    commit_title: str,
+    diff_summary: str,
+    dep: Optional[Dict[str, Any]],
+    dep_state: str,
+    health: Optional[List[Tuple[str, int, float]]],
+    phases: Optional[Dict[str, float]] = None,
+    projects: Optional[List["ProjectResult"]] = None,
+    pushes: Optional[List[Dict[str, Any]]] = None,
+) -> None:
+    ts = datetime.now(timezone.utc).isoformat()
+    lines: List[str] = []
+    lines.append(f"Timestamp: {ts}")
+    lines.append(f"Actor: {actor_name} <{actor_email}>")
+    lines.append(f"Branch: {branch}")
+    lines.append(f"Commit: {commit_sha}")
+    lines.append(f"Title: {commit_title}")
+    lines.append("")
+    if diff_summary:
+        lines.append("Diff summary:")
+        lines.append(diff_summary.strip())
+        lines.append("")
+    lines.append("Deployment:")
+    if dep:
+        dep_id = dep.get("uid") or dep.get("id") or "unknown"
+        dep_url = dep.get("url") or ""
+        dep_target = dep.get("target") or dep.get("deploymentTarget") or ""
+        created = dep.get("createdAt")
+        inspect = dep.get("inspectorUrl") or dep.get("inspectUrl") or ""
+        lines.append(f"  id: {dep_id}")
+        lines.append(f"  url: {dep_url}")
+        lines.append(f"  target: {dep_target}")
+        lines.append(f"  state: {dep_state}")
+        lines.append(f"  createdAt: {created}")
+        if inspect:
+            lines.append(f"  buildLogs: {inspect}")
+    else:
+        lines.append(f"  state: {dep_state}")
+    lines.append("")
+    if projects:
+        lines.append("Projects:")
+        for result in projects:
+            lines.append(f"  {result.name} ({result.kind}):")
+            if result.url:
+                lines.append(f"    url: {result.url}")
+            if result.deployment_id:
+                lines.append(f"    id: {result.deployment_id}")
+            lines.append(f"    state: {result.state}")
+            lines.append(f"    duration: {result.duration_secs:.2f}s")
+            if result.error:
+                lines.append(f"    error: {result.error}")
+            for ep, status, latency in result.health or []:
+                lines.append(f"    GET {ep} -> {status} in {latency:.2f}s")
+        lines.append("")
+    if health:
+        lines.append("Health checks:")
+        for ep, status, latency in health:
+            lines.append(f"  GET {ep} -> {status} in {latency:.2f}s")
+        lines.append("")
+    if pushes:
+        lines.append("Push:")
+        for push in pushes:
+            lines.append(f"  {PushResult(**push).describe()}")
+        lines.append("")
+    if phases:
+        lines.append("Phases:")
+        for name, secs in phases.items():
+            lines.append(f"  {name}: {secs:.2f}s")
+        lines.append("")
+    # Determine exit state summary
+    lines.append("Exit: " + ("0" if dep_state in SUCCESS_STATES else "1"))
+
+    report_path.write_text("\n".join(lines), encoding="utf-8")
+
+
+def deployable_tree_hash(rev: str = "HEAD", cwd: Optional[Path] = None) -> Optional[str]:
+    """Content address of the INCLUDE_PATHS subset of a commit.
+
+    `git ls-tree` (non-recursive) lists each included top-level path with its
+    tree/blob id, and those ids already hash everything underneath, so a
+    single cheap call identifies exactly what Vercel would build.
+    """
+    res = Shell.run_no_check(["git", "ls-tree", "--full-tree", rev, "--", *INCLUDE_PATHS], cwd=cwd)
+    if res.returncode != 0:
+        return None
+    import hashlib
+
+    return hashlib.sha1(res.stdout.encode("utf-8")).hexdigest()
+
+
+def unchanged_since_last_ready(tree_hash: Optional[str], branch: str, target: str, logger: logging.Logger) -> Optional[DeployRecord]:
+    """The last READY record for branch/target if it deployed exactly this tree"""
+    if not tree_hash:
+        return None
+    # The history is external state too: replays answer from the cassette
+    key = f"{branch} {target} {tree_hash}"
+    if CASSETTE is not None and CASSETTE.replaying:
+        found = CASSETTE.lookup("history", key).get("record")
+        return DeployRecord.from_dict(found) if found else None
+    import sqlite3
+
+    started = time.monotonic()
+    try:
+        last = DeployHistory().last(branch, "READY", target=target)
+    except (OSError, sqlite3.Error) as e:
+        logger.warning(f"Deploy history unavailable, not skipping: {e}")
+        return None
+    match = last if last is not None and last.tree_hash == tree_hash else None
+    if CASSETTE is not None:
+        CASSETTE.record("history", key, started, record=asdict(match) if match else None)
+    return match
+
+
+def get_diff_summary(cwd: Optional[Path] = None) -> str:
+    # Try HEAD~1..HEAD; if first commit, skip (resolving the parent is O(1), counting history is not)
+    parent = Shell.run_no_check(["git", "rev-parse", "--verify", "-q", "HEAD~1"], cwd=cwd)
+    if parent.returncode != 0:
+        return "(first commit or no prior commit)"
+    res = Shell.run_no_check(["git", "--no-pager", "diff", "--shortstat", "HEAD~1..HEAD"], cwd=cwd)
+    return res.stdout.strip()
+
+
+# ---------------- Multi-project deploys ----------------
+
+PROJECTS_MANIFEST = REPO_ROOT / "deploy-projects.json"
+
+
+@dataclass
+class ProjectSpec:
+    """One deployable project of the repository (an entry of deploy-projects.json)"""
+    name: str
+    kind: str = "vercel"  # "vercel" or "compose"
+    paths: List[str] = field(default_factory=list)  # "dir/" prefixes or fnmatch globs
+    project_id: Optional[str] = None  # Vercel project name or id ...
+    project_env: Optional[str] = None  # ... or the env var holding it
+    root: Optional[str] = None  # Working directory for the CLI / compose, relative to the repo root
+    compose_files: List[str] = field(default_factory=list)
+    url: Optional[str] = None  # Base URL for health checks of compose projects
+    health: List[str] = field(default_factory=list)  # Endpoint paths (default: the standard set for Vercel)
+
+    def matches(self, path: str) -> bool:
+        for pattern in self.paths:
+            if pattern.endswith("/"):
+                if path.startswith(pattern):
+                    return True
+            elif path == pattern or fnmatch.fnmatchcase(path, pattern):
+                return True
+        return False
+
+    def vercel_project(self) -> Optional[str]:
+        if self.project_id:
+            return self.project_id
+        return os.environ.get(self.project_env) if self.project_env else None
+
+    def workdir(self, checkout: Path = REPO_ROOT) -> Path:
+        return checkout / self.root if self.root else checkout
+
+
+@dataclass
+class ProjectResult:
+    name: str
+    kind: str
+    state: str = "SKIPPED"
+    deployment: Optional[Dict[str, Any]] = None
+    url: Optional[str] = None
+    health: Optional[List[Tuple[str, int, float]]] = None
+    duration_secs: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def deployment_id(self) -> Optional[str]:
+        if not self.deployment:
+            return None
+        return self.deployment.get("uid") or self.deployment.get("id")
+
+
+def load_projects_manifest(path: Path) -> List[ProjectSpec]:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError) as e:
+        raise DeployError(f"Cannot read projects manifest {path}: {e}", retryable=False)
+    known = set(ProjectSpec.__dataclass_fields__) - {"name"}
+    specs: List[ProjectSpec] = []
+    for name, raw in (data.get("projects") or {}).items():
+        unknown = set(raw) - known
+        if unknown:
+            raise DeployError(f"{path}: project '{name}' has unknown keys: {', '.join(sorted(unknown))}", retryable=False)
+        spec = ProjectSpec(name=name, **raw)
+        if spec.kind not in ("vercel", "compose"):
+            raise DeployError(f"{path}: project '{name}' has unknown kind '{spec.kind}'", retryable=False)
+        specs.append(spec)
+    if not specs:
+        raise DeployError(f"{path}: no projects defined", retryable=False)
+    return specs
+
+
+def remote_head(config: DeployConfig) -> Optional[str]:
+    """Remote-tracking head of the target branch, i.e. the start of the range a push sends"""
+    res = Shell.run_no_check(
+        ["git", "rev-parse", "--verify", "-q", f"refs/remotes/{config.remote_name}/{config.target_branch}"]
+    )
+    return res.stdout.strip() if res.returncode == 0 else None
+
+
+def changed_paths(base: Optional[str], head: str = "HEAD", cwd: Optional[Path] = None) -> Optional[List[str]]:
+    """Files touched in base..head (both sides of renames); None when the range is unknown"""
+    if not base:
+        return None
+    res = Shell.run_no_check(["git", "diff", "--name-only", "--no-renames", f"{base}..{head}"], cwd=cwd)
+    if res.returncode != 0:
+        return None
+    return [line for line in res.stdout.splitlines() if line]
+
+
+def affected_projects(specs: List[ProjectSpec], changed: Optional[List[str]]) -> List[ProjectSpec]:
+    # Unknown range (new branch, unrelated history): deploy everything rather than guess
+    if changed is None:
+        return list(specs)
+    return [spec for spec in specs if any(spec.matches(path) for path in changed)]
+
+
+def _health_endpoints(spec: ProjectSpec) -> Optional[List[Tuple[str, str]]]:
+    return [(ep, f"{spec.name} {ep}") for ep in spec.health] or None
+
+
+def deploy_vercel_project(spec: ProjectSpec, config: DeployConfig, logger: logging.Logger) -> ProjectResult:
+    result = ProjectResult(name=spec.name, kind=spec.kind)
+    project = spec.vercel_project()
+    if not project:
+        result.state = "CONFIG_ERROR"
+        result.error = f"no Vercel project id (set project_id or ${spec.project_env})"
+        return result
+    # Same path as a single-project run, so --vercel-cli/--prebuilt/the build cache mean the same here
+    result.deployment, result.state = deploy_with_fallback(
+        config, logger, project=project, workdir=spec.workdir(deploy_checkout(config))
+    )
+
+    result.url = (result.deployment or {}).get("url")
+    if result.state == "READY" and result.url:
+        with TRACER.span(f"health:{spec.name}"):
+            result.health = perform_health_checks(result.url, config, _health_endpoints(spec))
+    return result
+
+
+def deploy_compose_project(spec: ProjectSpec, config: DeployConfig, logger: logging.Logger) -> ProjectResult:
+    result = ProjectResult(name=spec.name, kind=spec.kind, url=spec.url)
+    cmd = ["docker", "compose"]
+    for compose_file in spec.compose_files:
+        cmd += ["-f", compose_file]
+    cmd += ["up", "-d", "--build"]
+    res = Shell.run_no_check(cmd, cwd=spec.workdir(deploy_checkout(config)), timeout=config.deployment_timeout * 60)
+    if res.returncode != 0:
+        result.state = "COMPOSE_ERROR"
+        result.error = res.stderr.strip()[-500:]
+        return result
+    result.state = "READY"
+    if spec.url:
+        with TRACER.span(f"health:{spec.name}"):
+            result.health = perform_health_checks(spec.url, config, _health_endpoints(spec) or [("/", spec.name)])
+    return result
+
+
+def deploy_projects(specs: List[ProjectSpec], config: DeployConfig, logger: logging.Logger) -> List[ProjectResult]:
+    """Deploy, wait for and health-check each project concurrently"""
+
+    def run_one(spec: ProjectSpec) -> ProjectResult:
+        start = time.perf_counter()
+        with TRACER.span(f"project:{spec.name}") as span:
+            try:
+                deploy = deploy_compose_project if spec.kind == "compose" else deploy_vercel_project
+                result = deploy(spec, config, logger)
+            except DeployError as e:
+                result = ProjectResult(name=spec.name, kind=spec.kind, state="ERROR", error=str(e))
+            span["state"] = result.state
+        result.duration_secs = round(time.perf_counter() - start, 3)
+        logger.info(f"Project {spec.name}: {result.state}")
+        return result
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=max(1, len(specs)), thread_name_prefix="project") as pool:
+        return list(pool.map(run_one, specs))
+
+
+def aggregate_project_state(results: List[ProjectResult]) -> str:
+    if not results:
+        return "NOOP"
+    failed = [r for r in results if r.state != "READY"]
+    if not failed:
+        return "READY"
+    return "FAILED: " + ", ".join(f"{r.name}={r.state}" for r in failed)
+
+
+def projects_main(argv: List[str]) -> int:
+    """`projects` subcommand: show which manifest projects a commit range affects.
+
+    With --ignore-build NAME it doubles as a Vercel "Ignored Build Step"
+    command (exit 0 skips the build, 1 builds), so pushes that do not touch a
+    project's paths do not rebuild it.
+    """
+    parser = argparse.ArgumentParser(
+        prog="push_and_deploy.py projects",
+        description="List the projects of deploy-projects.json affected by a commit range",
+    )
+    parser.add_argument("--manifest", type=Path, default=PROJECTS_MANIFEST, help="Projects manifest (default: deploy-projects.json)")
+    parser.add_argument("--base", help="Range start (default: $VERCEL_GIT_PREVIOUS_SHA or HEAD~1)")
+    parser.add_argument("--head", help="Range end (default: $VERCEL_GIT_COMMIT_SHA or HEAD)")
+    parser.add_argument("--ignore-build", metavar="NAME", help="Exit 0 if NAME is unaffected (skip build), 1 otherwise")
+    args = parser.parse_args(argv)
+
+    try:
+        specs = load_projects_manifest(args.manifest)
+    except DeployError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    base = args.base or os.environ.get("VERCEL_GIT_PREVIOUS_SHA") or "HEAD~1"
+    head = args.head or os.environ.get("VERCEL_GIT_COMMIT_SHA") or "HEAD"
+    changed = changed_paths(base, head)
+    affected = {spec.name for spec in affected_projects(specs, changed)}
+
+    if args.ignore_build:
+        if args.ignore_build not in {spec.name for spec in specs}:
+            print(f"Unknown project '{args.ignore_build}'; building", file=sys.stderr)
+            return 1
+        building = args.ignore_build in affected
+        print(f"{args.ignore_build}: {'changed, building' if building else 'unchanged, skipping build'} ({base[:12]}..{head[:12]})")
+        return 1 if building else 0
+
+    if changed is None:
+        print(f"Range {base}..{head} unavailable; treating every project as affected")
+    for spec in specs:
+        print(f"  {'*' if spec.name in affected else ' '} {spec.name} ({spec.kind}): {', '.join(spec.paths)}")
+    return 0
+
+
+# ---------------- Matrix preview deploys ----------------
+
+MATRIX_PARALLEL = 4
+MATRIX_POLL_SECS = 10
+# One list call per poll covers every in-flight build; anything older falls back to a direct lookup
+MATRIX_LIST_LIMIT = 100
+MATRIX_TERMINAL_STATES = ("READY", "ERROR", "CANCELED")
+
+
+@dataclass
+class MatrixEntry:
+    """One branch or pull request of a matrix run"""
+    name: str
+    remote_ref: str
+    sha: Optional[str] = None
+    deployment: Optional[Dict[str, Any]] = None
+    state: str = "PENDING"
+    created: float = 0.0
+    ready_secs: Optional[float] = None
+    error: Optional[str] = None
+    health: Optional[List[Tuple[str, int, float]]] = None
+
+    @property
+    def deployment_id(self) -> Optional[str]:
+        if not self.deployment:
+            return None
+        return self.deployment.get("uid") or self.deployment.get("id")
+
+
+def parse_matrix_ref(ref: str) -> MatrixEntry:
+    """Branch name or PR reference (#12, pr/12, pull/12, refs/pull/12/head) -> entry"""
+    ref = ref.strip()
+    for prefix in ("#", "pr/", "pull/", "refs/pull/"):
+        if ref.startswith(prefix):
+            number = ref[len(prefix):].split("/")[0]
+            if number.isdigit():
+                return MatrixEntry(name=f"pr/{number}", remote_ref=f"refs/pull/{number}/head")
+    if ref.startswith("refs/heads/"):
+        ref = ref[len("refs/heads/"):]
+    return MatrixEntry(name=ref, remote_ref=f"refs/heads/{ref}")
+
+
+def resolve_matrix_refs(entries: List[MatrixEntry], remote: str) -> None:
+    """Resolve every ref to its remote head commit with a single `git ls-remote`"""
+    res = Shell.run_no_check(["git", "ls-remote", remote, *[e.remote_ref for e in entries]], timeout=120)
+    if res.returncode != 0:
+        raise GitError(f"git ls-remote {remote} failed: {res.stderr.strip()}")
+    heads: Dict[str, str] = {}
+    for line in res.stdout.splitlines():
+        sha, _, name = line.partition("\t")
+        heads[name.strip()] = sha.strip()
+    for entry in entries:
+        entry.sha = heads.get(entry.remote_ref)
+        if not entry.sha:
+            entry.state = "NOT_FOUND"
+            entry.error = f"{entry.remote_ref} not found on {remote}"
+
+
+def _create_matrix_deployment(vercel: VercelAPI, entry: MatrixEntry) -> MatrixEntry:
+    # Branches deploy by name (so Vercel attaches its branch alias); PR heads by ref path + sha
+    ref = entry.name if entry.remote_ref.startswith("refs/heads/") else entry.remote_ref[len("refs/"):]
+    try:
+        entry.deployment = vercel.create_git_deployment(ref, sha=entry.sha)
+        entry.created = time.time()
+        entry.state = entry.deployment.get("readyState") or entry.deployment.get("state") or "QUEUED"
+        print(f"🚀 {entry.name}: preview deployment {entry.deployment_id} created ({(entry.sha or '')[:7]})")
+    except VercelError as e:
+        entry.state = "CREATE_ERROR"
+        entry.error = str(e)
+        print(f"❌ {entry.name}: failed to create deployment: {e}")
+    return entry
+
+
+def run_matrix_deployments(
+    vercel: VercelAPI,
+    entries: List[MatrixEntry],
+    parallel: int = MATRIX_PARALLEL,
+    timeout_minutes: int = 20,
+    poll_secs: float = MATRIX_POLL_SECS,
+) -> None:
+    """Create preview deployments with at most `parallel` builds in flight and
+    wait on all of them through one shared poller.
+
+    Each poll is a single list request for the project's preview deployments,
+    however many builds are in flight; a free slot is refilled from the queue
+    as soon as a build reaches a terminal state.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    queued = [e for e in entries if e.sha]
+    in_flight: Dict[str, MatrixEntry] = {}
+    deadline = BUDGET.wall_deadline(time.time() + timeout_minutes * 60)
+    consecutive_errors = 0
+    max_consecutive_errors = 3
+    parallel = max(1, parallel)
+
+    print(f"Deploying {len(queued)} preview(s), at most {parallel} at a time...")
+    with ThreadPoolExecutor(max_workers=parallel, thread_name_prefix="matrix") as pool:
+        while (queued or in_flight) and time.time() < deadline:
+            free = parallel - len(in_flight)
+            if free > 0 and queued:
+                batch, queued = queued[:free], queued[free:]
+                for entry in pool.map(lambda e: _create_matrix_deployment(vercel, e), batch):
+                    if entry.deployment_id and entry.state not in MATRIX_TERMINAL_STATES:
+                        in_flight[entry.deployment_id] = entry
+            if not in_flight:
+                continue
+
+            try:
+                data = vercel.list_deployments_v13(limit=MATRIX_LIST_LIMIT, target="preview")
+                consecutive_errors = 0
+            except VercelError as e:
+                consecutive_errors += 1
+                print(f"⚠️  Vercel API error ({consecutive_errors}/{max_consecutive_errors}): {e}")
+                if consecutive_errors >= max_consecutive_errors:
+                    print("❌ Too many consecutive errors, giving up")
+                    break
+                pause(poll_secs, "poll")
+                continue
+
+            listed = {
+                (d.get("uid") or d.get("id")): d
+                for d in data.get("deployments") or data.get("data") or []
+            }
+            for dep_id, entry in list(in_flight.items()):
+                dep = listed.get(dep_id)
+                if dep is None:
+                    try:
+                        dep = vercel.get_deployment_status(dep_id)
+                    except VercelError as e:
+                        print(f"⚠️  {entry.name}: status lookup failed: {e}")
+                        continue
+                state = dep.get("readyState") or dep.get("state") or "UNKNOWN"
+                if state != entry.state:
+                    print(f"   {entry.name}: {state}")
+                entry.state = state
+                entry.deployment = {**(entry.deployment or {}), **dep}
+                if state in MATRIX_TERMINAL_STATES:
+                    entry.ready_secs = round(time.time() - entry.created, 1)
+                    del in_flight[dep_id]
+
+            if in_flight:
+                pause(poll_secs, "poll")
+
+    for entry in in_flight.values():
+        entry.state = f"TIMEOUT: {entry.state}"
+    for entry in queued:
+        entry.state = "TIMEOUT: NOT_STARTED"
+
+
+def check_matrix_health(entries: List[MatrixEntry], config: DeployConfig, parallel: int = MATRIX_PARALLEL) -> None:
+    """Run health checks against every READY preview concurrently"""
+    ready = [e for e in entries if e.state == "READY" and e.deployment and e.deployment.get("url")]
+
+    def check(entry: MatrixEntry) -> None:
+        entry.health = perform_health_checks(entry.deployment["url"], config)
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=max(1, parallel), thread_name_prefix="health") as pool:
+        list(pool.map(check, ready))
+
+
+def write_matrix_report(
+    report_path: Path,
+    actor_name: str,
+    actor_email: str,
+    entries: List[MatrixEntry],
+    parallel: int,
+    phases: Optional[Dict[str, float]] = None,
+) -> None:
+    ts = datetime.now(timezone.utc).isoformat()
+    lines: List[str] = []
+    lines.append(f"Timestamp: {ts}")
+    lines.append(f"Actor: {actor_name} <{actor_email}>")
+    lines.append(f"Matrix: {len(entries)} ref(s), target: preview, parallel: {parallel}")
+    lines.append("")
+    for entry in entries:
+        dep = entry.deployment or {}
+        lines.append(f"{entry.name}:")
+        lines.append(f"  ref: {entry.remote_ref}")
+        lines.append(f"  commit: {entry.sha or ''}")
+        if dep:
+            lines.append(f"  id: {entry.deployment_id}")
+            lines.append(f"  url: {dep.get('url') or ''}")
+            inspect = dep.get("inspectorUrl") or dep.get("inspectUrl") or ""
+            if inspect:
+                lines.append(f"  buildLogs: {inspect}")
+        lines.append(f"  state: {entry.state}")
+        if entry.ready_secs is not None:
+            lines.append(f"  timeToTerminal: {entry.ready_secs:.1f}s")
+        if entry.error:
+            lines.append(f"  error: {entry.error}")
+        for ep, status, latency in entry.health or []:
+            lines.append(f"  GET {ep} -> {status} in {latency:.2f}s")
+        lines.append("")
+    if phases:
+        lines.append("Phases:")
+        for name, secs in phases.items():
+            lines.append(f"  {name}: {secs:.2f}s")
+        lines.append("")
+    counts: Dict[str, int] = {}
+    for entry in entries:
+        counts[entry.state] = counts.get(entry.state, 0) + 1
+    lines.append("Summary: " + ", ".join(f"{n} {state}" for state, n in sorted(counts.items())))
+    lines.append("Exit: " + ("0" if all(e.state == "READY" for e in entries) else "1"))
+
+    report_path.write_text("\n".join(lines), encoding="utf-8")
+
+
+def run_matrix(args: argparse.Namespace, config: DeployConfig) -> int:
+    """Preview-deploy several branches / PR refs that already exist on the remote"""
+    refs = [r for value in args.matrix for r in value.split(",") if r.strip()]
+    entries = [parse_matrix_ref(r) for r in refs]
+    # Run-level record: times the shared phases; each entry's history line is derived from it
+    record = DeployRecord(
+        timestamp=datetime.now(timezone.utc).isoformat(),
+        branch=",".join(entry.name for entry in entries),
+        target="preview",
+    )
+    run_start = time.perf_counter()
+    RUN_COUNTERS["retries"] = 0
+    TRACER.reset()
+    BUDGET.reset(config.time_budget_secs, config.report_reserve_secs)
+
+    def entry_records(unfinished: Optional[str] = None) -> List[DeployRecord]:
+        """One history/metrics record per entry; `unfinished` overrides the state of entries still in flight"""
+        record.duration_secs = round(time.perf_counter() - run_start, 3)
+        record.retries = RUN_COUNTERS["retries"]
+        records = []
+        for entry in entries:
+            entry_record = replace(record, branch=entry.name, commit_sha=entry.sha or "", phases=dict(record.phases))
+            state = entry.state
+            if unfinished and state in ("PENDING", "QUEUED", "INITIALIZING", "BUILDING"):
+                state = unfinished
+            entry_record.set_deployment(entry.deployment, state)
+            entry_record.set_health(entry.health)
+            records.append(entry_record)
+        return records
+
+    def fail(state: str) -> None:
+        logger = logging.getLogger(__name__)
+        records = entry_records(state)
+        for entry_record in records:
+            record_history(entry_record, logger)
+        emit_run_metrics(args, records, logger)
+
+    try:
+        with deployment_context(config) as logger:
+            if not args.skip_preflight:
+                with record.phase("preflight"):
+                    run_preflight(config, logger, push=False, matrix=True, dry_run=args.dry_run)
+            with record.phase("resolve_refs"):
+                ensure_git_repo()
+                resolve_matrix_refs(entries, config.remote_name)
+            for entry in entries:
+                logger.info(f"  {entry.name}: {entry.remote_ref} -> {entry.sha or 'not found'}")
+
+            if args.dry_run:
+                logger.info(f"[DRY RUN] Would create {sum(1 for e in entries if e.sha)} preview deployment(s)")
+                for entry in entries:
+                    if entry.sha:
+                        entry.state = "DRY_RUN"
+            else:
+                token = os.environ.get("VERCEL_TOKEN")
+                project = os.environ.get("VERCEL_PROJECT_ID")
+                if not token or not project:
+                    raise VercelError("Missing VERCEL_TOKEN or VERCEL_PROJECT_ID env variables")
+                vercel = VercelAPI(token=token, project=project, org_id=os.environ.get("VERCEL_ORG_ID"), config=config)
+                with record.phase("deploy"):
+                    run_matrix_deployments(vercel, entries, args.matrix_parallel, config.deployment_timeout)
+                if BUDGET.allows(HEALTH_CHECK_MIN_SECS):
+                    with record.phase("health_checks"):
+                        check_matrix_health(entries, config, args.matrix_parallel)
+                else:
+                    logger.warning("Skipping health checks: time budget nearly exhausted")
+
+            with record.phase("report"), BUDGET.reserved():
+                actor_name, actor_email = get_actor()
+                REPORTS_DIR.mkdir(parents=True, exist_ok=True)
+                ts_slug = datetime.now().strftime("%Y%m%d_%H%M%S")
+                report_path = REPORTS_DIR / f"matrix_{ts_slug}.txt"
+                write_matrix_report(report_path, actor_name, actor_email, entries, args.matrix_parallel, record.phases)
+            logger.info(f"Report written to {report_path}")
+            try:
+                TRACER.write(report_path.with_suffix(".trace.json"))
+            except OSError as e:
+                logger.warning(f"Failed to write trace: {e}")
+
+            record.actor = f"{actor_name} <{actor_email}>"
+            records = entry_records()
+            for entry_record in records:
+                record_history(entry_record, logger)
+            emit_run_metrics(args, records, logger)
+
+            failed = [e.name for e in entries if e.state not in ("READY", "DRY_RUN")]
+            if failed:
+                logger.error(f"❌ {len(failed)}/{len(entries)} preview(s) not ready: {', '.join(failed)}")
+                return 1
+            logger.info(f"🎉 All {len(entries)} preview deployment(s) ready")
+            return 0
+
+    except DeployError as e:
+        print(f"❌ Deployment error: {e}", file=sys.stderr)
+        fail("TIMEOUT: BUDGET" if BUDGET.exhausted_at else e.status.value)
+        return 1
+    except KeyboardInterrupt:
+        print("🛑 Deployment interrupted by user", file=sys.stderr)
+        fail("INTERRUPTED")
+        return 130
+    except Exception as e:
+        print(f"💥 Unexpected error: {e}", file=sys.stderr)
+        fail(DeployStatus.ERROR.value)
+        return 1
+
+
+# ---------------- Profiling ----------------
+
+def rank_operations(tracer: Tracer, accounting: ShellAccounting) -> List[Dict[str, Any]]:
+    """Aggregate subprocesses, HTTP requests and sleeps into a list ranked by total wall time"""
+    ops: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+    def bucket(kind: str, name: str) -> Dict[str, Any]:
+        return ops.setdefault((kind, name), {
+            "kind": kind, "operation": name, "calls": 0, "total_secs": 0.0, "max_secs": 0.0,
+            "retries": 0, "exit_codes": set(), "stdout_bytes": 0, "stderr_bytes": 0,
+        })
+
+    for entry in accounting.entries:
+        op = bucket("subprocess", " ".join(entry["argv"]))
+        op["calls"] += 1
+        op["total_secs"] += entry["wall_secs"]
+        op["max_secs"] = max(op["max_secs"], entry["wall_secs"])
+        op["retries"] += 1 if entry["attempt"] > 1 else 0
+        op["exit_codes"].add("timeout" if entry["exit_code"] is None else str(entry["exit_code"]))
+        op["stdout_bytes"] += entry["stdout_bytes"]
+        op["stderr_bytes"] += entry["stderr_bytes"]
+    for cat in ("vercel_api", "http", "wait"):
+        for span in tracer.spans(cat):
+            secs = span["dur"] / 1_000_000
+            op = bucket(cat, span["name"])
+            op["calls"] += 1
+            op["total_secs"] += secs
+            op["max_secs"] = max(op["max_secs"], secs)
+            if "status" in span["args"]:
+                op["exit_codes"].add(str(span["args"]["status"]))
+            if span["args"].get("attempt", 1) > 1:
+                op["retries"] += 1
+
+    ranked = sorted(ops.values(), key=lambda o: o["total_secs"], reverse=True)
+    for op in ranked:
+        op["exit_codes"] = sorted(op["exit_codes"])
+        op["total_secs"] = round(op["total_secs"], 6)
+        op["max_secs"] = round(op["max_secs"], 6)
+    return ranked
+
+
+def print_operation_table(ranked: List[Dict[str, Any]], top_n: int) -> None:
+    total = sum(op["total_secs"] for op in ranked) or 1.0
+    print(f"\nTop {min(top_n, len(ranked))} operations by wall time")
+    print(f"{'#':>3}  {'kind':<10} {'calls':>5} {'total s':>9} {'%':>6} {'max s':>8} {'retry':>5} {'out KB':>8} {'err KB':>7}  {'codes':<8} operation")
+    for i, op in enumerate(ranked[:top_n], start=1):
+        name = " ".join(op["operation"].split())
+        if len(name) > 70:
+            name = name[:67] + "..."
+        print(
+            f"{i:>3}  {op['kind']:<10} {op['calls']:>5} {op['total_secs']:>9.3f} "
+            f"{op['total_secs'] / total * 100:>5.1f}% {op['max_secs']:>8.3f} {op['retries']:>5} "
+            f"{op['stdout_bytes'] / 1024:>8.1f} {op['stderr_bytes'] / 1024:>7.1f}  "
+            f"{','.join(op['exit_codes']):<8} {name}"
+        )
+
+
+def run_profiled(func: Callable[..., int], *args: Any, top_n: int = 15) -> int:
+    """Run func under cProfile + tracemalloc with shell accounting, then print and save the results"""
+    import cProfile
+    import pstats
+    import tracemalloc
+
+    REPORTS_DIR.mkdir(parents=True, exist_ok=True)
+    stem = REPORTS_DIR / f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    SHELL_ACCOUNTING.reset(enabled=True)
+    profiler = cProfile.Profile()
+    tracemalloc.start(10)
+    wall_start = time.perf_counter()
+    try:
+        return profiler.runcall(func, *args)
+    finally:
+        wall = time.perf_counter() - wall_start
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        SHELL_ACCOUNTING.enabled = False
+
+        ranked = rank_operations(TRACER, SHELL_ACCOUNTING)
+        sub_secs = sum(e["wall_secs"] for e in SHELL_ACCOUNTING.entries)
+        sleep_secs = sum(s["dur"] for s in TRACER.spans("wait")) / 1_000_000
+        print("\n" + "=" * 60)
+        print(f"Profile: {wall:.2f}s wall, {len(SHELL_ACCOUNTING.entries)} subprocesses "
+              f"({sub_secs:.2f}s, {sub_secs / wall * 100 if wall else 0:.1f}%), "
+              f"sleeps {sleep_secs:.2f}s ({sleep_secs / wall * 100 if wall else 0:.1f}%)")
+        print(f"Memory: peak {peak / 1024 / 1024:.2f} MiB traced, {current / 1024 / 1024:.2f} MiB at exit")
+        print_operation_table(ranked, top_n)
+
+        print(f"\nTop {top_n} functions by cumulative time")
+        stats = pstats.Stats(profiler, stream=sys.stdout)
+        stats.sort_stats("cumulative").print_stats(top_n)
+
+        print(f"Top {top_n} allocation sites")
+        for stat in snapshot.statistics("lineno")[:top_n]:
+            print(f"  {stat.size / 1024:>9.1f} KiB  {stat.count:>7} blocks  {stat.traceback[0]}")
+
+        try:
+            profiler.dump_stats(str(stem.with_suffix(".prof")))
+            stem.with_suffix(".json").write_text(json.dumps({
+                "wall_secs": round(wall, 6),
+                "peak_traced_bytes": peak,
+                "subprocesses": SHELL_ACCOUNTING.entries,
+                "operations": ranked,
+            }, indent=2), encoding="utf-8")
+            print(f"\nRaw profile saved to {stem.with_suffix('.prof')} (subprocess accounting: {stem.with_suffix('.json')})")
+        except OSError as e:
+            print(f"Failed to save profile: {e}", file=sys.stderr)
+
+
+# ---------------- Repository preparation ----------------
+
+PREPARE_REPEAT = 3
+
+
+@dataclass
+class PrepareStep:
+    name: str
+    state: str  # "enabled", "skipped" or "failed"
+    detail: str = ""
+
+
+def _git_in(checkout: Path, *args: str) -> subprocess.CompletedProcess:
+    return Shell.run_no_check(["git", *args], cwd=checkout)
+
+
+def _git_error(res: subprocess.CompletedProcess) -> str:
+    lines = [line.strip() for line in (res.stderr or res.stdout).splitlines() if line.strip()]
+    return lines[-1][:200] if lines else f"exit {res.returncode}"
+
+
+def _set_git_config(checkout: Path, settings: Dict[str, str]) -> Optional[str]:
+    for key, value in settings.items():
+        res = _git_in(checkout, "config", key, value)
+        if res.returncode != 0:
+            return f"git config {key}: {_git_error(res)}"
+    return None
+
+
+def _prepare_commit_graph(checkout: Path) -> Tuple[str, str]:
+    error = _set_git_config(checkout, {"core.commitGraph": "true", "fetch.writeCommitGraph": "true",
+                                       "gc.writeCommitGraph": "true"})
+    if error:
+        return "failed", error
+    res = _git_in(checkout, "commit-graph", "write", "--reachable", "--changed-paths", "--split")
+    if res.returncode != 0:
+        return "failed", _git_error(res)
+    return "enabled", "written with changed-path filters; every fetch appends a layer"
+
+
+def _prepare_multi_pack_index(checkout: Path) -> Tuple[str, str]:
+    error = _set_git_config(checkout, {"core.multiPackIndex": "true"})
+    if error:
+        return "failed", error
+    res = _git_in(checkout, "multi-pack-index", "write")
+    if res.returncode != 0:
+        if "no pack files" in res.stderr:
+            return "enabled", "no packs yet; written by the next repack or maintenance run"
+        return "failed", _git_error(res)
+    return "enabled", "written over all packs"
+
+
+def _prepare_untracked_cache(checkout: Path) -> Tuple[str, str]:
+    # Relies on directory mtimes changing when entries are added/removed; git can check that
+    probe = _git_in(checkout, "update-index", "--test-untracked-cache")
+    if probe.returncode != 0:
+        return "skipped", "directory mtimes are unreliable on this filesystem"
+    error = _set_git_config(checkout, {"core.untrackedCache": "true"})
+    res = _git_in(checkout, "update-index", "--untracked-cache")
+    if error or res.returncode != 0:
+        return "failed", error or _git_error(res)
+    return "enabled", "untracked-file scans skip unchanged directories"
+
+
+def _prepare_split_index(checkout: Path) -> Tuple[str, str]:
+    error = _set_git_config(checkout, {"core.splitIndex": "true"})
+    res = _git_in(checkout, "update-index", "--split-index")
+    if error or res.returncode != 0:
+        return "failed", error or _git_error(res)
+    return "enabled", "index writes only rewrite the changed entries"
+
+
+def _prepare_fsmonitor(checkout: Path) -> Tuple[str, str]:
+    probe = _git_in(checkout, "fsmonitor--daemon", "status")
+    if probe.returncode != 0 and ("not supported" in probe.stderr or "not a git command" in probe.stderr):
+        # Setting core.fsmonitor anyway would make every git command warn
+        return "skipped", f"builtin fsmonitor unavailable here: {_git_error(probe)}"
+    error = _set_git_config(checkout, {"core.fsmonitor": "true"})
+    if error:
+        return "failed", error
+    if probe.returncode != 0:
+        res = _git_in(checkout, "fsmonitor--daemon", "start")
+        if res.returncode != 0:
+            return "failed", _git_error(res)
+    return "enabled", "status and add ask the daemon what changed instead of scanning"
+
+
+def _prepare_maintenance(checkout: Path) -> Tuple[str, str]:
+    res = _git_in(checkout, "maintenance", "start")
+    if res.returncode != 0:
+        return "failed", _git_error(res)
+    return "enabled", "scheduled hourly commit-graph/prefetch and daily incremental repack"
+
+
+def prepare_repository(checkout: Path, schedule: bool = False) -> List[PrepareStep]:
+    """Enable git's performance features on `checkout`; each step is independent and reported"""
+    steps = [
+        ("commit-graph", _prepare_commit_graph),
+        ("multi-pack-index", _prepare_multi_pack_index),
+        ("untracked-cache", _prepare_untracked_cache),
+        ("split-index", _prepare_split_index),
+        ("fsmonitor", _prepare_fsmonitor),
+    ]
+    results: List[PrepareStep] = []
+    for name, step in steps:
+        try:
+            state, detail = step(checkout)
+        except DeployError as e:
+            state, detail = "failed", str(e)
+        results.append(PrepareStep(name, state, detail))
+    if schedule:
+        state, detail = _prepare_maintenance(checkout)
+        results.append(PrepareStep("maintenance", state, detail))
+    else:
+        results.append(PrepareStep("maintenance", "skipped", "pass --schedule to keep these fresh in the background"))
+    return results
+
+
+def git_timings(checkout: Path, repeat: int = PREPARE_REPEAT) -> Dict[str, float]:
+    """Median wall time of the git calls a deploy makes against the whole checkout, after one warm-up"""
+    paths = [p for p in INCLUDE_PATHS if (checkout / p).exists()]
+    commands = {
+        "git status": ["git", "status", "--porcelain"],
+        "git rev-list --count HEAD": ["git", "rev-list", "--count", "HEAD"],
+        "git add (include paths)": ["git", "add", "--dry-run", "-A", "--", *paths],
+    }
+    timings: Dict[str, float] = {}
+    for label, cmd in commands.items():
+        samples = []
+        for attempt in range(repeat + 1):
+            start = time.perf_counter()
+            Shell.run_no_check(cmd, cwd=checkout)
+            if attempt:
+                samples.append(time.perf_counter() - start)
+        timings[label] = sorted(samples)[len(samples) // 2]
+    return timings
+
+
+def prepare_main(argv: List[str]) -> int:
+    """`prepare` subcommand: enable git performance features on the deploy checkout"""
+    parser = argparse.ArgumentParser(
+        prog="push_and_deploy.py prepare",
+        description="Enable the commit-graph, multi-pack-index, untracked cache, split index and builtin "
+                    "fsmonitor on the deploy checkout, timing status/rev-list/add before and after",
+    )
+    parser.add_argument("--branch", default="main", help="Target branch whose deploy worktree --worktree prepares")
+    parser.add_argument("--worktree", action="store_true",
+                        help="Prepare the branch's deploy worktree instead of the primary checkout")
+    parser.add_argument("--schedule", action="store_true",
+                        help="Also run `git maintenance start` so long-lived runners keep the structures fresh")
+    parser.add_argument("--repeat", type=int, default=PREPARE_REPEAT,
+                        help=f"Timed runs per command, median reported (default: {PREPARE_REPEAT})")
+    parser.add_argument("--no-timings", action="store_true", help="Skip the before/after measurements")
+    parser.add_argument("--json", action="store_true", help="Emit JSON instead of a table")
+    args = parser.parse_args(argv)
+
+    checkout = worktree_path(args.branch) if args.worktree else REPO_ROOT
+    if not (checkout / ".git").exists():
+        parser.error(f"{checkout} is not a checkout (run a --worktree deploy of '{args.branch}' first)")
+    version = _git_in(checkout, "version").stdout.strip()
+
+    before = {} if args.no_timings else git_timings(checkout, max(1, args.repeat))
+    steps = prepare_repository(checkout, schedule=args.schedule)
+    after = {} if args.no_timings else git_timings(checkout, max(1, args.repeat))
+
+    if args.json:
+        print(json.dumps({"checkout": str(checkout), "git": version, "steps": [asdict(s) for s in steps],
+                          "before": before, "after": after}, indent=2))
+    else:
+        print(f"Prepared {checkout} ({version})")
+        icons = {"enabled": "✅", "skipped": "⏭️ ", "failed": "❌"}
+        for step in steps:
+            print(f"  {icons[step.state]} {step.name:<17} {step.detail}")
+        if before:
+            print(f"\nTimings (median of {max(1, args.repeat)}):")
+            for label, secs in before.items():
+                new = after[label]
+                print(f"  {label:<27} {secs * 1000:8.1f}ms -> {new * 1000:8.1f}ms  ({secs / new if new else 0:.2f}x)")
+    return 1 if any(step.state == "failed" for step in steps) else 0
+
+
+# ---------------- Watch mode ----------------
+
+WATCH_INTERVAL_SECS = 1.0
+WATCH_DEBOUNCE_SECS = 1.5
+WATCH_PREFLIGHT_TTL_SECS = 300.0
+# Above this many changed files (branch switch, npm install) restage whole paths instead of listing files
+WATCH_BULK_RESTAGE = 500
+WATCH_SKIP_DIRS = {".git", "node_modules", ".next", ".vercel", ".turbo", "__pycache__"}
+
+
+@dataclass
+class PreparedChanges:
+    """Staging done ahead of a run by watch mode"""
+    tree: str  # Tree id of the staged set
+    tree_hash: Optional[str]  # deployable_tree_hash of that tree
+    index: Optional[Path] = None  # Private index holding it (worktree mode); None = the primary index
+
+
+def scan_files(paths: List[str]) -> Dict[str, Tuple[int, int]]:
+    """(mtime_ns, size) of every file under `paths`, keyed by path relative to REPO_ROOT"""
+    found: Dict[str, Tuple[int, int]] = {}
+    stack: List[Tuple[str, str]] = []
+    for rel in paths:
+        full = REPO_ROOT / rel
+        try:
+            st = full.lstat()
+        except OSError:
+            continue
+        if full.is_dir() and not full.is_symlink():
+            stack.append((str(full), rel))
+        else:
+            found[rel] = (st.st_mtime_ns, st.st_size)
+    while stack:
+        directory, rel_dir = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    rel = f"{rel_dir}/{entry.name}"
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name not in WATCH_SKIP_DIRS:
+                                stack.append((entry.path, rel))
+                            continue
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    found[rel] = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            continue
+    return found
+
+
+class DeployWatcher:
+    """Keep the next deploy's staging, tree hash and pre-flight current while files change.
+
+    The staging paths are polled every `interval` seconds; once they have been
+    quiet for `debounce` seconds only the files that changed are restaged (into
+    the primary index, or a private one in worktree mode), the deployable tree
+    hash is recomputed from the index, and pre-flight results older than
+    WATCH_PREFLIGHT_TTL_SECS are refreshed in the background. Enter on stdin or
+    SIGUSR1 deploys what is staged right away; `q` quits.
+    """
+
+    def __init__(self, args: argparse.Namespace, config: DeployConfig,
+                 interval: float = WATCH_INTERVAL_SECS, debounce: float = WATCH_DEBOUNCE_SECS):
+        self.args = args
+        self.config = config
+        self.interval = interval
+        self.debounce = debounce
+        self.logger = setup_logging(config.verbose_logging)
+        self.target = "preview" if config.preview else "production"
+        self.paths = staging_paths(config)
+        slug = worktree_path(config.target_branch).name
+        self.index = DEPLOY_WORKTREES_DIR / f"{slug}.index" if config.use_worktree else None
+        self.files: Dict[str, Tuple[int, int]] = {}
+        self.pending: Set[str] = set()
+        self.last_change = 0.0
+        self.tree: Optional[str] = None
+        self.tree_hash: Optional[str] = None
+        self.live: Optional[DeployRecord] = None  # Last READY deploy of exactly this tree
+        self.preflight_at: Optional[float] = None
+        self.preflight_error: Optional[str] = None
+        self._preflight_thread: Optional[threading.Thread] = None
+        self.trigger = threading.Event()
+        self.stop = threading.Event()
+
+    @property
+    def git_env(self) -> Optional[Dict[str, str]]:
+        return {"GIT_INDEX_FILE": str(self.index)} if self.index else None
+
+    def prime(self) -> None:
+        """One full staging pass and scan; everything after it is incremental"""
+        ensure_git_repo()
+        start = time.perf_counter()
+        self._stage_all()
+        self.files = scan_files(self.paths)
+        self.refresh_tree()
+        print(f"👀 Watching {len(self.files)} files under {len(self.paths)} include paths "
+              f"(primed in {time.perf_counter() - start:.2f}s)")
+        self.refresh_preflight()
+
+    def _stage_all(self) -> None:
+        if self.index:
+            self.index.parent.mkdir(parents=True, exist_ok=True)
+            stage_private_index(self.index, self.config)
+        else:
+            git_add_includes(self.config)
+
+    def poll(self) -> None:
+        """Rescan and queue the files whose mtime or size changed, appeared or disappeared"""
+        current = scan_files(self.paths)
+        changed = {p for p in current.keys() | self.files.keys() if current.get(p) != self.files.get(p)}
+        self.files = current
+        if changed:
+            self.pending |= changed
+            self.last_change = time.monotonic()
+
+    def settle(self, force: bool = False) -> bool:
+        """Restage the pending files once they have been quiet for `debounce` (or now)"""
+        if not self.pending or (not force and time.monotonic() - self.last_change < self.debounce):
+            return False
+        changed = sorted(self.pending)
+        self.pending.clear()
+        start = time.perf_counter()
+        if len(changed) > WATCH_BULK_RESTAGE:
+            self._stage_all()
+        else:
+            self._stage(changed)
+        self.refresh_tree()
+        self.report(len(changed), time.perf_counter() - start)
+        return True
+
+    def _stage(self, changed: List[str]) -> None:
+        # Only what `git add` would pick up: modified/deleted tracked files and untracked, unignored ones
+        res = Shell.run_no_check(["git", "ls-files", "-z", "--modified", "--deleted", "--others", "--exclude-standard",
+                                  "--", *changed], env=self.git_env)
+        stage = sorted({p for p in res.stdout.split("\0") if p})
+        if stage:
+            res = Shell.run_no_check(["git", "add", "-A", "--", *stage], env=self.git_env)
+            if res.returncode != 0:
+                self.logger.warning(f"Incremental staging failed, restaging everything: {res.stderr.strip()}")
+                self._stage_all()
+
+    def refresh_tree(self) -> None:
+        try:
+            self.tree = write_index_tree(self.git_env)
+        except GitError as e:
+            self.tree, self.tree_hash, self.live = None, None, None
+            self.logger.warning(f"Cannot compute the staged tree (unmerged paths?): {e}")
+            return
+        self.tree_hash = deployable_tree_hash(self.tree)
+        self.live = unchanged_since_last_ready(self.tree_hash, self.config.target_branch, self.target, self.logger)
+
+    def refresh_preflight(self, wait: bool = False) -> None:
+        """Re-run pre-flight in the background once the cached result is older than the TTL"""
+        if self.args.skip_preflight:
+            return
+        if self._preflight_thread is None or not self._preflight_thread.is_alive():
+            stale = self.preflight_at is None or time.monotonic() - self.preflight_at > WATCH_PREFLIGHT_TTL_SECS
+            if not stale and not (wait and self.preflight_error):
+                return
+            self._preflight_thread = threading.Thread(target=self._run_preflight, name="watch-preflight", daemon=True)
+            self._preflight_thread.start()
+        if wait:
+            self._preflight_thread.join()
+
+    def _run_preflight(self) -> None:
+        quiet = logging.getLogger(f"{__name__}.watch")
+        quiet.setLevel(logging.WARNING)
+        try:
+            run_preflight(
+                self.config, quiet, push=not self.args.skip_push and self.config.push_to_remote, dry_run=self.args.dry_run
+            )
+            error = None
+        except DeployError as e:
+            error = str(e)
+        if error != self.preflight_error or self.preflight_at is None:
+            print(f"❌ {error}" if error else "✅ Pre-flight ok")
+        self.preflight_error = error
+        self.preflight_at = time.monotonic()
+
+    def report(self, changed: int, secs: float) -> None:
+        if self.tree_hash is None:
+            state = "tree unavailable"
+        elif self.live is not None:
+            state = f"tree {self.tree_hash[:12]} already live"
+        else:
+            state = f"tree {self.tree_hash[:12]} ready to deploy"
+        print(f"🔄 {changed} file(s) changed, restaged in {secs:.2f}s; {state} (Enter deploys)")
+
+    def deploy(self) -> int:
+        """Deploy the staged set: flush pending changes, then commit and push without rescanning"""
+        self.poll()
+        self.settle(force=True)
+        if self.tree is None:
+            print("❌ Nothing deployable is staged; resolve the unmerged paths first")
+            return 1
+        if self.config.skip_unchanged and self.live is not None:
+            print(f"⏭️  Tree {self.tree_hash[:12]} unchanged since READY deployment "
+                  f"{self.live.deployment_id or self.live.commit_sha[:7]}; nothing to deploy")
+            return 0
+        self.refresh_preflight(wait=True)
+        if self.preflight_error:
+            print(f"❌ Not deploying: {self.preflight_error}")
+            return 1
+        args = argparse.Namespace(**{**vars(self.args), "skip_preflight": True})
+        code = run_deploy(args, self.config, PreparedChanges(self.tree, self.tree_hash, self.index))
+        self.refresh_tree()
+        print(f"{'✅' if code == 0 else '❌'} Deploy finished (exit {code}); watching for changes")
+        return code
+
+    def _read_stdin(self) -> None:
+        for line in sys.stdin:
+            if line.strip().lower() in ("q", "quit", "exit"):
+                self.stop.set()
+            self.trigger.set()
+            if self.stop.is_set():
+                return
+
+    def run(self) -> int:
+        self.prime()
+        if sys.stdin and not sys.stdin.closed:
+            threading.Thread(target=self._read_stdin, name="watch-stdin", daemon=True).start()
+        signals = [signal.SIGUSR1] if hasattr(signal, "SIGUSR1") and threading.current_thread() is threading.main_thread() else []
+        print(f"Press Enter{' or send SIGUSR1 to ' + str(os.getpid()) if signals else ''} to deploy, q + Enter to quit")
+        try:
+            with signal_handler(signals, lambda signum, frame: self.trigger.set()):
+                while not self.stop.is_set():
+                    if self.trigger.wait(self.interval):
+                        self.trigger.clear()
+                        if not self.stop.is_set():
+                            self.deploy()
+                        continue
+                    self.poll()
+                    self.settle()
+                    self.refresh_preflight()
+        except KeyboardInterrupt:
+            print("🛑 Watch stopped")
+            return 130
+        return 0
+
+
+# ---------------- In-process invocation ----------------
+
+@dataclass
+class CliResult:
+    """Exit code and captured output of an in-process run_cli() call"""
+    returncode: int
+    stdout: str
+    stderr: str
+
+
+@contextmanager
+def routed_output(stdout: Any, stderr: Any, exclusive_logging: bool = True) -> Iterator[None]:
+    """Send print() output and log records to the given streams for the duration of the block.
+
+    With exclusive_logging the root logger's existing handlers are detached meanwhile,
+    so records only reach `stderr`; its level is restored afterwards.
+    """
+    handler = logging.StreamHandler(stderr)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT, LOG_DATEFMT))
+    root = logging.getLogger()
+    saved_handlers, saved_level = root.handlers[:], root.level
+    root.handlers = [handler] if exclusive_logging else [*saved_handlers, handler]
+    try:
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            yield
+    finally:
+        root.handlers = saved_handlers
+        root.setLevel(saved_level)
+
+
+def invoke(argv: List[str], stdout: Any, stderr: Any, exclusive_logging: bool = True) -> int:
+    """Run main(argv) in this process with its output sent to the given streams"""
+    with routed_output(stdout, stderr, exclusive_logging):
+        try:
+            return main(argv)
+        except SystemExit as e:  # argparse errors / --help
+            return e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+
+
+def run_cli(argv: Iterable[str]) -> CliResult:
+    """Library entry point: run the command line in-process and capture its output.
+
+        from push_and_deploy import run_cli
+        result = run_cli(["--list-remotes"])
+        print(result.returncode, result.stdout)
+
+    Runs share the interpreter (and its HTTP connection pool and project cache),
+    so only the first one pays for imports. Not thread-safe: stdout, stderr and
+    logging are process-wide.
+    """
+    out, err = io.StringIO(), io.StringIO()
+    code = invoke([str(a) for a in argv], out, err)
+    return CliResult(code, out.getvalue(), err.getvalue())
+
+
+# ---------------- Deploy daemon ----------------
+
+DAEMON_SOCKET = Path(os.environ.get("DEPLOY_DAEMON_SOCKET") or REPO_ROOT / ".git" / "push_and_deploy.sock")
+DAEMON_IDLE_REFRESH_SECS = 60
+# Client environment a request runs under (credentials, budget, git/ssh settings, PATH for the CLIs)
+DAEMON_FORWARDED_ENV_PREFIXES = ("VERCEL_", "DEPLOY_", "GIT_", "SSH_")
+DAEMON_FORWARDED_ENV = ("PATH",)
+# Set while the daemon serves a request, so main() can refuse resident modes
+SERVING_DAEMON_REQUEST = False
+
+
+def _forwarded_env_names(environ: Any) -> List[str]:
+    return [name for name in environ if name in DAEMON_FORWARDED_ENV or name.startswith(DAEMON_FORWARDED_ENV_PREFIXES)]
+
+
+def client_environment() -> Dict[str, str]:
+    """The part of this process's environment a daemon request runs under"""
+    return {name: os.environ[name] for name in _forwarded_env_names(os.environ)}
+
+
+@contextmanager
+def request_context(cwd: Optional[str], env: Optional[Dict[str, str]]) -> Iterator[None]:
+    """Run a daemon request in the client's directory and forwarded environment.
+
+    The forwarded variables are the client's view exactly: ones the client
+    does not have are unset for the request, so the daemon's own credentials
+    never leak into it. Both are restored afterwards.
+    """
+    global SERVING_DAEMON_REQUEST
+    saved_cwd = os.getcwd()
+    saved_env = {name: os.environ[name] for name in _forwarded_env_names(os.environ)}
+    if env is not None:
+        for name in saved_env:
+            del os.environ[name]
+        os.environ.update({name: str(value) for name, value in env.items() if name in _forwarded_env_names([name])})
+    SERVING_DAEMON_REQUEST = True
+    try:
+        if cwd:
+            os.chdir(cwd)
+        yield
+    finally:
+        SERVING_DAEMON_REQUEST = False
+        os.chdir(saved_cwd)
+        if env is not None:
+            for name in _forwarded_env_names(os.environ):
+                del os.environ[name]
+            os.environ.update(saved_env)
+
+
+class _SocketStream:
+    """File-like object forwarding writes to a daemon client as JSON frames"""
+
+    def __init__(self, conn: Any, stream: str, lock: threading.Lock):
+        self.conn = conn
+        self.stream = stream
+        self.lock = lock
+        self.closed = False
+
+    def write(self, data: str) -> int:
+        if data and not self.closed:
+            frame = (json.dumps({"stream": self.stream, "data": data}) + "\n").encode("utf-8")
+            with self.lock:
+                try:
+                    self.conn.sendall(frame)
+                except OSError:
+                    # Client went away; keep the run going, just stop streaming
+                    self.closed = True
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def isatty(self) -> bool:
+        return False
+
+
+def _daemon_warm_up(logger: logging.Logger) -> None:
+    """Populate per-process caches so the first request starts warm"""
+    try:
+        ensure_git_repo()
+        Shell.run_no_check(["git", "update-index", "-q", "--refresh"])
+    except DeployError as e:
+        logger.warning(f"Git warm-up failed: {e}")
+    token = os.environ.get("VERCEL_TOKEN")
+    project = os.environ.get("VERCEL_PROJECT_ID")
+    if token and project:
+        try:
+            info = VercelAPI(token=token, project=project, org_id=os.environ.get("VERCEL_ORG_ID")).project_info()
+            logger.info(f"Vercel project resolved: {info.get('name', project)} ({info.get('id', '?')})")
+        except VercelError as e:
+            logger.warning(f"Vercel warm-up failed: {e}")
+
+
+def _handle_daemon_request(conn: Any, logger: logging.Logger) -> bool:
+    """Serve one client connection; returns False when the daemon should stop"""
+    with conn, conn.makefile("rb") as reader:
+        try:
+            request = json.loads(reader.readline().decode("utf-8") or "{}")
+        except ValueError:
+            request = {}
+        lock = threading.Lock()
+        out = _SocketStream(conn, "stdout", lock)
+        err = _SocketStream(conn, "stderr", lock)
+        op = request.get("op", "run")
+
+        def reply(payload: Dict[str, Any]) -> None:
+            with lock:
+                try:
+                    conn.sendall((json.dumps(payload) + "\n").encode("utf-8"))
+                except OSError:
+                    pass
+
+        if op == "ping":
+            reply({"exit": 0, "pid": os.getpid(), "http_connections_opened": HTTP_POOL.connections_opened,
+                   "cached_projects": len(_PROJECT_CACHE)})
+            return True
+        if op == "stop":
+            reply({"exit": 0})
+            return False
+
+        argv = [str(a) for a in request.get("argv", [])]
+        logger.info(f"Daemon request: {' '.join(argv) or '(defaults)'}" + (f" in {request['cwd']}" if request.get("cwd") else ""))
+        try:
+            # The daemon's own log keeps receiving the records too
+            with request_context(request.get("cwd"), request.get("env")):
+                code = invoke(argv, out, err, exclusive_logging=False)
+        except Exception as e:
+            err.write(f"💥 Daemon error: {e}\n")
+            code = 1
+        reply({"exit": code})
+        logger.info(f"Daemon request finished with exit code {code}")
+        return True
+
+
+def serve_daemon(socket_path: Path = DAEMON_SOCKET, idle_refresh: int = DAEMON_IDLE_REFRESH_SECS) -> int:
+    """Stay resident and run deploy requests received on a Unix socket.
+
+    Requests are served one at a time (they share a checkout). Between
+    requests the daemon keeps the git index stat cache fresh, and the HTTP
+    connection pool and project cache persist across runs.
+    """
+    import socket
+
+    logger = setup_logging(False)
+    if socket_path.exists():
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(str(socket_path))
+            print(f"❌ A deploy daemon is already listening on {socket_path}", file=sys.stderr)
+            return 1
+        except OSError:
+            socket_path.unlink()  # stale socket from a crashed daemon
+        finally:
+            probe.close()
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o177)
+    try:
+        server.bind(str(socket_path))
+    finally:
+        os.umask(old_umask)
+    server.listen(8)
+    server.settimeout(idle_refresh)
+    logger.info(f"Deploy daemon listening on {socket_path} (pid {os.getpid()})")
+    _daemon_warm_up(logger)
+    try:
+        while True:
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                Shell.run_no_check(["git", "update-index", "-q", "--refresh"])
+                continue
+            conn.settimeout(None)
+            if not _handle_daemon_request(conn, logger):
+                break
+    except KeyboardInterrupt:
+        logger.info("Deploy daemon interrupted")
+    finally:
+        server.close()
+        HTTP_POOL.close()
+        try:
+            socket_path.unlink()
+        except OSError:
+            pass
+        logger.info("Deploy daemon stopped")
+    return 0
+
+
+def daemon_client(argv: List[str], socket_path: Path = DAEMON_SOCKET, op: str = "run") -> int:
+    """Forward a request to the resident daemon and stream its output"""
+    import socket
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(str(socket_path))
+    except OSError as e:
+        print(f"❌ Cannot reach deploy daemon at {socket_path}: {e} (start it with --daemon)", file=sys.stderr)
+        return 1
+    with client, client.makefile("rb") as reader:
+        request = {"op": op, "argv": argv, "cwd": os.getcwd(), "env": client_environment()}
+        client.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        for raw in reader:
+            frame = json.loads(raw.decode("utf-8"))
+            if "exit" in frame:
+                if op == "ping":
+                    print(json.dumps(frame))
+                return int(frame["exit"])
+            target = sys.stdout if frame.get("stream") == "stdout" else sys.stderr
+            target.write(frame.get("data", ""))
+            target.flush()
+    print("❌ Deploy daemon closed the connection unexpectedly", file=sys.stderr)
+    return 1
+
+
+def _strip_daemon_flags(argv: List[str]) -> List[str]:
+    """Client-side flags that must not be forwarded to the daemon"""
+    out: List[str] = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+            continue
+        if arg in ("--via-daemon", "--daemon-ping", "--daemon-stop"):
+            continue
+        if arg == "--daemon-socket":
+            skip = True
+            continue
+        if arg.startswith("--daemon-socket="):
+            continue
+        out.append(arg)
+    return out
+
+
+def finish_run(
+    args: argparse.Namespace,
+    config: DeployConfig,
+    record: "DeployRecord",
+    run_start: float,
+    dep: Optional[Dict[str, Any]],
+    dep_state: str,
+    health: Optional[List[Tuple[str, int, float]]],
+    project_results: Optional[List[ProjectResult]],
+    logger: logging.Logger,
+) -> Path:
+    """Report phase: text report, trace, history record and metrics (draws on the budget reserve)"""
+    with record.phase("report"), BUDGET.reserved():
+        # Collect report data
+        actor_name, actor_email = get_actor()
+        commit_sha, commit_title = get_commit_sha_and_title(deploy_checkout(config))
+        diff_summary = get_diff_summary(deploy_checkout(config))
+
+        record.actor = f"{actor_name} <{actor_email}>"
+        record.commit_sha = commit_sha
+        record.commit_title = commit_title
+        record.set_deployment(dep, dep_state)
+        record.set_health(health)
+
+        REPORTS_DIR.mkdir(parents=True, exist_ok=True)
+        ts_slug = datetime.now().strftime("%Y%m%d_%H%M%S")
+        report_path = REPORTS_DIR / f"deploy_{ts_slug}.txt"
+        write_report(
+            report_path,
+            actor_name,
+            actor_email,
+            config.target_branch,
+            commit_sha,
+            commit_title,
+            diff_summary,
+            dep,
+            dep_state,
+            health if project_results is None else None,
+            record.phases,
+            project_results,
+            record.pushes,
+        )
+
+    logger.info(f"Report written to {report_path}")
+    trace_path = report_path.with_suffix(".trace.json")
+    try:
+        TRACER.write(trace_path)
+        logger.info(f"Trace written to {trace_path} (open in ui.perfetto.dev or chrome://tracing)")
+    except OSError as e:
+        logger.warning(f"Failed to write trace: {e}")
+    record.duration_secs = round(time.perf_counter() - run_start, 3)
+    record.retries = RUN_COUNTERS["retries"]
+    record_history(record, logger)
+    emit_run_metrics(args, [record], logger)
+    return report_path
+
+
+def emit_run_metrics(args: argparse.Namespace, records: List["DeployRecord"], logger: logging.Logger) -> None:
+    """Merge the run's final state(s) into the metrics textfile; every exit path of a run ends here"""
+    if args.no_metrics or (CASSETTE is not None and CASSETTE.replaying):
+        return
+    try:
+        write_metrics_file(args.metrics_file, records, TRACER)
+        logger.info(f"Metrics written to {args.metrics_file}")
+    except OSError as e:
+        logger.warning(f"Failed to write metrics file: {e}")
+
+
+def finish_failed_run(
+    args: argparse.Namespace, config: DeployConfig, record: "DeployRecord", run_start: float, state: str
+) -> None:
+    """Report, history and metrics for a run that ended in an exception (unless its report already ran)"""
+    if "report" in record.phases:
+        return
+    try:
+        finish_run(args, config, record, run_start, None, state, None, None, logging.getLogger(__name__))
+    except Exception as report_error:
+        print(f"⚠️  Failed to write report: {report_error}", file=sys.stderr)
+        record.state = state
+        record.duration_secs = round(time.perf_counter() - run_start, 3)
+        emit_run_metrics(args, [record], logging.getLogger(__name__))
+
+
+def run_deploy(args: argparse.Namespace, config: DeployConfig, prepared: Optional["PreparedChanges"] = None) -> int:
+    """Run the stage -> commit -> push -> deploy -> report pipeline
+
+    `prepared` carries staging already done by watch mode, which the staging
+    and commit phases then reuse instead of rescanning the include paths.
+    """
+    # Enhanced deployment with context management
+    record = DeployRecord(
+        timestamp=datetime.now(timezone.utc).isoformat(),
+        branch=config.target_branch,
+        target="preview" if config.preview else "production",
+    )
+    run_start = time.perf_counter()
+    RUN_COUNTERS["retries"] = 0
+    TRACER.reset()
+    BUDGET.reset(config.time_budget_secs, config.report_reserve_secs)
+    queue: Optional[DeployQueue] = None
+    try:
+        with deployment_context(config) as logger:
+            if BUDGET.limited:
+                logger.info(f"Time budget: {config.time_budget_secs:.0f}s ({config.report_reserve_secs:.0f}s reserved for the report)")
+            if not args.skip_preflight:
+                with record.phase("preflight"):
+                    run_preflight(config, logger, push=not args.skip_push and config.push_to_remote, dry_run=args.dry_run)
+            if config.use_queue and not args.dry_run:
+                queue = DeployQueue(config.target_branch)
+                queue.enqueue()
+                with record.phase("queue_wait"):
+                    acquired = queue.acquire()
+                if not acquired:
+                    logger.info(f"⏭️  Superseded by a newer deploy request for '{config.target_branch}'; exiting")
+                    finish_run(args, config, record, run_start, None, "SUPERSEDED", None, None, logger)
+                    return 0
+
+            with record.phase("repo_setup"):
+                ensure_git_repo()
+
+                if is_rebase_in_progress(REPO_ROOT):
+                    raise GitError("Rebase in progress detected. Please resolve and run again.", retryable=False)
+
+                # Setup repository and branch
+                original_sha = setup_repository_and_branch(config)
+            logger.info(f"Repository setup complete. Original SHA: {original_sha}")
+
+            specs = load_projects_manifest(config.projects_manifest) if config.projects_manifest else None
+            pushed_from = remote_head(config)
+            checkout = deploy_checkout(config)
+            snapshot: Optional[str] = None
+
+            # Stage/commit with enhanced error handling
+            with record.phase("staging"):
+                if args.dry_run:
+                    logger.info("[DRY RUN] Would stage included paths:")
+                    for p in INCLUDE_PATHS:
+                        logger.info(f"  - {p}")
+                elif prepared is not None:
+                    logger.info(f"Staged set prepared by watch mode (tree {prepared.tree[:12]})")
+                    if config.use_worktree:
+                        snapshot = snapshot_changes(config, args.message, index=prepared.index)
+                elif config.use_worktree:
+                    snapshot = snapshot_changes(config, args.message)
+                else:
+                    git_add_includes(config)
+
+            sha_before = Shell.run(["git", "rev-parse", "HEAD"]).stdout.strip()
+
+            with record.phase("commit"):
+                if args.dry_run:
+                    logger.info(f"[DRY RUN] Would commit with message:\n{args.message}")
+                else:
+                    if config.use_worktree:
+                        new_sha = worktree_commit(snapshot, args.message, config)
+                    else:
+                        new_sha = git_commit(args.message, config, stage=prepared is None)
+                    if new_sha:
+                        logger.info(f"Committed {new_sha}")
+                    else:
+                        logger.info("No changes to commit. Proceeding with push.")
+
+            # Decide NOOP before pushing: with the Git integration the push itself starts a build
+            record.tree_hash = deployable_tree_hash(cwd=checkout)
+            unchanged = (
+                unchanged_since_last_ready(record.tree_hash, config.target_branch, record.target, logger)
+                if config.skip_unchanged and not args.dry_run and specs is None else None
             )
-            
-            if dep_state == "READY":
-                logger.info("✅ GitHub integration deployment successful")
-                return dep, dep_state
+
+            # Push with enhanced error handling
+            if unchanged is not None:
+                ahead = Shell.run_no_check(["git", "rev-list", "--count", f"{pushed_from}..HEAD"], cwd=checkout) if pushed_from else None
+                if ahead is not None and ahead.returncode == 0 and ahead.stdout.strip() != "0":
+                    logger.info(f"Not pushing {ahead.stdout.strip()} local commit(s) without deployable changes "
+                                "(pushing would start a redundant build; use --force-deploy to push anyway)")
+            elif not args.skip_push and config.push_to_remote:
+                with record.phase("push"):
+                    if args.dry_run:
+                        logger.info(f"[DRY RUN] Would push to {config.remote_name} {config.target_branch}")
+                    else:
+                        record.pushes = [asdict(r) for r in git_push(config.target_branch, config)]
+                        if config.use_worktree and snapshot and new_sha:
+                            remember_worktree_deploy(snapshot, new_sha, config)
             else:
-                logger.warning(f"GitHub integration deployment failed: {dep_state}")
-                
-        except VercelError as e:
-            logger.error(f"GitHub integration failed: {e}")
-            if not config.fallback_to_cli:
-                raise e
-    
-    # Fallback to Vercel CLI
-    if config.fallback_to_cli:
-        logger.info("Attempting deployment via Vercel CLI (fallback)")
-        try:
-            cli_cmd = ["vercel", "deploy", "--prod", "--confirm"]
-            
-            # Add timeout to CLI command
-            cli_res = Shell.run_no_check(cli_cmd, timeout=config.deployment_timeout * 60)
-            
-            if cli_res.returncode == 0:
-                logger.info("✅ Vercel CLI deployment successful")
-                
-                # Try to extract URL from CLI output
-                url = None
-                for line in cli_res.stdout.splitlines():
-                    if line.strip().startswith("https://") and ".vercel.app" in line:
-                        url = line.strip()
-                        break
+                logger.info("Skipping push per configuration")
+
+            # Deploy with fallback mechanism
+            dep: Optional[Dict[str, Any]] = None
+            dep_state: str = "SKIPPED"
+            health: Optional[List[Tuple[str, int, float]]] = None
+            project_results: Optional[List[ProjectResult]] = None
+
+            if specs is not None:
+                affected = affected_projects(specs, changed_paths(pushed_from, cwd=checkout))
+                skipped = [spec.name for spec in specs if spec not in affected]
+                logger.info(f"Affected projects: {', '.join(s.name for s in affected) or 'none'}"
+                            + (f" (unchanged: {', '.join(skipped)})" if skipped else ""))
+                if args.dry_run:
+                    dep_state = "DRY_RUN"
+                    logger.info("[DRY RUN] Deployment skipped")
+                else:
+                    with record.phase("deploy"):
+                        project_results = deploy_projects(affected, config, logger)
+                    dep_state = aggregate_project_state(project_results)
+                    record.projects = {r.name: r.state for r in project_results}
+                    health = [(f"{r.name}:{ep}", status, latency)
+                              for r in project_results for ep, status, latency in r.health or []]
+                    if dep_state not in SUCCESS_STATES:
+                        logger.error(f"Deployment failed: {dep_state}")
+                        if config.enable_rollback and original_sha:
+                            rollback_within_budget(original_sha, config, record, logger)
+            elif unchanged is not None:
+                dep_state = "NOOP"
+                logger.info(
+                    f"⏭️  Deployable tree {record.tree_hash[:12]} unchanged since READY deployment "
+                    f"{unchanged.deployment_id or unchanged.commit_sha[:7]}; skipping push, deploy and health checks"
+                )
+            elif not args.dry_run:
+                with record.phase("deploy"):
+                    dep, dep_state = deploy_with_fallback(
+                        config, logger, should_abort=queue.superseded if queue else None
+                    )
                 
-                if url:
-                    dep_state = "READY"
-                    dep = {"url": url, "state": "READY", "uid": "cli-deployment"}
+                if dep_state == "SUPERSEDED":
+                    logger.info("Deployment superseded by a newer request; skipping health checks and rollback")
+                elif dep and dep_state == "READY":
+                    url = dep.get("url")
+                    if url and not BUDGET.allows(HEALTH_CHECK_MIN_SECS):
+                        BUDGET.note_exhausted("health_checks")
+                        logger.warning(f"Deployment successful: {url}; skipping health checks (time budget nearly exhausted)")
+                    elif url:
+                        logger.info(f"Deployment successful: {url}")
+                        with record.phase("health_checks"):
+                            endpoints = targeted_health_endpoints(changed_paths(pushed_from, cwd=checkout), config, logger)
+                            health = perform_health_checks(url, config, endpoints)
+                    else:
+                        logger.warning("Deployment successful but no URL found")
                 else:
-                    dep_state = "CLI_SUCCESS_NO_URL"
-                    
+                    logger.error(f"Deployment failed: {dep_state}")
+                    if config.enable_rollback and original_sha:
+                        rollback_within_budget(original_sha, config, record, logger)
             else:
-                logger.error(f"Vercel CLI failed: {cli_res.stderr}")
-                dep_state = "CLI_ERROR"
-                
-        except DeployError as e:
-            logger.error(f"Vercel CLI deployment failed: {e}")
-            dep_state = "CLI_ERROR"
-    
-    return dep, dep_state
+                dep_state = "DRY_RUN"
+                logger.info("[DRY RUN] Deployment skipped")
 
+            if BUDGET.exhausted_at:
+                logger.warning(f"⏰ Time budget exhausted (first hit in {BUDGET.exhausted_at})")
+            finish_run(args, config, record, run_start, dep, dep_state, health, project_results, logger)
 
-def write_report(
-    report_path: Path,
-    actor_name: str,
-    actor_email: str,
-    branch: str,
-    commit_sha: str,
-    commit_title: str,
-    diff_summary: str,
-    dep: Optional[Dict[str, Any]],
-    dep_state: str,
-    health: Optional[List[Tuple[str, int, float]]],
-) -> None:
-    ts = datetime.now(timezone.utc).isoformat()
-    lines: List[str] = []
-    lines.append(f"Timestamp: {ts}")
-    lines.append(f"Actor: {actor_name} <{actor_email}>")
-    lines.append(f"Branch: {branch}")
-    lines.append(f"Commit: {commit_sha}")
-    lines.append(f"Title: {commit_title}")
-    lines.append("")
-    if diff_summary:
-        lines.append("Diff summary:")
-        lines.append(diff_summary.strip())
-        lines.append("")
-    lines.append("Deployment:")
-    if dep:
-        dep_id = dep.get("uid") or dep.get("id") or "unknown"
-        dep_url = dep.get("url") or ""
-        dep_target = dep.get("target") or dep.get("deploymentTarget") or ""
-        created = dep.get("createdAt")
-        inspect = dep.get("inspectorUrl") or dep.get("inspectUrl") or ""
-        lines.append(f"  id: {dep_id}")
-        lines.append(f"  url: {dep_url}")
-        lines.append(f"  target: {dep_target}")
-        lines.append(f"  state: {dep_state}")
-        lines.append(f"  createdAt: {created}")
-        if inspect:
-            lines.append(f"  buildLogs: {inspect}")
-    else:
-        lines.append(f"  state: {dep_state}")
-    lines.append("")
-    if health:
-        lines.append("Health checks:")
-        for ep, status, latency in health:
-            lines.append(f"  GET {ep} -> {status} in {latency:.2f}s")
-        lines.append("")
-    # Determine exit state summary
-    lines.append("Exit: " + ("0" if dep_state == "READY" else "1"))
+            if dep_state == "READY":
+                logger.info("🎉 Deployment completed successfully!")
+                return 0
+            elif dep_state == "SUPERSEDED":
+                logger.info("⏭️  Run superseded; the newer request deploys these changes")
+                return 0
+            elif dep_state == "NOOP":
+                if specs is not None:
+                    logger.info("✅ Nothing to deploy; no project's paths changed")
+                else:
+                    logger.info(f"✅ Nothing to deploy; {record.target} already serves this tree")
+                return 0
+            else:
+                logger.error(f"❌ Deployment failed with state: {dep_state}")
+                return 1
 
-    report_path.write_text("\n".join(lines), encoding="utf-8")
+    except DeployError as e:
+        print(f"❌ Deployment error: {e}", file=sys.stderr)
+        # Still leave a report, history line and metrics behind for CI and alerting
+        finish_failed_run(args, config, record, run_start, "TIMEOUT: BUDGET" if BUDGET.exhausted_at else e.status.value)
+        return 1
+    except KeyboardInterrupt:
+        print("🛑 Deployment interrupted by user", file=sys.stderr)
+        finish_failed_run(args, config, record, run_start, "INTERRUPTED")
+        return 130
+    except Exception as e:
+        print(f"💥 Unexpected error: {e}", file=sys.stderr)
+        finish_failed_run(args, config, record, run_start, DeployStatus.ERROR.value)
+        return 1
+    finally:
+        if queue is not None:
+            queue.release()
 
 
-def get_diff_summary() -> str:
-    # Try HEAD~1..HEAD; if first commit, skip
-    count_res = Shell.run_no_check(["git", "rev-list", "--count", "HEAD"])
+
+def run_with_cassette(pipeline: Callable[[argparse.Namespace, DeployConfig], int], args: argparse.Namespace, config: DeployConfig) -> int:
+    """Run the pipeline while recording to / replaying from a cassette"""
+    global CASSETTE
+    if args.replay:
+        CASSETTE = Cassette(args.replay, "replay", speed=args.replay_speed)
+        CASSETTE.apply_env()
+    else:
+        CASSETTE = Cassette(args.record, "record")
+    start = time.perf_counter()
     try:
-        cnt = int(count_res.stdout.strip())
-    except Exception:
-        cnt = 0
-    if cnt <= 1:
-        return "(first commit or no prior commit)"
-    res = Shell.run_no_check(["git", "--no-pager", "diff", "--shortstat", "HEAD~1..HEAD"])
-    return res.stdout.strip()
+        if args.profile:
+            return run_profiled(pipeline, args, config, top_n=args.profile_top)
+        return pipeline(args, config)
+    finally:
+        cassette, CASSETTE = CASSETTE, None
+        elapsed = time.perf_counter() - start
+        if cassette.replaying:
+            print(f"▶️  Replayed {cassette.served} interaction(s) from {cassette.path} in {elapsed:.2f}s "
+                  f"(simulated {cassette.clock:.1f}s)")
+        else:
+            cassette.save()
+            print(f"⏺️  Recorded {len(cassette.interactions)} interaction(s) to {cassette.path}")
+
+
+def time_budget_secs(minutes: Optional[float]) -> Optional[float]:
+    """--time-budget, falling back to $DEPLOY_TIME_BUDGET (minutes)"""
+    if minutes is None:
+        env = os.environ.get("DEPLOY_TIME_BUDGET")
+        minutes = float(env) if env else None
+    return minutes * 60 if minutes and minutes > 0 else None
+
+
+SUBCOMMANDS: Dict[str, Callable[[List[str]], int]] = {
+    "stats": stats_main,
+    "projects": projects_main,
+    "prepare": prepare_main,
+}
 
 
 def main(argv: Optional[List[str]] = None) -> int:
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if argv and argv[0] in SUBCOMMANDS:
+        return SUBCOMMANDS[argv[0]](argv[1:])
+
     parser = argparse.ArgumentParser(description="Enhanced Push and Deploy to Vercel with Repository Management")
     parser.add_argument("--branch", default="main", help="Target branch to push/deploy (default: main)")
     parser.add_argument("-m", "--message", default=DEFAULT_COMMIT_MESSAGE, help="Commit message (Conventional Commits)")
@@ -939,8 +5409,19 @@ def main(argv: Optional[List[str]] = None) -> int:
     parser.add_argument("--source-branch", help="Source branch for creating new branches")
     parser.add_argument("--create-branch", action="store_true", help="Create branch if it doesn't exist")
     parser.add_argument("--no-switch-branch", action="store_true", help="Don't switch to target branch")
+    parser.add_argument("--worktree", action="store_true",
+                        help="Commit, build and push from a reused worktree of the target branch under "
+                             ".git/deploy-worktrees/; the primary checkout is never switched or staged")
     parser.add_argument("--no-push", action="store_true", help="Don't push to remote repository")
     parser.add_argument("--remote-name", default="origin", help="Remote repository name (default: origin)")
+    parser.add_argument("--mirror", action="append", default=[], metavar="REMOTES",
+                        help="Also push to these remotes, concurrently with --remote-name (comma-separated or repeated)")
+    parser.add_argument("--push-quorum", type=int, default=None, metavar="N",
+                        help="Remotes that must accept the push for it to count as successful (default: all)")
+    parser.add_argument("--push-timeout", type=int, default=300, metavar="SECONDS",
+                        help="Timeout per remote and push attempt (default: 300)")
+    parser.add_argument("--push-batch-mb", type=float, default=100.0, metavar="MB",
+                        help="Push histories larger than this in commit batches (default: 100, 0 = never)")
 
     # Deployment mode
     mode = parser.add_mutually_exclusive_group()
@@ -949,31 +5430,104 @@ def main(argv: Optional[List[str]] = None) -> int:
     mode.add_argument("--fallback-to-cli", action="store_true", help="Try GitHub first, fallback to CLI on failure")
 
     parser.add_argument("--preview", action="store_true", help="Deploy/poll preview target instead of production")
+    parser.add_argument("--projects", nargs="?", type=Path, const=PROJECTS_MANIFEST, default=None, metavar="MANIFEST",
+                        help="Multi-project mode: deploy only the manifest projects whose paths changed in the pushed range "
+                             "(default manifest: deploy-projects.json)")
+    parser.add_argument("--matrix", action="append", metavar="REFS",
+                        help="Preview-deploy these remote branches / PRs (comma-separated or repeated; PRs as #12 or pr/12) "
+                             "instead of pushing the working tree")
+    parser.add_argument("--matrix-parallel", type=int, default=MATRIX_PARALLEL,
+                        help=f"Maximum preview builds in flight in --matrix mode (default: {MATRIX_PARALLEL})")
     parser.add_argument("--prod", action="store_true", help="For Vercel CLI: use --prod (default if not preview)")
+    parser.add_argument("--prebuilt", action="store_true",
+                        help="Build locally with `vercel build` (persistent build cache) and upload with `vercel deploy --prebuilt`")
+    parser.add_argument("--build-cache-dir", type=Path, default=None,
+                        help="Build cache directory for --prebuilt (default: $DEPLOY_BUILD_CACHE_DIR or ~/.cache/zignals-deploy/build-cache)")
+    parser.add_argument("--build-cache-max-mb", type=int, default=BUILD_CACHE_MAX_MB,
+                        help=f"Evict least recently used build cache entries above this size (default: {BUILD_CACHE_MAX_MB})")
 
     # Enhanced error handling and retry options
     parser.add_argument("--max-retries", type=int, default=3, help="Maximum retry attempts (default: 3)")
     parser.add_argument("--retry-delay", type=int, default=5, help="Delay between retries in seconds (default: 5)")
     parser.add_argument("--health-check-timeout", type=int, default=30, help="Health check timeout in seconds (default: 30)")
+    parser.add_argument("--no-targeted-health", action="store_true",
+                        help="Probe the fixed endpoint list instead of the app/ routes changed in the pushed range")
+    parser.add_argument("--health-routes", type=Path, default=None, metavar="FILE",
+                        help="Sample params for dynamic route segments and the core endpoints (default: deploy-health.json)")
     parser.add_argument("--deployment-timeout", type=int, default=20, help="Deployment timeout in minutes (default: 20)")
     parser.add_argument("--no-rollback", action="store_true", help="Disable automatic rollback on failure")
+    parser.add_argument("--time-budget", type=float, default=None, metavar="MINUTES",
+                        help="Overall deadline for the run; timeouts, retries and polling draw from it "
+                             "(default: $DEPLOY_TIME_BUDGET or unlimited)")
+    parser.add_argument("--report-reserve", type=float, default=20.0, metavar="SECONDS",
+                        help="Part of --time-budget kept back for writing the report (default: 20)")
+
+    parser.add_argument("--force-deploy", action="store_true",
+                        help="Deploy even if the deployable tree is unchanged since the last READY deployment")
+
+    # Deploy queue
+    parser.add_argument("--no-queue", action="store_true", help="Do not serialize/coalesce runs through the per-branch deploy queue")
+    parser.add_argument("--cancel-superseded", action="store_true",
+                        help="Cancel in-flight Vercel deployments of older commits on the branch")
 
     # Utility options
     parser.add_argument("--skip-push", action="store_true", help="Skip git push (advanced)")
+    parser.add_argument("--skip-preflight", action="store_true",
+                        help="Skip the pre-flight checks (env, Vercel token, remote, CLIs)")
     parser.add_argument("--dry-run", action="store_true", help="Do not push/deploy; print actions only")
+    parser.add_argument("--watch", action="store_true",
+                        help="Watch the include paths, keep staging, tree hash and pre-flight current, and deploy on Enter/SIGUSR1")
+    parser.add_argument("--watch-interval", type=float, default=WATCH_INTERVAL_SECS, metavar="SECONDS",
+                        help=f"Polling interval for --watch (default: {WATCH_INTERVAL_SECS:g})")
+    parser.add_argument("--watch-debounce", type=float, default=WATCH_DEBOUNCE_SECS, metavar="SECONDS",
+                        help=f"Quiet period before --watch restages changed files (default: {WATCH_DEBOUNCE_SECS:g})")
     parser.add_argument("--verbose", action="store_true", help="Enable verbose logging")
     parser.add_argument("--list-remotes", action="store_true", help="List available remote repositories and exit")
     parser.add_argument("--list-branches", action="store_true", help="List available branches and exit")
+    parser.add_argument("--metrics-file", type=Path, default=METRICS_FILE,
+                        help="Prometheus textfile to update after the run (default: $DEPLOY_METRICS_FILE or reports/deploy_metrics.prom)")
+    parser.add_argument("--no-metrics", action="store_true", help="Do not write the Prometheus metrics file")
+    parser.add_argument("--profile", action="store_true",
+                        help="Run under cProfile and tracemalloc with per-command subprocess accounting")
+    parser.add_argument("--profile-top", type=int, default=15, help="Rows in the --profile summary tables (default: 15)")
+
+    # Record / replay
+    cassette = parser.add_mutually_exclusive_group()
+    cassette.add_argument("--record", type=Path, metavar="CASSETTE",
+                          help="Record every command, Vercel API request and health probe (with timing) to a cassette file")
+    cassette.add_argument("--replay", type=Path, metavar="CASSETTE",
+                          help="Serve commands and HTTP exchanges from a recorded cassette instead of running them")
+    parser.add_argument("--replay-speed", type=float, default=1.0, metavar="FACTOR",
+                        help="Time compression for --replay (e.g. 1000; 0 = no waiting; default: 1 = recorded timing)")
+
+    # Resident daemon
+    parser.add_argument("--daemon", action="store_true", help="Run as a resident deploy daemon on a Unix socket")
+    parser.add_argument("--via-daemon", action="store_true", help="Send this request to the running deploy daemon")
+    parser.add_argument("--daemon-ping", action="store_true", help="Check that the deploy daemon is up and show its warm state")
+    parser.add_argument("--daemon-stop", action="store_true", help="Ask the deploy daemon to shut down")
+    parser.add_argument("--daemon-socket", type=Path, default=DAEMON_SOCKET,
+                        help="Daemon socket path (default: $DEPLOY_DAEMON_SOCKET or .git/push_and_deploy.sock)")
 
     args = parser.parse_args(argv)
 
+    if SERVING_DAEMON_REQUEST and (args.daemon or args.watch or args.via_daemon):
+        parser.error("--daemon, --watch and --via-daemon keep a process resident; they cannot run as a daemon request")
+    if args.via_daemon and (args.daemon or args.watch):
+        parser.error("--via-daemon runs a single request; it cannot be combined with --daemon or --watch")
+    if args.daemon:
+        return serve_daemon(args.daemon_socket)
+    if args.daemon_ping or args.daemon_stop:
+        return daemon_client([], args.daemon_socket, op="ping" if args.daemon_ping else "stop")
+    if args.via_daemon:
+        return daemon_client(_strip_daemon_flags(argv), args.daemon_socket)
+
     # Create enhanced configuration
     config = DeployConfig(
         max_retries=args.max_retries,
         retry_delay=args.retry_delay,
         health_check_timeout=args.health_check_timeout,
         deployment_timeout=args.deployment_timeout,
-        fallback_to_cli=args.fallback_to_cli or args.vercel_cli,
+        fallback_to_cli=args.fallback_to_cli or args.vercel_cli or args.prebuilt,
         enable_rollback=not args.no_rollback,
         verbose_logging=args.verbose,
         target_repo=args.target_repo,
@@ -981,8 +5535,25 @@ def main(argv: Optional[List[str]] = None) -> int:
         source_branch=args.source_branch,
         create_branch=args.create_branch,
         switch_branch=not args.no_switch_branch,
+        use_worktree=args.worktree,
         push_to_remote=not args.no_push,
-        remote_name=args.remote_name
+        remote_name=args.remote_name,
+        mirror_remotes=[r.strip() for value in args.mirror for r in value.split(",") if r.strip()],
+        push_quorum=args.push_quorum,
+        push_timeout_secs=args.push_timeout,
+        push_batch_mb=args.push_batch_mb,
+        preview=args.preview,
+        projects_manifest=args.projects,
+        time_budget_secs=time_budget_secs(args.time_budget),
+        report_reserve_secs=args.report_reserve,
+        use_queue=not args.no_queue,
+        cancel_superseded=args.cancel_superseded,
+        skip_unchanged=not args.force_deploy,
+        targeted_health=not args.no_targeted_health,
+        health_routes_file=args.health_routes,
+        prebuilt=args.prebuilt,
+        build_cache_dir=args.build_cache_dir,
+        build_cache_max_mb=args.build_cache_max_mb,
     )
 
     # Handle utility commands
@@ -1005,110 +5576,17 @@ def main(argv: Optional[List[str]] = None) -> int:
             print(f"    {branch}")
         return 0
 
-    # Enhanced deployment with context management
-    try:
-        with deployment_context(config) as logger:
-            ensure_git_repo()
-
-            if is_rebase_in_progress(REPO_ROOT):
-                raise GitError("Rebase in progress detected. Please resolve and run again.", retryable=False)
-
-            # Setup repository and branch
-            original_sha = setup_repository_and_branch(config)
-            logger.info(f"Repository setup complete. Original SHA: {original_sha}")
-
-            # Stage/commit with enhanced error handling
-            if args.dry_run:
-                logger.info("[DRY RUN] Would stage included paths:")
-                for p in INCLUDE_PATHS:
-                    logger.info(f"  - {p}")
-            else:
-                git_add_includes(config)
-
-            sha_before = Shell.run(["git", "rev-parse", "HEAD"]).stdout.strip()
-
-            if args.dry_run:
-                logger.info(f"[DRY RUN] Would commit with message:\n{args.message}")
-            else:
-                new_sha = git_commit(args.message, config)
-                if new_sha:
-                    logger.info(f"Committed {new_sha}")
-                else:
-                    logger.info("No changes to commit. Proceeding with push.")
-
-            # Push with enhanced error handling
-            if not args.skip_push and config.push_to_remote:
-                if args.dry_run:
-                    logger.info(f"[DRY RUN] Would push to {config.remote_name} {config.target_branch}")
-                else:
-                    git_push(config.target_branch, config)
-            else:
-                logger.info("Skipping push per configuration")
-
-            # Deploy with fallback mechanism
-            dep: Optional[Dict[str, Any]] = None
-            dep_state: str = "SKIPPED"
-            health: Optional[List[Tuple[str, int, float]]] = None
-
-            if not args.dry_run:
-                dep, dep_state = deploy_with_fallback(config, logger)
-                
-                if dep and dep_state == "READY":
-                    url = dep.get("url")
-                    if url:
-                        logger.info(f"Deployment successful: {url}")
-                        health = perform_health_checks(url, config)
-                    else:
-                        logger.warning("Deployment successful but no URL found")
-                else:
-                    logger.error(f"Deployment failed: {dep_state}")
-                    if config.enable_rollback and original_sha:
-                        logger.info("Attempting rollback...")
-                        git_rollback(original_sha, config)
-            else:
-                dep_state = "DRY_RUN"
-                logger.info("[DRY RUN] Deployment skipped")
-
-            # Collect report data
-            actor_name, actor_email = get_actor()
-            commit_sha, commit_title = get_commit_sha_and_title()
-            diff_summary = get_diff_summary()
-
-            REPORTS_DIR.mkdir(parents=True, exist_ok=True)
-            ts_slug = datetime.now().strftime("%Y%m%d_%H%M%S")
-            report_path = REPORTS_DIR / f"deploy_{ts_slug}.txt"
-            write_report(
-                report_path,
-                actor_name,
-                actor_email,
-                config.target_branch,
-                commit_sha,
-                commit_title,
-                diff_summary,
-                dep,
-                dep_state,
-                health,
-            )
-
-            logger.info(f"Report written to {report_path}")
-            
-            if dep_state == "READY":
-                logger.info("🎉 Deployment completed successfully!")
-                return 0
-            else:
-                logger.error(f"❌ Deployment failed with state: {dep_state}")
-                return 1
-
-    except DeployError as e:
-        print(f"❌ Deployment error: {e}", file=sys.stderr)
-        return 1
-    except KeyboardInterrupt:
-        print("🛑 Deployment interrupted by user", file=sys.stderr)
-        return 130
-    except Exception as e:
-        print(f"💥 Unexpected error: {e}", file=sys.stderr)
-        return 1
+    if args.watch:
+        if args.matrix:
+            parser.error("--watch cannot be combined with --matrix")
+        return DeployWatcher(args, config, interval=args.watch_interval, debounce=args.watch_debounce).run()
 
+    pipeline = run_matrix if args.matrix else run_deploy
+    if args.record or args.replay:
+        return run_with_cassette(pipeline, args, config)
+    if args.profile:
+        return run_profiled(pipeline, args, config, top_n=args.profile_top)
+    return pipeline(args, config)
 
 if __name__ == "__main__":
     sys.exit(main())
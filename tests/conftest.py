@@ -0,0 +1,31 @@
+"""Shared setup for the Python tests of the deploy tooling.
+
+push_to_github.py lives at the repository root, push_and_deploy.py and its
+benchmark harness under scripts/; neither is a package, so both directories
+are put on sys.path.
+"""
+
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+for path in (REPO_ROOT, REPO_ROOT / "scripts"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+
+def git(*args: str, cwd: Path) -> str:
+    return subprocess.run(["git", *args], cwd=str(cwd), check=True, capture_output=True, text=True).stdout
+
+
+@pytest.fixture
+def repo(tmp_path: Path) -> Path:
+    """Empty repository on branch main with a committer configured"""
+    path = tmp_path / "repo"
+    git("init", "-q", "-b", "main", str(path), cwd=tmp_path)
+    for key, value in (("user.name", "Test"), ("user.email", "test@example.invalid"), ("commit.gpgsign", "false")):
+        git("config", key, value, cwd=path)
+    return path
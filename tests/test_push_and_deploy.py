@@ -0,0 +1,239 @@
+"""Tests for scripts/push_and_deploy.py.
+
+The pure helpers (P2Quantile, route_url, PromMetrics) are tested directly.
+The pipeline tests reuse the benchmark harness's stand-ins (bare remote,
+fake Vercel API, stub CLI): a run is recorded to a cassette against them,
+then the cassette is replayed, which must reach the same outcome without a
+single call to the API (a push would show up there too, through the
+remote's post-receive hook).
+"""
+
+import json
+import os
+import random
+import sys
+from pathlib import Path
+from typing import List
+
+import pytest
+
+import bench_push_and_deploy as bench
+import push_and_deploy as pad
+from push_and_deploy import P2Quantile, PromMetrics, route_url
+
+
+# ---------------- P2Quantile ----------------
+
+def test_p2_quantile_is_exact_for_the_first_samples():
+    median, p95 = P2Quantile(0.5), P2Quantile(0.95)
+    assert median.value() is None
+    for x in (5, 1, 4, 2, 3):
+        median.add(x)
+        p95.add(x)
+    assert (median.value(), p95.value()) == (3, 5)
+
+
+@pytest.mark.parametrize("q", [0.5, 0.95])
+def test_p2_quantile_tracks_a_large_stream(q):
+    rng = random.Random(7)
+    samples = [rng.uniform(0, 100) for _ in range(5000)]
+    estimate = P2Quantile(q)
+    for x in samples:
+        estimate.add(x)
+    exact = sorted(samples)[int(q * (len(samples) - 1))]
+    assert estimate.count == len(samples)
+    assert estimate.value() == pytest.approx(exact, abs=2.0)
+
+
+def test_p2_quantile_handles_skewed_durations():
+    # Mostly fast builds with a slow tail, as in a real deploy history
+    samples = [30.0 + i % 7 for i in range(950)] + [600.0 + i for i in range(50)]
+    random.Random(3).shuffle(samples)
+    median, p95 = P2Quantile(0.5), P2Quantile(0.95)
+    for x in samples:
+        median.add(x)
+        p95.add(x)
+    assert 30 <= median.value() <= 37
+    assert 36 <= p95.value() <= 650
+
+
+# ---------------- route_url ----------------
+
+@pytest.mark.parametrize("segments, params, expected", [
+    ([], {}, ("/", "")),
+    (["admin", "dashboard"], {}, ("/admin/dashboard", "")),
+    (["(dashboard)", "wallet"], {}, ("/wallet", "")),
+    (["dashboard", "@modal", "settings"], {}, ("/dashboard/settings", "")),
+    (["signals", "[id]"], {"id": "demo"}, ("/signals/demo", "")),
+    (["docs", "[...slug]"], {"slug": "a/b c"}, ("/docs/a/b%20c", "")),
+    (["shop", "[[...filters]]"], {}, ("/shop", "")),
+    (["shop", "[[...filters]]"], {"filters": "new"}, ("/shop/new", "")),
+    (["shop", "[[...filters]]"], {"filters": ""}, ("/shop", "")),
+    (["signals", "[id]"], {}, (None, "no sample value for [id]")),
+    (["feed", "(..)photo", "[id]"], {"id": "1"}, (None, "intercepting route (..)photo")),
+])
+def test_route_url(segments, params, expected):
+    assert route_url(segments, params) == expected
+
+
+# ---------------- PromMetrics ----------------
+
+def sample_registry() -> PromMetrics:
+    registry = PromMetrics()
+    registry.declare("runs_total", "counter", "Runs")
+    registry.declare("last_run", "gauge", "Last run")
+    registry.declare("duration_seconds", "histogram", "Duration", (1, 5, 10))
+    registry.inc("runs_total", {"branch": "main", "state": "READY"})
+    registry.inc("runs_total", {"branch": 'fe"at\\x\nure', "state": "ERROR"}, 2)
+    registry.set("last_run", {"branch": "main"}, 1760000000.5)
+    for value in (0.5, 3, 7.25, 42):
+        registry.observe("duration_seconds", value, {"branch": "main"})
+    return registry
+
+
+def test_prom_metrics_render():
+    text = sample_registry().render()
+    assert "# TYPE duration_seconds histogram" in text
+    assert 'duration_seconds_bucket{branch="main",le="5"} 2' in text
+    assert 'duration_seconds_bucket{branch="main",le="+Inf"} 4' in text
+    assert 'duration_seconds_sum{branch="main"} 52.75' in text
+    assert 'runs_total{branch="fe\\"at\\\\x\\nure",state="ERROR"} 2' in text
+    assert text.endswith("\n")
+
+
+def test_prom_metrics_round_trip(tmp_path):
+    path = tmp_path / "deploy.prom"
+    original = sample_registry()
+    path.write_text(original.render(), encoding="utf-8")
+
+    loaded = PromMetrics()
+    for name, (kind, help_text) in original.meta.items():
+        loaded.declare(name, kind, help_text, original.buckets.get(name, ()))
+    loaded.load(path)
+    assert loaded.render() == original.render()
+
+
+def test_prom_metrics_load_accumulates_counters_and_histograms(tmp_path):
+    path = tmp_path / "deploy.prom"
+    path.write_text(sample_registry().render(), encoding="utf-8")
+
+    merged = sample_registry()
+    merged.set("last_run", {"branch": "main"}, 1)
+    merged.load(path)
+    assert merged.counters["runs_total"][(("branch", "main"), ("state", "READY"))] == 2
+    # Gauges take the stored value rather than adding to it
+    assert merged.gauges["last_run"][(("branch", "main"),)] == 1760000000.5
+    h = merged.histograms["duration_seconds"][(("branch", "main"),)]
+    assert (h["buckets"], h["sum"], h["count"]) == ([2, 4, 6], 105.5, 8)
+
+
+def test_prom_metrics_load_ignores_undeclared_series(tmp_path):
+    path = tmp_path / "deploy.prom"
+    path.write_text("# TYPE other_total counter\nother_total 3\ngarbage line\n", encoding="utf-8")
+    registry = PromMetrics()
+    registry.load(path)
+    registry.load(tmp_path / "missing.prom")
+    assert registry.render() == "\n"
+
+
+# ---------------- Record and replay ----------------
+
+SETTINGS = dict(build_secs=0.3, local_build_secs=0.0, poll_secs=0.1, retry_delay=0)
+RUN_ARGS = ["-m", "feat: replay test", "--retry-delay", "0", "--max-retries", "1", "--no-metrics"]
+
+
+class Stand:
+    """Bare remote, checkout, fake Vercel API and stub CLI of one pipeline test"""
+
+    def __init__(self, base: Path, failure_rate: float):
+        self.settings = bench.BenchSettings(failure_rate=failure_rate, **SETTINGS)
+        self.api = bench.FakeVercel(self.settings)
+        self.api.start()
+        self.bin_dir = base / "bin"
+        self.bin_dir.mkdir()
+        bench._write_executable(self.bin_dir / "vercel", bench.STUB_VERCEL.format(
+            python=sys.executable, api=self.api.url, local_build_secs=self.settings.local_build_secs))
+        self.ws = bench.make_workspace(base, 20, bench.DEFAULT_SCRIPT, self.api.url, self.settings)
+        self.runs = 0
+
+    @property
+    def reports(self) -> Path:
+        return self.ws.checkout / "reports"
+
+    def run(self, argv: List[str]) -> int:
+        """main() of a fresh copy of the script, in the checkout"""
+        self.runs += 1
+        module = bench.load_script(self.ws.script, f"test_{self.runs}")
+        cwd = os.getcwd()
+        os.chdir(self.ws.checkout)
+        try:
+            try:
+                return module.main(argv)
+            except SystemExit as e:
+                return e.code if isinstance(e.code, int) else 1
+        finally:
+            os.chdir(cwd)
+            module.HTTP_POOL.close()
+            sys.modules.pop(module.__name__, None)
+
+    def take_report(self) -> pad.DeployRecord:
+        """Parse and remove the run's text report, so the next run's report is unambiguous"""
+        (path,) = self.reports.glob("deploy_*.txt")
+        record = pad.parse_text_report(path)
+        path.unlink()
+        assert record is not None
+        return record
+
+    def history(self) -> List[dict]:
+        path = self.reports / "deploy_history.jsonl"
+        return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()] if path.exists() else []
+
+
+@pytest.fixture
+def stand(tmp_path, request):
+    stand = Stand(tmp_path, getattr(request, "param", 0.0))
+    try:
+        with bench.bench_environ(stand.api, stand.bin_dir, stand.settings):
+            yield stand
+    finally:
+        stand.api.stop()
+
+
+@pytest.mark.parametrize("stand, mode, state, exit_code", [
+    (0.0, "github", "READY", 0),
+    (0.0, "cli", "READY", 0),
+    (1.0, "github", "ERROR", 1),
+    (1.0, "cli", "CLI_ERROR", 1),
+], indirect=["stand"])
+def test_replay_reproduces_recorded_run(stand, tmp_path, mode, state, exit_code):
+    cassette = tmp_path / "run.cassette.json"
+    bench.mutate_checkout(stand.ws, 1, stand.settings, random.Random(1))
+    argv = RUN_ARGS + bench.MODES[mode]
+
+    assert stand.run(argv + ["--record", str(cassette)]) == exit_code
+    recorded = stand.take_report()
+    assert recorded.state == state
+    assert [h["state"] for h in stand.history()] == [state]
+    remote_head = bench.subprocess.run(["git", "rev-parse", "main"], cwd=str(stand.ws.remote),
+                                       capture_output=True, text=True).stdout
+    assert remote_head.strip() == recorded.commit_sha
+    assert stand.api.take_calls()
+
+    assert stand.run(argv + ["--replay", str(cassette), "--replay-speed", "0"]) == exit_code
+    replayed = stand.take_report()
+    assert (replayed.state, replayed.commit_sha, replayed.deployment_id) == \
+        (recorded.state, recorded.commit_sha, recorded.deployment_id)
+    assert not stand.api.take_calls()
+    assert len(stand.history()) == 1  # replays do not write the history
+
+
+def test_replay_fails_on_runs_the_cassette_does_not_cover(stand, tmp_path):
+    cassette = tmp_path / "run.cassette.json"
+    bench.mutate_checkout(stand.ws, 1, stand.settings, random.Random(1))
+    assert stand.run(RUN_ARGS + bench.MODES["github"] + ["--record", str(cassette)]) == 0
+    stand.take_report()
+    stand.api.take_calls()
+
+    # A CLI deploy was never recorded, so the replay must not invent one
+    assert stand.run(RUN_ARGS + bench.MODES["cli"] + ["--replay", str(cassette), "--replay-speed", "0"]) != 0
+    assert not stand.api.take_calls()
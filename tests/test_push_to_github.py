@@ -0,0 +1,183 @@
+"""Unit tests for the pure helpers of push_to_github.py: porcelain parsing,
+the staging policy and the push progress meter."""
+
+import io
+from pathlib import Path
+
+import pytest
+
+from conftest import git
+from push_to_github import PROGRESS_LINE, FileChange, PushProgress, RepoState, StagingPolicy, glob_match
+
+
+def porcelain(repo: Path) -> str:
+    return git("status", "--porcelain=v2", "--branch", "-z", cwd=repo)
+
+
+# ---------------- RepoState.parse ----------------
+
+def test_parse_before_first_commit(repo):
+    (repo / "new.txt").write_text("x\n")
+    state = RepoState.parse(porcelain(repo))
+    assert state.is_repo
+    assert state.branch == "main"
+    assert state.head is None
+    assert state.upstream is None
+    assert state.untracked == 1
+    assert [(c.path, c.xy) for c in state.changes] == [("new.txt", "??")]
+    assert state.changes[0].untracked and not state.changes[0].staged
+    assert state.dirty
+
+
+def test_parse_counts_staged_unstaged_and_renames(repo):
+    for name in ("a.txt", "b.txt", "old name.txt"):
+        (repo / name).write_text(f"{name}\n")
+    git("add", "-A", cwd=repo)
+    git("commit", "-q", "-m", "init", cwd=repo)
+    head = git("rev-parse", "HEAD", cwd=repo).strip()
+
+    (repo / "a.txt").write_text("staged\n")
+    git("add", "a.txt", cwd=repo)
+    (repo / "b.txt").write_text("unstaged\n")
+    git("mv", "old name.txt", "new name.txt", cwd=repo)
+    (repo / "c.txt").write_text("untracked\n")
+
+    state = RepoState.parse(porcelain(repo))
+    assert state.head == head
+    assert (state.staged, state.unstaged, state.untracked, state.conflicted) == (2, 1, 1, 0)
+    changes = {c.path: c.xy for c in state.changes}
+    # The rename's original path is a separate NUL record and must not show up as a change
+    assert changes == {"a.txt": "M.", "b.txt": ".M", "new name.txt": "R.", "c.txt": "??"}
+
+
+def test_parse_tracking_and_detached_head():
+    oid = "0123456789abcdef0123456789abcdef01234567"
+    text = "\0".join([f"# branch.oid {oid}", "# branch.head main", "# branch.upstream origin/main",
+                      "# branch.ab +3 -2", ""])
+    state = RepoState.parse(text)
+    assert (state.branch, state.upstream, state.ahead, state.behind) == ("main", "origin/main", 3, 2)
+    assert not state.dirty
+    assert "3 ahead, 2 behind" in state.summary()
+
+    detached = RepoState.parse(f"# branch.oid {oid}\0# branch.head (detached)\0")
+    assert detached.branch is None
+    assert "(detached HEAD)" in detached.summary()
+
+
+def test_parse_counts_conflicts(repo):
+    (repo / "f.txt").write_text("base\n")
+    git("add", "f.txt", cwd=repo)
+    git("commit", "-q", "-m", "base", cwd=repo)
+    git("checkout", "-q", "-b", "other", cwd=repo)
+    (repo / "f.txt").write_text("other\n")
+    git("commit", "-q", "-am", "other", cwd=repo)
+    git("checkout", "-q", "main", cwd=repo)
+    (repo / "f.txt").write_text("main\n")
+    git("commit", "-q", "-am", "main", cwd=repo)
+    with pytest.raises(Exception):
+        git("merge", "-q", "other", cwd=repo)
+
+    state = RepoState.parse(porcelain(repo))
+    assert state.conflicted == 1
+    assert state.dirty
+
+
+# ---------------- StagingPolicy.evaluate ----------------
+
+def test_glob_match():
+    assert glob_match("uploads/avatar.png", "uploads/")
+    assert glob_match("apps/web/node_modules/x.js", "node_modules/")
+    assert not glob_match("my-uploads/a.txt", "uploads/")
+    assert glob_match("logs/server.log", "*.log")
+    assert glob_match("public/img/a.png", "public/*/*.png")
+    assert not glob_match("src/public/img/a.png", "public/*/*.png")
+
+
+def test_evaluate_holds_denied_and_binary_files(tmp_path):
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "app.ts").write_text("export {}\n")
+    (tmp_path / "dump.rdb").write_bytes(b"REDIS\0")
+    (tmp_path / "blob.bin").write_bytes(b"\0\1\2")
+    (tmp_path / "logo.png").write_bytes(b"\x89PNG\0")
+    changes = [FileChange(p, "??") for p in ("src/app.ts", "dump.rdb", "blob.bin", "logo.png")]
+
+    plan = StagingPolicy().evaluate(changes, tmp_path)
+    assert [c.path for c in plan.stage] == ["src/app.ts", "logo.png"]
+    assert {c.path: why for c, why in plan.held} == {"dump.rdb": "denied by 'dump.rdb'", "blob.bin": "binary file"}
+    assert plan.stage_bytes == len("export {}\n") + len(b"\x89PNG\0")
+
+
+def test_evaluate_stages_deletions_and_submodules_unchecked(tmp_path):
+    changes = [FileChange("gone.log", ".D"), FileChange("vendor/lib", ".M", submodule=True)]
+    plan = StagingPolicy().evaluate(changes, tmp_path)
+    assert plan.stage == changes
+    assert not plan.held
+
+
+@pytest.mark.parametrize("oversize, staged, lfs, held", [
+    ("refuse", [], [], ["big.txt"]),
+    ("skip", [], [], ["big.txt"]),
+    ("lfs", [], ["big.txt"], []),
+])
+def test_evaluate_oversized_files(tmp_path, oversize, staged, lfs, held):
+    (tmp_path / "big.txt").write_text("x" * 2048)
+    (tmp_path / "small.txt").write_text("x")
+    changes = [FileChange("big.txt", "??"), FileChange("small.txt", "??")]
+
+    plan = StagingPolicy(max_file_mb=1 / 1024, oversize=oversize).evaluate(changes, tmp_path)
+    assert [c.path for c in plan.stage] == staged + ["small.txt"]
+    assert [c.path for c in plan.lfs] == lfs
+    assert [c.path for c, _ in plan.held] == held
+    assert [(c.path, size) for c, size in plan.oversized] == [("big.txt", 2048)]
+
+
+def test_policy_file_replaces_defaults(tmp_path):
+    path = tmp_path / "push-policy.json"
+    path.write_text('{"max_file_mb": 25, "deny": ["*.log"], "oversize": "skip", "comment": "ignored"}')
+    policy = StagingPolicy.load(path)
+    assert (policy.max_file_mb, policy.deny, policy.oversize) == (25, ["*.log"], "skip")
+
+    path.write_text('{"oversize": "delete"}')
+    with pytest.raises(ValueError, match="oversize must be one of"):
+        StagingPolicy.load(path)
+
+
+# ---------------- Push progress ----------------
+
+@pytest.mark.parametrize("line, expected", [
+    ("Counting objects: 100% (7/7), done.", ("Counting objects", "100", "7", "7", None, None)),
+    ("Compressing objects:  50% (1/2)", ("Compressing objects", "50", "1", "2", None, None)),
+    ("Writing objects:  45% (450/1000), 12.00 MiB | 3.00 MiB/s",
+     ("Writing objects", "45", "450", "1000", "12.00", "3.00")),
+    ("Writing objects: 100% (4/4), 312 bytes | 312.00 KiB/s, done.",
+     ("Writing objects", "100", "4", "4", "312", "312.00")),
+])
+def test_progress_line_matches_git_meters(line, expected):
+    match = PROGRESS_LINE.match(line)
+    assert match is not None
+    assert (match["phase"], match["pct"], match["done"], match["total"], match["size"], match["rate"]) == expected
+
+
+@pytest.mark.parametrize("line", [
+    "To github.com:dagz55/zignal-login.git",
+    "remote: Resolving deltas: 100% (3/3)",
+    " ! [rejected]        main -> main (fetch first)",
+])
+def test_progress_line_ignores_other_output(line):
+    assert PROGRESS_LINE.match(line) is None
+
+
+def test_progress_consume_keeps_messages_and_tracks_transfer(capsys):
+    stream = io.BytesIO(
+        b"Enumerating objects: 5, done.\n"
+        b"Writing objects:  50% (2/4), 1.00 KiB | 1.00 MiB/s\r"
+        b"Writing objects: 100% (4/4), 2.00 KiB | 2.00 MiB/s, done.\n"
+        b"Total 4 (delta 0), reused 0 (delta 0)\n"
+        b"To /tmp/remote.git\n"
+        b"   abc1234..def5678  main -> main"
+    )
+    progress = PushProgress("origin")
+    kept = progress.consume(stream)
+    assert kept.splitlines() == ["To /tmp/remote.git", "   abc1234..def5678  main -> main"]
+    assert (progress.objects, progress.bytes, progress.peak_rate) == (4, 2048, 2 * 1024 * 1024)
+    assert "origin: Writing objects: 100% (4/4)" in capsys.readouterr().out